@@ -21,17 +21,43 @@ import re
 import shutil
 import random
 import uuid
+from functools import partial
 from pathlib import Path
 import urllib.request
 from urllib.error import URLError, HTTPError
 from typing import Any
 import configparser
-import httpx
 from src import spider, stream
 from src.proxy import ProxyDetector
+from src.cdn_score import cdn_scores, get_url_host
+from src.stream_expiry import StreamUrlRefresher
+from src.event_loop import shared_loop
+from src.hls_recorder import HlsRecorder, check_native_support
+from src.flv_writer import FlvFileStats, FlvStreamWriter
+from src.direct_downloader import DownloadStatusError, run_download
+from src.ffmpeg_supervisor import FfmpegProcess, ffmpeg_supervisor
+from src.stall_watchdog import OutputSizeProbe, stall_watchdog
+from src.fmp4 import FRAGMENTED_MOVFLAGS, finalize_fragmented_mp4
+from src.segment_manifest import (
+    SegmentInfo, add_segment_list, get_manifest_base, get_segment_list_path, list_segments, write_manifest
+)
+from src.archive_mover import archive_mover
+from src.disk_quota import DISK_CRITICAL, disk_quota
+from src.room_identity import INVALID_IDS, get_room_keys, room_registry
+from src.session_stitcher import session_stitcher, stitch_fragments
+from src.subtitle_clock import subtitle_clock, write_segment_subtitles
+from src.keyframe_index import KeyframeIndexWriter, keyframe_index, remove_keyframe_index
+from src.multi_output import (
+    AUDIO_OUTPUTS, build_extra_outputs, get_extra_output_path, get_extra_outputs, parse_output_rules,
+    probe_audio_stream
+)
+from src.postprocess_queue import (
+    DEFAULT_WORKERS, LOW_PRIORITY_FLAGS, PRIORITY_REMUX, PRIORITY_SEGMENT, PRIORITY_TRANSCODE, low_priority_command,
+    postprocess_queue
+)
 from src.utils import logger
-from src import utils
-from src.danmu import DouyinDanmaku, KuaishouDanmaku, XiaohongshuDanmaku
+from src import utils, sign_server
+from src.danmu import DouyinDanmaku, KuaishouDanmaku, XiaohongshuDanmaku, danmaku_hub, danmaku_sink
 from msg_push import (
     dingtalk, xizhi, tg_bot, send_email, bark, ntfy, pushplus
 )
@@ -66,6 +92,13 @@ not_record_list = []
 start_display_time = datetime.datetime.now()
 global_proxy = False
 recording_time_list = {}
+url_refreshers = {}
+record_extra_outputs = {}
+record_session_keys = {}
+HOT_SWAP_TIMEOUT = 30
+HOT_SWAP_MIN_RUNTIME = 60
+SUPERVISOR_WAIT_TIMEOUT = 30
+stop_events = {}
 script_path = os.path.split(os.path.realpath(sys.argv[0]))[0]
 config_file = f'{script_path}/config/config.ini'
 url_config_file = f'{script_path}/config/URL_config.ini'
@@ -126,7 +159,12 @@ def display_info() -> None:
                 for recording_live in no_repeat_recording:
                     rt, qa = recording_time_list[recording_live]
                     have_record_time = now_time - rt
-                    print(f"{recording_live}[{qa}] 正在录制中 {str(have_record_time).split('.')[0]}")
+                    stall_info = stall_watchdog.get_stats(recording_live)
+                    stall_text = f" 卡顿{stall_info['stalls']}次" if stall_info.get('stalls') else ''
+                    aliases = room_registry.get_aliases_by_name(recording_live)
+                    alias_text = f" 别名: {', '.join(sorted(aliases))}" if aliases else ''
+                    print(f"{recording_live}[{qa}] 正在录制中 {str(have_record_time).split('.')[0]}{stall_text}"
+                          f"{alias_text}")
 
                 # print('\n本软件已运行：'+str(now_time - start_display_time).split('.')[0])
                 print("x" * 60)
@@ -192,7 +230,7 @@ def segment_video(converts_file_path: str, segment_save_file_path: str, segment_
     try:
         if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
             ffmpeg_command = [
-                "ffmpeg",
+                "ffmpeg", "-y",
                 "-i", converts_file_path,
                 "-c:v", "copy",
                 "-c:a", "copy",
@@ -205,12 +243,14 @@ def segment_video(converts_file_path: str, segment_save_file_path: str, segment_
                 segment_save_file_path,
             ]
             _output = subprocess.check_output(
-                ffmpeg_command, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
+                low_priority_command(ffmpeg_command), stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                startupinfo=get_startup_info(os_type), creationflags=LOW_PRIORITY_FLAGS
             )
             if is_original_delete:
                 time.sleep(1)
                 if os.path.exists(converts_file_path):
                     os.remove(converts_file_path)
+                    remove_keyframe_index(converts_file_path)
     except subprocess.CalledProcessError as e:
         logger.error(f'Error occurred during conversion: {e}')
     except Exception as e:
@@ -223,7 +263,7 @@ def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> No
             if converts_to_h264:
                 color_obj.print_colored("正在转码为MP4格式并重新编码为h264\n", color_obj.YELLOW)
                 ffmpeg_command = [
-                    "ffmpeg", "-i", converts_file_path,
+                    "ffmpeg", "-y", "-i", converts_file_path,
                     "-c:v", "libx264",
                     "-preset", "veryfast",
                     "-crf", "23",
@@ -234,18 +274,20 @@ def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> No
             else:
                 color_obj.print_colored("正在转码为MP4格式\n", color_obj.YELLOW)
                 ffmpeg_command = [
-                    "ffmpeg", "-i", converts_file_path,
+                    "ffmpeg", "-y", "-i", converts_file_path,
                     "-c:v", "copy",
                     "-c:a", "copy",
                     "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
                 ]
             _output = subprocess.check_output(
-                ffmpeg_command, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
+                low_priority_command(ffmpeg_command), stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                startupinfo=get_startup_info(os_type), creationflags=LOW_PRIORITY_FLAGS
             )
             if is_original_delete:
                 time.sleep(1)
                 if os.path.exists(converts_file_path):
                     os.remove(converts_file_path)
+                    remove_keyframe_index(converts_file_path)
     except subprocess.CalledProcessError as e:
         logger.error(f'Error occurred during conversion: {e}')
     except Exception as e:
@@ -255,45 +297,74 @@ def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> No
 def converts_m4a(converts_file_path: str, is_original_delete: bool = True) -> None:
     try:
         if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
-            _output = subprocess.check_output([
-                "ffmpeg", "-i", converts_file_path,
-                "-n", "-vn",
+            # 重启后恢复的任务可能留有未完成的输出文件, 直接覆盖
+            _output = subprocess.check_output(low_priority_command([
+                "ffmpeg", "-y", "-i", converts_file_path,
+                "-vn",
                 "-c:a", "aac", "-bsf:a", "aac_adtstoasc", "-ab", "320k",
                 converts_file_path.rsplit('.', maxsplit=1)[0] + ".m4a",
-            ], stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type))
+            ]), stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, startupinfo=get_startup_info(os_type),
+                creationflags=LOW_PRIORITY_FLAGS)
             if is_original_delete:
                 time.sleep(1)
                 if os.path.exists(converts_file_path):
                     os.remove(converts_file_path)
+                    remove_keyframe_index(converts_file_path)
     except subprocess.CalledProcessError as e:
         logger.error(f'Error occurred during conversion: {e}')
     except Exception as e:
         logger.error(f'An unknown error occurred: {e}')
 
 
-def generate_subtitles(record_name: str, ass_filename: str, sub_format: str = 'srt') -> None:
-    index_time = 0
-    today = datetime.datetime.now()
-    re_datatime = today.strftime('%Y-%m-%d %H:%M:%S')
+postprocess_queue.register('segment_video', segment_video)
+postprocess_queue.register('converts_mp4', converts_mp4)
+postprocess_queue.register('converts_m4a', converts_m4a)
+postprocess_queue.register('finalize_mp4', finalize_fragmented_mp4)
 
-    def transform_int_to_time(seconds: int) -> str:
-        m, s = divmod(seconds, 60)
-        h, m = divmod(m, 60)
-        return f"{h:02d}:{m:02d}:{s:02d}"
 
-    while True:
-        index_time += 1
-        txt = str(index_time) + "\n" + transform_int_to_time(index_time) + ',000 --> ' + transform_int_to_time(
-            index_time + 1) + ',000' + "\n" + str(re_datatime) + "\n\n"
+def queue_converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> None:
+    priority = PRIORITY_TRANSCODE if converts_to_h264 else PRIORITY_REMUX
+    postprocess_queue.submit('converts_mp4', converts_file_path, is_original_delete, priority=priority)
+
+
+def get_output_files(output_paths: list) -> list:
+    # 分段录制的输出路径是 %03d 模板, 按分段清单展开成实际生成的文件
+    return [segment.path for output_path in output_paths for segment in list_segments(output_path)]
+
+
+def queue_finalize_mp4(output_paths: list, extra_outputs: list | None = None) -> None:
+    if not fragmented_mp4:
+        return
+    extra_paths = [get_extra_output_path(path, kind) for path in output_paths for kind in extra_outputs or ()]
+    for path in get_output_files(output_paths) + [path for path in extra_paths if os.path.exists(path)]:
+        if path.endswith('.mp4'):
+            postprocess_queue.submit('finalize_mp4', path, priority=PRIORITY_REMUX)
+
+
+def stitch_session(paths: list, convert: bool) -> None:
+    stitched_paths = stitch_fragments(paths, delete_origin_file, startupinfo=get_startup_info(os_type))
+    if convert:
+        for path in stitched_paths:
+            queue_converts_mp4(path, delete_origin_file)
 
-        with open(f"{ass_filename}.{sub_format.lower()}", 'a', encoding=text_encoding) as f:
-            f.write(txt)
 
-        if record_name not in recording:
-            return
-        time.sleep(1)
-        today = datetime.datetime.now()
-        re_datatime = today.strftime('%Y-%m-%d %H:%M:%S')
+postprocess_queue.register('stitch_session', stitch_session)
+
+
+def queue_recorded_files(record_name: str, paths: list, convert: bool, hot_swap_paths: list | None = None) -> None:
+    # 同一场直播断流后恢复录制的文件先合并, 需要转码的在合并后再转码;
+    # 热切换产生的文件与前一个文件内容重叠, 不参与合并并结束当前会话
+    if session_stitcher.add(record_session_keys.get(record_name), paths, convert, end_session=bool(hot_swap_paths)):
+        paths = []
+    if convert:
+        for path in paths + (hot_swap_paths or []):
+            queue_converts_mp4(path, delete_origin_file)
+
+
+def queue_segment_video(converts_file_path: str, segment_save_file_path: str, segment_format: str,
+                        segment_time: str, is_original_delete: bool = True) -> None:
+    postprocess_queue.submit('segment_video', converts_file_path, segment_save_file_path, segment_format,
+                             segment_time, is_original_delete, priority=PRIORITY_SEGMENT)
 
 
 def adjust_max_request() -> None:
@@ -383,111 +454,400 @@ def clear_record_info(record_name: str, record_url: str) -> None:
         color_obj.print_colored(f"[{record_name}]已经从录制列表中移除\n", color_obj.YELLOW)
 
 
+def get_stop_event(record_url: str) -> threading.Event:
+    stop_event = stop_events.get(record_url)
+    if stop_event is None or stop_event.is_set():
+        stop_event = stop_events[record_url] = threading.Event()
+    return stop_event
+
+
+def signal_stop_events() -> None:
+    comment_urls = set(url_comments)
+    for record_url, stop_event in list(stop_events.items()):
+        if exit_recording or record_url in comment_urls:
+            stop_event.set()
+
+
 def direct_download_stream(source_url: str, save_path: str, record_name: str, live_url: str, platform: str) -> bool:
+    def log_file_stats(stats: FlvFileStats) -> None:
+        logger.debug(f"FLV文件已保存: {stats.path} 时长 {stats.duration:.1f}s "
+                     f"大小 {stats.bytes / 1024 / 1024:.1f}MB 码率 {stats.bitrate / 1000:.0f}kbps")
+
+    flv_writer = FlvStreamWriter(
+        save_path,
+        split_time=float(split_time) if split_video_by_time else 0,
+        time_subtitles=create_time_file,
+        on_file_closed=log_file_stats,
+        flush_interval=record_flush_interval,
+        fsync=record_fsync,
+        index_writer_factory=KeyframeIndexWriter if keyframe_index.enabled else None,
+        subtitle_encoding=text_encoding
+    )
+    stop_event = get_stop_event(live_url)
+    if live_url in url_comments or exit_recording:
+        stop_event.set()
+    abort_event = threading.Event()
+    stall_watch = stall_watchdog.register(
+        record_name, lambda: flv_writer.total_bytes, abort_event.set,
+        expected_bitrate=lambda: flv_writer.expected_bitrate
+    )
+    archive_mover.hold(get_manifest_base(save_path))
+    session_stitcher.begin(record_session_keys.get(record_name))
     try:
-        with open(save_path, 'wb') as f:
-            client = httpx.Client(timeout=None)
-
-            headers = {}
-            header_params = get_record_headers(platform, live_url)
-            if header_params:
-                key, value = header_params.split(":", 1)
-                headers[key] = value
-
-            with client.stream('GET', source_url, headers=headers, follow_redirects=True) as response:
-                if response.status_code != 200:
-                    logger.error(f"请求直播流失败，状态码: {response.status_code}")
-                    return False
-
-                downloaded = 0
-                chunk_size = 1024 * 16
-
-                for chunk in response.iter_bytes(chunk_size):
-                    if live_url in url_comments or exit_recording:
-                        color_obj.print_colored(f"[{record_name}]录制时已被注释或请求停止,下载中断", color_obj.YELLOW)
-                        clear_record_info(record_name, live_url)
-                        return False
-
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                print()
-                return True
+        download_success = run_download(
+            source_url, flv_writer.feed, get_record_header_dict(platform, live_url), stop_event=stop_event,
+            abort_event=abort_event
+        )
+        if stop_event.is_set():
+            if live_url in url_comments or exit_recording:
+                color_obj.print_colored(f"[{record_name}]录制时已被注释,下载中断", color_obj.YELLOW)
+                clear_record_info(record_name, live_url)
+                return False
+            # 被磁盘配额停止的录制按正常结束处理, 本条线程继续检测直播状态
+            color_obj.print_colored(f"[{record_name}]磁盘空间不足,录制已被请求停止", color_obj.YELLOW)
+            return bool(flv_writer.files)
+        if abort_event.is_set():
+            url_refresher = url_refreshers.get(record_name)
+            if url_refresher and url_refresher.failover_now():
+                url_refresher.switched = True
+                color_obj.print_colored(f"[{record_name}]录制卡顿,已重新获取地址继续录制", color_obj.YELLOW)
+            return bool(flv_writer.files)
+        print()
+        return download_success
+    except DownloadStatusError as e:
+        logger.error(str(e))
+        return False
     except Exception as e:
         logger.error(f"FLV下载错误: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
         return False
-
-
-def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, save_type: str,
-                     script_command: str | None = None) -> bool:
-    save_file_path = ffmpeg_command[-1]
-    process = subprocess.Popen(
-        ffmpeg_command, stdin=subprocess.PIPE, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
+    finally:
+        stall_watchdog.unregister(stall_watch)
+        flv_writer.close()
+        if stop_events.get(live_url) is stop_event:
+            stop_events.pop(live_url, None)
+        if flv_writer.split_ms:
+            segments = []
+            start = 0.0
+            for index, stats in enumerate(flv_writer.files):
+                segments.append(SegmentInfo(stats.path, index, start, start + stats.duration, stats.bytes))
+                start += stats.duration
+            write_manifest(save_path, segments)
+        else:
+            queue_recorded_files(record_name, [stats.path for stats in flv_writer.files], convert=False)
+        archive_mover.release(get_manifest_base(save_path))
+
+
+def hls_download_stream(record_name: str, record_url: str, source_url: str, save_path: str, platform: str,
+                        proxy_address: str | None = None, script_command: str | None = None) -> bool:
+    record_start = time.time()
+    subtitle_track = None
+    if create_time_file and not split_video_by_time:
+        subtitle_track = subtitle_clock.start(f"{save_path.rsplit('.', maxsplit=1)[0]}.srt", encoding=text_encoding)
+
+    stop_event = get_stop_event(record_url)
+    url_refresher = url_refreshers.get(record_name)
+    archive_mover.hold(get_manifest_base(save_path))
+    session_stitcher.begin(record_session_keys.get(record_name))
+
+    switched_urls = []
+
+    def failover_source() -> str | None:
+        # 就绪回调已切换播放列表并按新地址重新计时(会清空 port_info), 这里只需返回切换到的地址
+        switched_urls.clear()
+        if url_refresher.failover_now() and switched_urls:
+            return switched_urls[-1]
+        return None
+
+    def switch_source(_port_info: dict) -> None:
+        # 内置下载器按媒体序号去重, 直接切换播放列表地址即可无缝衔接
+        new_source_url = url_refresher.get_source_url()
+        if new_source_url:
+            switched_urls.append(new_source_url)
+            color_obj.print_colored(f"[{record_name}]直播流地址已刷新,无缝切换到新地址继续录制", color_obj.YELLOW)
+            recorder.switch_source(new_source_url)
+            url_refresher.rearm(new_source_url)
+
+    recorder = HlsRecorder(
+        source_url, save_path, headers=get_record_header_dict(platform, record_url), proxy_addr=proxy_address,
+        split_time=float(split_time) if split_video_by_time else 0,
+        should_stop=lambda: stop_event.is_set() or record_url in url_comments or exit_recording,
+        failover=failover_source if url_refresher else None,
+        index_writer_factory=KeyframeIndexWriter if keyframe_index.enabled else None
     )
 
-    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
-    subs_thread_name = f'subs_{Path(subs_file_path).name}'
-    if create_time_file and not split_video_by_time and '音频' not in save_type:
-        create_var[subs_thread_name] = threading.Thread(
-            target=generate_subtitles, args=(record_name, subs_file_path)
-        )
-        create_var[subs_thread_name].daemon = True
-        create_var[subs_thread_name].start()
+    def on_stall() -> None:
+        new_source_url = failover_source() if url_refresher else None
+        if new_source_url:
+            recorder.switch_source(new_source_url)
 
-    while process.poll() is None:
-        if record_url in url_comments or exit_recording:
-            color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
-            clear_record_info(record_name, record_url)
-            # process.terminate()
-            if os.name == 'nt':
-                if process.stdin:
-                    process.stdin.write(b'q')
-                    process.stdin.close()
-            else:
-                process.send_signal(signal.SIGINT)
-            process.wait()
-            return True
-        time.sleep(1)
+    if url_refresher:
+        url_refresher.on_ready = switch_source
+        url_refresher.start()
+    stall_watch = stall_watchdog.register(
+        record_name, lambda: recorder.bytes, on_stall, expected_bitrate=lambda: recorder.expected_bitrate
+    )
+    try:
+        shared_loop.run(recorder.record())
+        record_success = recorder.segments > 0
+    except Exception as e:
+        logger.error(f"HLS下载错误: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+        record_success = recorder.segments > 0
+    finally:
+        stall_watchdog.unregister(stall_watch)
+        subtitle_clock.stop(subtitle_track)
+        if url_refresher:
+            url_refresher.cancel()
+        if stop_events.get(record_url) is stop_event:
+            stop_events.pop(record_url, None)
 
-    return_code = process.returncode
     stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
-    if return_code == 0:
-        if converts_to_mp4 and save_type == 'TS':
-            if split_video_by_time:
-                file_paths = utils.get_file_paths(os.path.dirname(save_file_path))
-                prefix = os.path.basename(save_file_path).rsplit('_', maxsplit=1)[0]
-                for path in file_paths:
-                    if prefix in path:
-                        threading.Thread(target=converts_mp4, args=(path, delete_origin_file)).start()
-            else:
-                threading.Thread(target=converts_mp4, args=(save_file_path, delete_origin_file)).start()
+    comment_end = record_url in url_comments or exit_recording
+    if not comment_end:
+        cdn_scores.record_session(get_url_host(source_url), failed=not record_success)
+
+    if recorder.split_time:
+        segments = []
+        start = 0.0
+        for index, (path, duration) in enumerate(zip(recorder.files, recorder.file_durations)):
+            segments.append(SegmentInfo(path, index, start, start + duration, os.path.getsize(path)))
+            start += duration
+        write_manifest(save_path, segments)
+        if create_time_file:
+            write_segment_subtitles(segments, record_start, text_encoding)
+    queue_recorded_files(record_name, recorder.files, converts_to_mp4 and record_success)
+    if record_success:
+        logger.debug(f"HLS录制统计: 分片 {recorder.segments} 时长 {recorder.duration:.1f}s "
+                     f"大小 {recorder.bytes / 1024 / 1024:.1f}MB 跳过 {recorder.skipped} 失败 {recorder.failed}")
         print(f"\n{record_name} {stop_time} 直播录制完成\n")
 
-        if script_command:
+        if script_command and not comment_end:
             logger.debug("开始执行脚本命令!")
             if "python" in script_command:
                 params = [
                     f'--record_name "{record_name}"',
-                    f'--save_file_path "{save_file_path}"',
-                    f'--save_type {save_type}',
+                    f'--save_file_path "{save_path}"',
+                    f'--save_type TS',
                     f'--split_video_by_time {split_video_by_time}',
                     f'--converts_to_mp4 {converts_to_mp4}',
                 ]
             else:
                 params = [
                     f'"{record_name.split(" ", maxsplit=1)[-1]}"',
-                    f'"{save_file_path}"',
-                    save_type,
+                    f'"{save_path}"',
+                    'TS',
                     f'split_video_by_time:{split_video_by_time}',
                     f'converts_to_mp4:{converts_to_mp4}'
                 ]
             script_command = script_command.strip() + ' ' + ' '.join(params)
             run_script(script_command)
             logger.debug("脚本命令执行结束!")
+    elif not comment_end:
+        color_obj.print_colored(f"\n{record_name} {stop_time} 直播录制出错,未下载到任何分片\n", color_obj.RED)
+
+    archive_mover.release(get_manifest_base(save_path))
+    if comment_end:
+        color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
+        clear_record_info(record_name, record_url)
+        return True
+    recording.discard(record_name)
+    return False
+
+
+def get_hot_swap_path(save_file_path: str, part: int) -> str:
+    base, extension = save_file_path.rsplit('.', maxsplit=1)
+    if base.endswith('_%03d'):
+        return f'{base[:-5]}_part{part}_%03d.{extension}'
+    return f'{base}_part{part}.{extension}'
+
+
+def start_hot_swap(ffmpeg_command: list, source_url: str, save_file_path: str,
+                   stop_event: threading.Event | None = None, extra_outputs: list | None = None) -> FfmpegProcess | None:
+    # 先在新地址上启动第二路录制, 确认已经开始输出后再停止旧进程, 切换期间两路短暂重叠而不是断档;
+    # 两路输出没有按时间戳对齐也不在关键帧处裁剪, 新文件与前一个文件会有几秒重叠
+    command = list(ffmpeg_command)
+    command[command.index('-i') + 1] = source_url
+    command[-1] = save_file_path
+    if '-segment_list' in command:
+        command[command.index('-segment_list') + 1] = get_segment_list_path(save_file_path)
+    if extra_outputs:
+        command += build_extra_outputs(save_file_path, extra_outputs)
+    process = ffmpeg_supervisor.spawn(command, stop_event=stop_event, startupinfo=get_startup_info(os_type))
+    deadline = time.time() + HOT_SWAP_TIMEOUT
+    while time.time() < deadline and process.running:
+        if process.progress.total_size > 0:
+            return process
+        time.sleep(0.5)
+    process.stop()
+    logger.warning("Hot swap ingest did not produce output in time, fallback to restart")
+    return None
+
+
+def write_output_manifests(output_paths: list, output_started: dict, time_subtitles: bool) -> None:
+    for output_path in output_paths:
+        write_manifest(output_path)
+        if time_subtitles and '%03d' in output_path:
+            write_segment_subtitles(list_segments(output_path), output_started[output_path], text_encoding)
+
+
+def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, save_type: str,
+                     script_command: str | None = None) -> bool:
+    ffmpeg_command = add_segment_list(ffmpeg_command)
+    save_file_path = ffmpeg_command[-1]
+    # 额外输出追加在主输出之后, 主输出的参数和路径保持不变
+    extra_outputs = record_extra_outputs.get(record_name)
+    spawn_command = ffmpeg_command
+    if extra_outputs:
+        spawn_command = ffmpeg_command + build_extra_outputs(save_file_path, extra_outputs)
+    stop_event = get_stop_event(record_url)
+    # 热切换产生的 _partN 文件同样以该前缀开头
+    archive_prefix = get_manifest_base(save_file_path)
+    archive_mover.hold(archive_prefix)
+    session_key = record_session_keys.get(record_name)
+    session_stitcher.begin(session_key)
+    process = ffmpeg_supervisor.spawn(spawn_command, stop_event=stop_event, startupinfo=get_startup_info(os_type))
+    stall_watch = stall_watchdog.register(
+        record_name, OutputSizeProbe(save_file_path), lambda: process.restart_stalled(),
+        # -progress 中的 bitrate 是输出大小除以媒体时长, 反映流本身的码率而不是下载速度
+        expected_bitrate=lambda: process.progress.bitrate * 1000
+    )
+    index_output = keyframe_index.register(save_file_path)
+
+    time_subtitles = create_time_file and '音频' not in save_type
+    subtitle_track = None
+    if time_subtitles and '%03d' not in save_file_path:
+        subtitle_track = subtitle_clock.start(
+            f"{save_file_path.rsplit('.', maxsplit=1)[0]}.srt", encoding=text_encoding
+        )
+    # 分段录制结束后按分段清单生成每段的字幕, 记录每个输出(含热切换产生的)开始的时间
+    output_started = {save_file_path: time.time()}
+
+    url_refresher = url_refreshers.get(record_name)
+    if url_refresher:
+        url_refresher.on_ready = lambda _port_info: process.wakeup.set()
+        url_refresher.start(segment_pattern=save_file_path)
+
+    output_paths = [save_file_path]
+    start_time = time.time()
+    requested_stop = False
+    while process.running:
+        if stop_event.is_set() and not (record_url in url_comments or exit_recording):
+            # 被磁盘配额等请求停止的录制按正常结束处理, 本条线程继续检测直播状态
+            color_obj.print_colored(f"[{record_name}]录制已被请求停止", color_obj.YELLOW)
+            requested_stop = True
+            process.stop()
+            break
+        if record_url in url_comments or exit_recording:
+            color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
+            clear_record_info(record_name, record_url)
+            stall_watchdog.unregister(stall_watch)
+            process.stop()
+            keyframe_index.unregister(index_output)
+            subtitle_clock.stop(subtitle_track)
+            write_output_manifests(output_paths, output_started, time_subtitles)
+            queue_finalize_mp4(output_paths, extra_outputs)
+            # 转码由录制循环处理, 这里只加入会话
+            session_stitcher.add(session_key, get_output_files(output_paths[:1]), end_session=len(output_paths) > 1)
+            archive_mover.release(archive_prefix)
+            return True
+        if url_refresher and url_refresher.should_switch():
+            new_source_url = url_refresher.get_source_url() if seamless_switch else None
+            new_process = None
+            if new_source_url:
+                new_save_path = get_hot_swap_path(ffmpeg_command[-1], len(output_paths))
+                new_process = start_hot_swap(
+                    ffmpeg_command, new_source_url, new_save_path, stop_event, extra_outputs
+                )
+            if new_process:
+                color_obj.print_colored(f"[{record_name}]直播流地址即将过期,已无缝切换到新地址继续录制", color_obj.YELLOW)
+                process.stop()
+                cdn_scores.record_session(get_url_host(url_refresher.url))
+                process = new_process
+                save_file_path = new_save_path
+                output_paths.append(new_save_path)
+                output_started[new_save_path] = time.time()
+                stall_watchdog.unregister(stall_watch)
+                stall_watch = stall_watchdog.register(
+                    record_name, OutputSizeProbe(save_file_path), lambda: process.restart_stalled(),
+                    expected_bitrate=lambda: process.progress.bitrate * 1000
+                )
+                keyframe_index.unregister(index_output)
+                index_output = keyframe_index.register(save_file_path)
+                url_refresher.cancel()
+                url_refresher = StreamUrlRefresher(
+                    new_source_url, url_refresher.resolver, source_selector=url_refresher.source_selector,
+                    stream_info=url_refresher.stream_info
+                )
+                url_refreshers[record_name] = url_refresher
+                url_refresher.on_ready = lambda _port_info: process.wakeup.set()
+                url_refresher.start(segment_pattern=save_file_path)
+                continue
+            color_obj.print_colored(f"[{record_name}]直播流地址即将过期,切换到新地址继续录制", color_obj.YELLOW)
+            url_refresher.switched = True
+            process.stop()
+            break
+        # 进程退出、卡顿、收到停止信号或新地址就绪时会被立即唤醒, 只有等待分段边界时才需要短间隔检查
+        waiting_boundary = url_refresher and url_refresher.ready.is_set() and url_refresher.segment_pattern
+        process.wait(1 if waiting_boundary else SUPERVISOR_WAIT_TIMEOUT)
+
+    stall_watchdog.unregister(stall_watch)
+    keyframe_index.unregister(index_output)
+    subtitle_clock.stop(subtitle_track)
+    if url_refresher:
+        url_refresher.cancel()
+    if stop_events.get(record_url) is stop_event:
+        stop_events.pop(record_url, None)
+    return_code = 0 if requested_stop or (url_refresher and url_refresher.switched) else process.returncode
+    stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
+    source_url = url_refresher.url if url_refresher else ffmpeg_command[ffmpeg_command.index('-i') + 1]
+    cdn_scores.record_session(get_url_host(source_url), failed=return_code != 0, stalled=process.stalled)
+    progress = process.progress
+    logger.debug(f"[{record_name}] ffmpeg 退出码 {process.returncode} 输出时长 {progress.out_time:.0f}s "
+                 f"码率 {progress.bitrate:.0f}kbps 速度 {progress.speed}x 丢帧 {progress.drop_frames}")
+    if process.stalled:
+        color_obj.print_colored(f"[{record_name}]录制卡顿超过{process.stall_timeout}秒,重新开始录制", color_obj.YELLOW)
+    if (return_code != 0 and url_refresher
+            and (process.stalled or time.time() - start_time >= HOT_SWAP_MIN_RUNTIME)):
+        # 录制中途断流时立即重新获取地址, 不等待下一轮循环检测
+        if url_refresher.failover_now():
+            url_refresher.switched = True
+            color_obj.print_colored(f"[{record_name}]直播流中断,已重新获取地址继续录制", color_obj.YELLOW)
+
+    write_output_manifests(output_paths, output_started, time_subtitles)
+    # 异常退出的分片 MP4 同样可以播放, 不论退出码都补写索引
+    queue_finalize_mp4(output_paths, extra_outputs)
+    # 断流产生的文件同样加入会话, 只有正常结束的 TS 录制才需要转码
+    queue_recorded_files(record_name, get_output_files(output_paths[:1]),
+                         converts_to_mp4 and save_type == 'TS' and return_code == 0,
+                         hot_swap_paths=get_output_files(output_paths[1:]))
+    if return_code == 0:
+        print(f"\n{record_name} {stop_time} 直播录制完成\n")
+
+        if script_command:
+            for output_path in output_paths:
+                logger.debug("开始执行脚本命令!")
+                if "python" in script_command:
+                    params = [
+                        f'--record_name "{record_name}"',
+                        f'--save_file_path "{output_path}"',
+                        f'--save_type {save_type}',
+                        f'--split_video_by_time {split_video_by_time}',
+                        f'--converts_to_mp4 {converts_to_mp4}',
+                    ]
+                else:
+                    params = [
+                        f'"{record_name.split(" ", maxsplit=1)[-1]}"',
+                        f'"{output_path}"',
+                        save_type,
+                        f'split_video_by_time:{split_video_by_time}',
+                        f'converts_to_mp4:{converts_to_mp4}'
+                    ]
+                run_script(script_command.strip() + ' ' + ' '.join(params))
+                logger.debug("脚本命令执行结束!")
 
     else:
         color_obj.print_colored(f"\n{record_name} {stop_time} 直播录制出错,返回码: {return_code}\n", color_obj.RED)
 
+    archive_mover.release(archive_prefix)
     recording.discard(record_name)
     return False
 
@@ -528,6 +888,14 @@ def get_record_headers(platform, live_url):
     return record_headers.get(platform)
 
 
+def get_record_header_dict(platform, live_url) -> dict:
+    header_params = get_record_headers(platform, live_url)
+    if not header_params:
+        return {}
+    key, value = header_params.split(":", 1)
+    return {key: value}
+
+
 def is_flv_preferred_platform(link):
     return any(i in link for i in ["douyin", "tiktok"])
 
@@ -543,6 +911,506 @@ def select_source_url(link, stream_info):
     return stream_info.get('record_url')
 
 
+def get_record_source_url(platform: str, record_url: str, stream_info: dict) -> str | None:
+    real_url = select_source_url(record_url, stream_info)
+    if real_url and platform != '自定义录制直播':
+        if enable_https_recording and real_url.startswith("http://"):
+            real_url = real_url.replace("http://", "https://")
+
+        http_record_list = ['shopee', "migu"]
+        if platform in http_record_list:
+            real_url = real_url.replace("https://", "http://")
+    return real_url
+
+
+def fetch_stream_info(record_url: str, record_quality: str, proxy_address: str | None) -> tuple:
+    platform = '未知平台'
+    new_record_url = ''
+    port_info = []
+    if record_url.find("douyin.com/") > -1:
+        platform = '抖音直播'
+        with semaphore:
+            if 'v.douyin.com' not in record_url and '/user/' not in record_url:
+                json_data = asyncio.run(spider.get_douyin_web_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=dy_cookie))
+            else:
+                json_data = asyncio.run(spider.get_douyin_app_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=dy_cookie))
+            port_info = asyncio.run(
+                stream.get_douyin_stream_url(json_data, record_quality, proxy_address))
+            # 获取真实直播间ID
+            if 'real_room_id' in json_data:
+                room_id = json_data.get('real_room_id', 'unknown')
+            elif 'data' in json_data and 'room' in json_data['data'] and 'owner' in json_data['data']['room']:
+                # 备选方案：从正确的路径获取
+                room_id = json_data['data']['room']['owner'].get('web_rid', 'unknown')
+            else:
+                # 从URL中提取room_id
+                room_id = record_url.split('live.douyin.com/')[-1].split('?')[0] if 'live.douyin.com/' in record_url else 'unknown'
+
+            port_info['room_id'] = room_id
+
+            # 添加dy_id获取逻辑
+            if 'web_rid' in json_data.get('data', {}).get('room', {}):
+                dy_id = json_data.get('data',{}).get('room',{}).get('web_rid', 'unknown')
+            else:
+                # 从URL中提取room_id
+                dy_id = record_url.split('live.douyin.com/')[-1].split('?')[0] if 'live.douyin.com/' in record_url else 'unknown'
+            port_info['dy_id'] = dy_id
+
+
+    elif record_url.find("https://www.tiktok.com/") > -1:
+        platform = 'TikTok直播'
+        with semaphore:
+            if global_proxy or proxy_address:
+                json_data = asyncio.run(spider.get_tiktok_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=tiktok_cookie))
+                port_info = asyncio.run(
+                    stream.get_tiktok_stream_url(json_data, record_quality, proxy_address))
+            else:
+                logger.error("错误信息: 网络异常，请检查网络是否能正常访问TikTok平台")
+
+    elif record_url.find("https://live.kuaishou.com/") > -1:
+        platform = '快手直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_kuaishou_stream_data(
+                url=record_url,
+                proxy_addr=proxy_address,
+                cookies=ks_cookie))
+            port_info = asyncio.run(stream.get_kuaishou_stream_url(json_data, record_quality))
+
+    elif record_url.find("https://www.huya.com/") > -1:
+        platform = '虎牙直播'
+        with semaphore:
+            if record_quality not in ['OD', 'BD', 'UHD']:
+                json_data = asyncio.run(spider.get_huya_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=hy_cookie))
+                port_info = asyncio.run(stream.get_huya_stream_url(json_data, record_quality))
+            else:
+                port_info = asyncio.run(spider.get_huya_app_stream_url(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=hy_cookie
+                ))
+
+    elif record_url.find("https://www.douyu.com/") > -1:
+        platform = '斗鱼直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_douyu_info_data(
+                url=record_url, proxy_addr=proxy_address, cookies=douyu_cookie))
+            port_info = asyncio.run(stream.get_douyu_stream_url(
+                json_data, video_quality=record_quality, cookies=douyu_cookie, proxy_addr=proxy_address
+            ))
+
+    elif record_url.find("https://www.yy.com/") > -1:
+        platform = 'YY直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_yy_stream_data(
+                url=record_url, proxy_addr=proxy_address, cookies=yy_cookie))
+            port_info = asyncio.run(stream.get_yy_stream_url(json_data))
+
+    elif record_url.find("https://live.bilibili.com/") > -1:
+        platform = 'B站直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_bilibili_room_info(
+                url=record_url, proxy_addr=proxy_address, cookies=bili_cookie))
+            port_info = asyncio.run(stream.get_bilibili_stream_url(
+                json_data, video_quality=record_quality, cookies=bili_cookie, proxy_addr=proxy_address))
+
+    elif record_url.find("http://xhslink.com/") > -1 or \
+            record_url.find("https://www.xiaohongshu.com/") > -1:
+        platform = '小红书直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_xhs_stream_url(
+                record_url, proxy_addr=proxy_address, cookies=xhs_cookie))
+
+    elif record_url.find("www.bigo.tv/") > -1 or record_url.find("slink.bigovideo.tv/") > -1:
+        platform = 'Bigo直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_bigo_stream_url(
+                record_url, proxy_addr=proxy_address, cookies=bigo_cookie))
+
+    elif record_url.find("https://app.blued.cn/") > -1:
+        platform = 'Blued直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_blued_stream_url(
+                record_url, proxy_addr=proxy_address, cookies=blued_cookie))
+
+    elif record_url.find("sooplive.co.kr/") > -1 or record_url.find("sooplive.com/") > -1:
+        platform = 'SOOP'
+        with semaphore:
+            if global_proxy or proxy_address:
+                json_data = asyncio.run(spider.get_sooplive_stream_data(
+                    url=record_url, proxy_addr=proxy_address,
+                    cookies=sooplive_cookie,
+                    username=sooplive_username,
+                    password=sooplive_password
+                ))
+                if json_data and json_data.get('new_cookies'):
+                    utils.update_config(
+                        config_file, 'Cookie', 'sooplive_cookie', json_data['new_cookies']
+                    )
+                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问SOOP平台")
+
+    elif record_url.find("cc.163.com/") > -1:
+        platform = '网易CC直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_netease_stream_data(
+                url=record_url, cookies=netease_cookie))
+            port_info = asyncio.run(stream.get_netease_stream_url(json_data, record_quality))
+
+    elif record_url.find("qiandurebo.com/") > -1:
+        platform = '千度热播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_qiandurebo_stream_data(
+                url=record_url, proxy_addr=proxy_address, cookies=qiandurebo_cookie))
+
+    elif record_url.find("www.pandalive.co.kr/") > -1:
+        platform = 'PandaTV'
+        with semaphore:
+            if global_proxy or proxy_address:
+                json_data = asyncio.run(spider.get_pandatv_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=pandatv_cookie
+                ))
+                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问PandaTV直播平台")
+
+    elif record_url.find("fm.missevan.com/") > -1:
+        platform = '猫耳FM直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_maoerfm_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=maoerfm_cookie))
+
+    elif record_url.find("www.winktv.co.kr/") > -1:
+        platform = 'WinkTV'
+        with semaphore:
+            if global_proxy or proxy_address:
+                json_data = asyncio.run(spider.get_winktv_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=winktv_cookie))
+                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问WinkTV直播平台")
+
+    elif record_url.find("www.flextv.co.kr/") > -1 or record_url.find("www.ttinglive.com/") > -1:
+        platform = 'FlexTV'
+        with semaphore:
+            if global_proxy or proxy_address:
+                json_data = asyncio.run(spider.get_flextv_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=flextv_cookie,
+                    username=flextv_username,
+                    password=flextv_password
+                ))
+                if json_data and json_data.get('new_cookies'):
+                    utils.update_config(
+                        config_file, 'Cookie', 'flextv_cookie', json_data['new_cookies']
+                    )
+                if 'play_url_list' in json_data:
+                    port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+                else:
+                    port_info = json_data
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问FlexTV直播平台")
+
+    elif record_url.find("look.163.com/") > -1:
+        platform = 'Look直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_looklive_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=look_cookie
+            ))
+
+    elif record_url.find("www.popkontv.com/") > -1:
+        platform = 'PopkonTV'
+        with semaphore:
+            if global_proxy or proxy_address:
+                port_info = asyncio.run(spider.get_popkontv_stream_url(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    access_token=popkontv_access_token,
+                    username=popkontv_username,
+                    password=popkontv_password,
+                    partner_code=popkontv_partner_code
+                ))
+                if port_info and port_info.get('new_token'):
+                    utils.update_config(
+                        file_path=config_file, section='Authorization', key='popkontv_token',
+                        new_value=port_info['new_token']
+                    )
+
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问PopkonTV直播平台")
+
+    elif record_url.find("twitcasting.tv/") > -1:
+        platform = 'TwitCasting'
+        with semaphore:
+            json_data = asyncio.run(spider.get_twitcasting_stream_url(
+                url=record_url,
+                proxy_addr=proxy_address,
+                cookies=twitcasting_cookie,
+                account_type=twitcasting_account_type,
+                username=twitcasting_username,
+                password=twitcasting_password
+            ))
+            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=False))
+
+            if port_info and port_info.get('new_cookies'):
+                utils.update_config(
+                    file_path=config_file, section='Cookie', key='twitcasting_cookie',
+                    new_value=port_info['new_cookies']
+                )
+
+    elif record_url.find("live.baidu.com/") > -1:
+        platform = '百度直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_baidu_stream_data(
+                url=record_url,
+                proxy_addr=proxy_address,
+                cookies=baidu_cookie))
+            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality))
+
+    elif record_url.find("weibo.com/") > -1:
+        platform = '微博直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_weibo_stream_data(
+                url=record_url, proxy_addr=proxy_address, cookies=weibo_cookie))
+            port_info = asyncio.run(stream.get_stream_url(
+                json_data, record_quality, hls_extra_key='m3u8_url'))
+
+    elif record_url.find("kugou.com/") > -1:
+        platform = '酷狗直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_kugou_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=kugou_cookie))
+
+    elif record_url.find("www.twitch.tv/") > -1:
+        platform = 'TwitchTV'
+        with semaphore:
+            if global_proxy or proxy_address:
+                json_data = asyncio.run(spider.get_twitchtv_stream_data(
+                    url=record_url,
+                    proxy_addr=proxy_address,
+                    cookies=twitch_cookie
+                ))
+                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问TwitchTV直播平台")
+
+    elif record_url.find("www.liveme.com/") > -1:
+        if global_proxy or proxy_address:
+            platform = 'LiveMe'
+            with semaphore:
+                port_info = asyncio.run(spider.get_liveme_stream_url(
+                    url=record_url, proxy_addr=proxy_address, cookies=liveme_cookie))
+        else:
+            logger.error("错误信息: 网络异常，请检查本网络是否能正常访问LiveMe直播平台")
+
+    elif record_url.find("www.huajiao.com/") > -1:
+        platform = '花椒直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_huajiao_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=huajiao_cookie))
+
+    elif record_url.find("7u66.com/") > -1:
+        platform = '流星直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_liuxing_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=liuxing_cookie))
+
+    elif record_url.find("showroom-live.com/") > -1:
+        platform = 'ShowRoom'
+        with semaphore:
+            json_data = asyncio.run(spider.get_showroom_stream_data(
+                url=record_url, proxy_addr=proxy_address, cookies=showroom_cookie))
+            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+
+    elif record_url.find("live.acfun.cn/") > -1 or record_url.find("m.acfun.cn/") > -1:
+        platform = 'Acfun'
+        with semaphore:
+            json_data = asyncio.run(spider.get_acfun_stream_data(
+                url=record_url, proxy_addr=proxy_address, cookies=acfun_cookie))
+            port_info = asyncio.run(stream.get_stream_url(
+                json_data, record_quality, url_type='flv', flv_extra_key='url'))
+
+    elif record_url.find("live.tlclw.com/") > -1:
+        platform = '畅聊直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_changliao_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=changliao_cookie))
+
+    elif record_url.find("ybw1666.com/") > -1:
+        platform = '音播直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_yinbo_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=yinbo_cookie))
+
+    elif record_url.find("www.inke.cn/") > -1:
+        platform = '映客直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_yingke_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=yingke_cookie))
+
+    elif record_url.find("www.zhihu.com/") > -1:
+        platform = '知乎直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_zhihu_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=zhihu_cookie))
+
+    elif record_url.find("chzzk.naver.com/") > -1:
+        platform = 'CHZZK'
+        with semaphore:
+            json_data = asyncio.run(spider.get_chzzk_stream_data(
+                url=record_url, proxy_addr=proxy_address, cookies=chzzk_cookie))
+            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+
+    elif record_url.find("www.haixiutv.com/") > -1:
+        platform = '嗨秀直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_haixiu_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=haixiu_cookie))
+
+    elif record_url.find("vvxqiu.com/") > -1:
+        platform = 'VV星球'
+        with semaphore:
+            port_info = asyncio.run(spider.get_vvxqiu_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=vvxqiu_cookie))
+
+    elif record_url.find("17.live/") > -1:
+        platform = '17Live'
+        with semaphore:
+            port_info = asyncio.run(spider.get_17live_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=yiqilive_cookie))
+
+    elif record_url.find("www.lang.live/") > -1:
+        platform = '浪Live'
+        with semaphore:
+            port_info = asyncio.run(spider.get_langlive_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=langlive_cookie))
+
+    elif record_url.find("m.pp.weimipopo.com/") > -1:
+        platform = '漂漂直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_pplive_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=pplive_cookie))
+
+    elif record_url.find(".6.cn/") > -1:
+        platform = '六间房直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_6room_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=six_room_cookie))
+
+    elif record_url.find("lehaitv.com/") > -1:
+        platform = '乐嗨直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_haixiu_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=lehaitv_cookie))
+
+    elif record_url.find("h.catshow168.com/") > -1:
+        platform = '花猫直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_pplive_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=huamao_cookie))
+
+    elif record_url.find("live.shopee") > -1 or record_url.find("shp.ee/") > -1:
+        platform = 'shopee'
+        with semaphore:
+            port_info = asyncio.run(spider.get_shopee_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=shopee_cookie))
+            if port_info.get('uid'):
+                new_record_url = record_url.split('?')[0] + '?' + str(port_info['uid'])
+
+    elif record_url.find("www.youtube.com/") > -1 or record_url.find("youtu.be/") > -1:
+        platform = 'Youtube'
+        with semaphore:
+            json_data = asyncio.run(spider.get_youtube_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=youtube_cookie))
+            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+
+    elif record_url.find("tb.cn") > -1:
+        platform = '淘宝直播'
+        with semaphore:
+            json_data = asyncio.run(spider.get_taobao_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=taobao_cookie))
+            port_info = asyncio.run(stream.get_stream_url(
+                json_data, record_quality,
+                url_type='all', hls_extra_key='hlsUrl', flv_extra_key='flvUrl'
+            ))
+
+    elif record_url.find("3.cn") > -1 or record_url.find("m.jd.com") > -1:
+        platform = '京东直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_jd_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=jd_cookie))
+
+    elif record_url.find("faceit.com/") > -1:
+        platform = 'faceit'
+        with semaphore:
+            if global_proxy or proxy_address:
+                with semaphore:
+                    json_data = asyncio.run(spider.get_faceit_stream_data(
+                        url=record_url, proxy_addr=proxy_address, cookies=faceit_cookie))
+                    port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
+            else:
+                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问faceit直播平台")
+
+    elif record_url.find("www.miguvideo.com") > -1 or record_url.find("m.miguvideo.com") > -1:
+        platform = '咪咕直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_migu_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=migu_cookie))
+
+    elif record_url.find("show.lailianjie.com") > -1:
+        platform = '连接直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_lianjie_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=lianjie_cookie))
+
+    elif record_url.find("www.imkktv.com") > -1:
+        platform = '来秀直播'
+        with semaphore:
+            port_info = asyncio.run(spider.get_laixiu_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=laixiu_cookie))
+
+    elif record_url.find("www.picarto.tv") > -1:
+        platform = 'Picarto'
+        with semaphore:
+            port_info = asyncio.run(spider.get_picarto_stream_url(
+                url=record_url, proxy_addr=proxy_address, cookies=picarto_cookie))
+
+    elif record_url.find(".m3u8") > -1 or record_url.find(".flv") > -1:
+        platform = '自定义录制直播'
+        port_info = {
+            "anchor_name": platform + '_' + str(uuid.uuid4())[:8],
+            "is_live": True,
+            "record_url": record_url,
+        }
+        if '.flv' in record_url:
+            port_info['flv_url'] = record_url
+        else:
+            port_info['m3u8_url'] = record_url
+
+    else:
+        logger.error(f'{record_url} {platform}直播地址')
+        return platform, None, new_record_url
+
+    return platform, port_info, new_record_url
+
+
 def start_record(url_data: tuple, count_variable: int = -1) -> None:
     global error_count
 
@@ -551,9 +1419,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
             record_finished = False
             run_once = False
             start_pushed = False
-            new_record_url = ''
+            refreshed_port_info = None
             count_time = time.time()
-            retry = 0
             record_quality_zh, record_url, anchor_name = url_data
             record_quality = get_quality_code(record_quality_zh)
             proxy_address = proxy_addr
@@ -577,487 +1444,12 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
             # print(f'\r全局代理:{global_proxy}')
             while True:
                 try:
-                    port_info = []
-                    if record_url.find("douyin.com/") > -1:
-                        platform = '抖音直播'
-                        with semaphore:
-                            if 'v.douyin.com' not in record_url and '/user/' not in record_url:
-                                json_data = asyncio.run(spider.get_douyin_web_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=dy_cookie))
-                            else:
-                                json_data = asyncio.run(spider.get_douyin_app_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=dy_cookie))
-                            port_info = asyncio.run(
-                                stream.get_douyin_stream_url(json_data, record_quality, proxy_address))
-                            # 获取真实直播间ID
-                            if 'real_room_id' in json_data:
-                                room_id = json_data.get('real_room_id', 'unknown')
-                            elif 'data' in json_data and 'room' in json_data['data'] and 'owner' in json_data['data']['room']:
-                                # 备选方案：从正确的路径获取
-                                room_id = json_data['data']['room']['owner'].get('web_rid', 'unknown')
-                            else:
-                                # 从URL中提取room_id
-                                room_id = record_url.split('live.douyin.com/')[-1].split('?')[0] if 'live.douyin.com/' in record_url else 'unknown'
-
-                            port_info['room_id'] = room_id
-
-                            # 添加dy_id获取逻辑
-                            if 'web_rid' in json_data.get('data', {}).get('room', {}):
-                                dy_id = json_data.get('data',{}).get('room',{}).get('web_rid', 'unknown')
-                            else:
-                                # 从URL中提取room_id
-                                dy_id = record_url.split('live.douyin.com/')[-1].split('?')[0] if 'live.douyin.com/' in record_url else 'unknown'
-                            port_info['dy_id'] = dy_id
-
-
-                    elif record_url.find("https://www.tiktok.com/") > -1:
-                        platform = 'TikTok直播'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_tiktok_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=tiktok_cookie))
-                                port_info = asyncio.run(
-                                    stream.get_tiktok_stream_url(json_data, record_quality, proxy_address))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查网络是否能正常访问TikTok平台")
-
-                    elif record_url.find("https://live.kuaishou.com/") > -1:
-                        platform = '快手直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_kuaishou_stream_data(
-                                url=record_url,
-                                proxy_addr=proxy_address,
-                                cookies=ks_cookie))
-                            port_info = asyncio.run(stream.get_kuaishou_stream_url(json_data, record_quality))
-
-                    elif record_url.find("https://www.huya.com/") > -1:
-                        platform = '虎牙直播'
-                        with semaphore:
-                            if record_quality not in ['OD', 'BD', 'UHD']:
-                                json_data = asyncio.run(spider.get_huya_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=hy_cookie))
-                                port_info = asyncio.run(stream.get_huya_stream_url(json_data, record_quality))
-                            else:
-                                port_info = asyncio.run(spider.get_huya_app_stream_url(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=hy_cookie
-                                ))
-
-                    elif record_url.find("https://www.douyu.com/") > -1:
-                        platform = '斗鱼直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_douyu_info_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=douyu_cookie))
-                            port_info = asyncio.run(stream.get_douyu_stream_url(
-                                json_data, video_quality=record_quality, cookies=douyu_cookie, proxy_addr=proxy_address
-                            ))
-
-                    elif record_url.find("https://www.yy.com/") > -1:
-                        platform = 'YY直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_yy_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=yy_cookie))
-                            port_info = asyncio.run(stream.get_yy_stream_url(json_data))
-
-                    elif record_url.find("https://live.bilibili.com/") > -1:
-                        platform = 'B站直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_bilibili_room_info(
-                                url=record_url, proxy_addr=proxy_address, cookies=bili_cookie))
-                            port_info = asyncio.run(stream.get_bilibili_stream_url(
-                                json_data, video_quality=record_quality, cookies=bili_cookie, proxy_addr=proxy_address))
-
-                    elif record_url.find("http://xhslink.com/") > -1 or \
-                            record_url.find("https://www.xiaohongshu.com/") > -1:
-                        platform = '小红书直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_xhs_stream_url(
-                                record_url, proxy_addr=proxy_address, cookies=xhs_cookie))
-                            retry += 1
-
-                    elif record_url.find("www.bigo.tv/") > -1 or record_url.find("slink.bigovideo.tv/") > -1:
-                        platform = 'Bigo直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_bigo_stream_url(
-                                record_url, proxy_addr=proxy_address, cookies=bigo_cookie))
-
-                    elif record_url.find("https://app.blued.cn/") > -1:
-                        platform = 'Blued直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_blued_stream_url(
-                                record_url, proxy_addr=proxy_address, cookies=blued_cookie))
-
-                    elif record_url.find("sooplive.co.kr/") > -1 or record_url.find("sooplive.com/") > -1:
-                        platform = 'SOOP'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_sooplive_stream_data(
-                                    url=record_url, proxy_addr=proxy_address,
-                                    cookies=sooplive_cookie,
-                                    username=sooplive_username,
-                                    password=sooplive_password
-                                ))
-                                if json_data and json_data.get('new_cookies'):
-                                    utils.update_config(
-                                        config_file, 'Cookie', 'sooplive_cookie', json_data['new_cookies']
-                                    )
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问SOOP平台")
-
-                    elif record_url.find("cc.163.com/") > -1:
-                        platform = '网易CC直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_netease_stream_data(
-                                url=record_url, cookies=netease_cookie))
-                            port_info = asyncio.run(stream.get_netease_stream_url(json_data, record_quality))
-
-                    elif record_url.find("qiandurebo.com/") > -1:
-                        platform = '千度热播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_qiandurebo_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=qiandurebo_cookie))
-
-                    elif record_url.find("www.pandalive.co.kr/") > -1:
-                        platform = 'PandaTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_pandatv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=pandatv_cookie
-                                ))
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问PandaTV直播平台")
-
-                    elif record_url.find("fm.missevan.com/") > -1:
-                        platform = '猫耳FM直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_maoerfm_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=maoerfm_cookie))
-
-                    elif record_url.find("www.winktv.co.kr/") > -1:
-                        platform = 'WinkTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_winktv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=winktv_cookie))
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问WinkTV直播平台")
-
-                    elif record_url.find("www.flextv.co.kr/") > -1 or record_url.find("www.ttinglive.com/") > -1:
-                        platform = 'FlexTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_flextv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=flextv_cookie,
-                                    username=flextv_username,
-                                    password=flextv_password
-                                ))
-                                if json_data and json_data.get('new_cookies'):
-                                    utils.update_config(
-                                        config_file, 'Cookie', 'flextv_cookie', json_data['new_cookies']
-                                    )
-                                if 'play_url_list' in json_data:
-                                    port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                                else:
-                                    port_info = json_data
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问FlexTV直播平台")
-
-                    elif record_url.find("look.163.com/") > -1:
-                        platform = 'Look直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_looklive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=look_cookie
-                            ))
-
-                    elif record_url.find("www.popkontv.com/") > -1:
-                        platform = 'PopkonTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                port_info = asyncio.run(spider.get_popkontv_stream_url(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    access_token=popkontv_access_token,
-                                    username=popkontv_username,
-                                    password=popkontv_password,
-                                    partner_code=popkontv_partner_code
-                                ))
-                                if port_info and port_info.get('new_token'):
-                                    utils.update_config(
-                                        file_path=config_file, section='Authorization', key='popkontv_token',
-                                        new_value=port_info['new_token']
-                                    )
-
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问PopkonTV直播平台")
-
-                    elif record_url.find("twitcasting.tv/") > -1:
-                        platform = 'TwitCasting'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_twitcasting_stream_url(
-                                url=record_url,
-                                proxy_addr=proxy_address,
-                                cookies=twitcasting_cookie,
-                                account_type=twitcasting_account_type,
-                                username=twitcasting_username,
-                                password=twitcasting_password
-                            ))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=False))
-
-                            if port_info and port_info.get('new_cookies'):
-                                utils.update_config(
-                                    file_path=config_file, section='Cookie', key='twitcasting_cookie',
-                                    new_value=port_info['new_cookies']
-                                )
-
-                    elif record_url.find("live.baidu.com/") > -1:
-                        platform = '百度直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_baidu_stream_data(
-                                url=record_url,
-                                proxy_addr=proxy_address,
-                                cookies=baidu_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality))
-
-                    elif record_url.find("weibo.com/") > -1:
-                        platform = '微博直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_weibo_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=weibo_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(
-                                json_data, record_quality, hls_extra_key='m3u8_url'))
-
-                    elif record_url.find("kugou.com/") > -1:
-                        platform = '酷狗直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_kugou_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=kugou_cookie))
-
-                    elif record_url.find("www.twitch.tv/") > -1:
-                        platform = 'TwitchTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_twitchtv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=twitch_cookie
-                                ))
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问TwitchTV直播平台")
-
-                    elif record_url.find("www.liveme.com/") > -1:
-                        if global_proxy or proxy_address:
-                            platform = 'LiveMe'
-                            with semaphore:
-                                port_info = asyncio.run(spider.get_liveme_stream_url(
-                                    url=record_url, proxy_addr=proxy_address, cookies=liveme_cookie))
-                        else:
-                            logger.error("错误信息: 网络异常，请检查本网络是否能正常访问LiveMe直播平台")
-
-                    elif record_url.find("www.huajiao.com/") > -1:
-                        platform = '花椒直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_huajiao_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=huajiao_cookie))
-
-                    elif record_url.find("7u66.com/") > -1:
-                        platform = '流星直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_liuxing_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=liuxing_cookie))
-
-                    elif record_url.find("showroom-live.com/") > -1:
-                        platform = 'ShowRoom'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_showroom_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=showroom_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-
-                    elif record_url.find("live.acfun.cn/") > -1 or record_url.find("m.acfun.cn/") > -1:
-                        platform = 'Acfun'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_acfun_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=acfun_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(
-                                json_data, record_quality, url_type='flv', flv_extra_key='url'))
-
-                    elif record_url.find("live.tlclw.com/") > -1:
-                        platform = '畅聊直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_changliao_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=changliao_cookie))
-
-                    elif record_url.find("ybw1666.com/") > -1:
-                        platform = '音播直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_yinbo_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=yinbo_cookie))
-
-                    elif record_url.find("www.inke.cn/") > -1:
-                        platform = '映客直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_yingke_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=yingke_cookie))
-
-                    elif record_url.find("www.zhihu.com/") > -1:
-                        platform = '知乎直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_zhihu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=zhihu_cookie))
-
-                    elif record_url.find("chzzk.naver.com/") > -1:
-                        platform = 'CHZZK'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_chzzk_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=chzzk_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-
-                    elif record_url.find("www.haixiutv.com/") > -1:
-                        platform = '嗨秀直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_haixiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=haixiu_cookie))
-
-                    elif record_url.find("vvxqiu.com/") > -1:
-                        platform = 'VV星球'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_vvxqiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=vvxqiu_cookie))
-
-                    elif record_url.find("17.live/") > -1:
-                        platform = '17Live'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_17live_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=yiqilive_cookie))
-
-                    elif record_url.find("www.lang.live/") > -1:
-                        platform = '浪Live'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_langlive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=langlive_cookie))
-
-                    elif record_url.find("m.pp.weimipopo.com/") > -1:
-                        platform = '漂漂直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_pplive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=pplive_cookie))
-
-                    elif record_url.find(".6.cn/") > -1:
-                        platform = '六间房直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_6room_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=six_room_cookie))
-
-                    elif record_url.find("lehaitv.com/") > -1:
-                        platform = '乐嗨直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_haixiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=lehaitv_cookie))
-
-                    elif record_url.find("h.catshow168.com/") > -1:
-                        platform = '花猫直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_pplive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=huamao_cookie))
-
-                    elif record_url.find("live.shopee") > -1 or record_url.find("shp.ee/") > -1:
-                        platform = 'shopee'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_shopee_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=shopee_cookie))
-                            if port_info.get('uid'):
-                                new_record_url = record_url.split('?')[0] + '?' + str(port_info['uid'])
-
-                    elif record_url.find("www.youtube.com/") > -1 or record_url.find("youtu.be/") > -1:
-                        platform = 'Youtube'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_youtube_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=youtube_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-
-                    elif record_url.find("tb.cn") > -1:
-                        platform = '淘宝直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_taobao_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=taobao_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(
-                                json_data, record_quality,
-                                url_type='all', hls_extra_key='hlsUrl', flv_extra_key='flvUrl'
-                            ))
-
-                    elif record_url.find("3.cn") > -1 or record_url.find("m.jd.com") > -1:
-                        platform = '京东直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_jd_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=jd_cookie))
-
-                    elif record_url.find("faceit.com/") > -1:
-                        platform = 'faceit'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                with semaphore:
-                                    json_data = asyncio.run(spider.get_faceit_stream_data(
-                                        url=record_url, proxy_addr=proxy_address, cookies=faceit_cookie))
-                                    port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问faceit直播平台")
-
-                    elif record_url.find("www.miguvideo.com") > -1 or record_url.find("m.miguvideo.com") > -1:
-                        platform = '咪咕直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_migu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=migu_cookie))
-
-                    elif record_url.find("show.lailianjie.com") > -1:
-                        platform = '连接直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_lianjie_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=lianjie_cookie))
-
-                    elif record_url.find("www.imkktv.com") > -1:
-                        platform = '来秀直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_laixiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=laixiu_cookie))
-
-                    elif record_url.find("www.picarto.tv") > -1:
-                        platform = 'Picarto'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_picarto_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=picarto_cookie))
-
-                    elif record_url.find(".m3u8") > -1 or record_url.find(".flv") > -1:
-                        platform = '自定义录制直播'
-                        port_info = {
-                            "anchor_name": platform + '_' + str(uuid.uuid4())[:8],
-                            "is_live": True,
-                            "record_url": record_url,
-                        }
-                        if '.flv' in record_url:
-                            port_info['flv_url'] = record_url
-                        else:
-                            port_info['m3u8_url'] = record_url
-
+                    if refreshed_port_info:
+                        port_info, refreshed_port_info = refreshed_port_info, None
                     else:
-                        logger.error(f'{record_url} {platform}直播地址')
+                        platform, port_info, new_record_url = fetch_stream_info(
+                            record_url, record_quality, proxy_address)
+                    if port_info is None:
                         return
 
                     if anchor_name:
@@ -1135,7 +1527,23 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 time.sleep(push_check_seconds)
                                 continue
 
-                            real_url = select_source_url(record_url, port_info)
+                            owner_url = room_registry.claim(
+                                record_url, record_name, get_room_keys(platform, port_info), recording
+                            )
+                            if owner_url:
+                                alias_count = len(room_registry.get_aliases(owner_url))
+                                print(f"\r{record_name} 与 {owner_url} 是同一个直播间,作为别名跳过录制"
+                                      f"(该直播间共{alias_count}个别名)")
+                                time.sleep(delay_default)
+                                continue
+
+                            if not disk_quota.allow_new_recording(record_url, platform, anchor_name):
+                                room_registry.release(record_url)
+                                print(f"\r{record_name} 磁盘空间即将不足,暂不开始新的录制")
+                                time.sleep(delay_default)
+                                continue
+
+                            real_url = get_record_source_url(platform, record_url, port_info)
                             full_path = f'{default_path}/{platform}'
                             if real_url:
                                 now = datetime.datetime.today().strftime("%Y-%m-%d_%H-%M-%S")
@@ -1179,13 +1587,13 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 except Exception as e:
                                     logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
 
-                                if platform != '自定义录制直播':
-                                    if enable_https_recording and real_url.startswith("http://"):
-                                        real_url = real_url.replace("http://", "https://")
-
-                                    http_record_list = ['shopee', "migu"]
-                                    if platform in http_record_list:
-                                        real_url = real_url.replace("https://", "http://")
+                                # 带有效期的直播流地址在过期前后台重新获取, 由 check_subprocess 负责切换
+                                url_refreshers[record_name] = StreamUrlRefresher(
+                                    real_url,
+                                    lambda: fetch_stream_info(record_url, record_quality, proxy_address)[1],
+                                    source_selector=lambda info: get_record_source_url(platform, record_url, info),
+                                    stream_info=port_info
+                                )
 
                                 user_agent = ("Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 ("
                                               "KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile "
@@ -1236,10 +1644,13 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     ffmpeg_command.insert(1, "-http_proxy")
                                     ffmpeg_command.insert(2, proxy_address)
 
+                                recording.add(record_name)
+                                start_record_time = datetime.datetime.now()
+                                recording_time_list[record_name] = [start_record_time, record_quality_zh]
+
                                 # 启动弹幕获取
                                 logger.debug(f'启动弹幕获取')
                                 danmaku_instance = None
-                                danmaku_task = None
                                 if platform in ['抖音直播', '快手直播', '小红书直播']:
                                     room_id = port_info.get('room_id', '')
                                     user_id = port_info.get('user_id', '')
@@ -1275,43 +1686,21 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             danmaku_instance = XiaohongshuDanmaku(room_id, proxy, logger)
                                         
                                         if danmaku_instance:
-                                            # 连接弹幕服务器
-                                            asyncio.run(danmaku_instance.connect())
-                                            # 启动弹幕获取任务
-                                            async def danmaku_capture_task():
-                                                danmaku_file = None
-                                                try:
-                                                    # 清理 room_id 中的特殊字符，避免路径错误
-                                                    clean_room_id = clean_name(room_id)
-                                                    # 创建弹幕文件
-                                                    danmaku_filename = f"{full_path}/{dy_id}_{clean_room_id}_{anchor_name}_{title_in_name}_{now}.danmu.json"
-                                                    danmaku_file = open(danmaku_filename, 'a', encoding='utf-8')
-                                                    
-                                                    while record_name in recording:
-                                                        danmakus = await danmaku_instance.get_danmaku()
-                                                        for danmaku in danmakus:
-                                                            # 写入弹幕文件
-                                                            import json
-                                                            danmaku_file.write(json.dumps(danmaku, ensure_ascii=False) + '\n')
-                                                            danmaku_file.flush()
-                                                        await asyncio.sleep(0.1)
-                                                except Exception as e:
-                                                    logger.error(f"弹幕获取失败: {e}")
-                                                finally:
-                                                    if danmaku_file:
-                                                        danmaku_file.close()
-                                                    if danmaku_instance:
-                                                        await danmaku_instance.disconnect()
-                                            
-                                            # 使用线程运行弹幕获取任务
-                                            danmaku_task = threading.Thread(target=lambda: asyncio.run(danmaku_capture_task()))
-                                            danmaku_task.daemon = True
-                                            danmaku_task.start()
-                                            logger.info(f"[{anchor_name}] 弹幕获取已启动")
+                                            # 清理 room_id 中的特殊字符，避免路径错误
+                                            clean_room_id = clean_name(room_id)
+                                            danmaku_writer = danmaku_sink.open(
+                                                f"{full_path}/{dy_id}_{clean_room_id}_{anchor_name}_{title_in_name}_{now}")
+
+                                            if danmaku_writer:
+                                                # 所有直播间的弹幕连接由同一个事件循环维护, 弹幕由后台线程批量写入,
+                                                # 录制结束后自动断开并关闭文件
+                                                danmaku_hub.start(
+                                                    danmaku_instance, partial(danmaku_sink.put, danmaku_writer),
+                                                    should_stop=lambda name=record_name: name not in recording,
+                                                    on_close=partial(danmaku_sink.close, danmaku_writer)
+                                                )
+                                                logger.info(f"[{anchor_name}] 弹幕获取已启动")
 
-                                recording.add(record_name)
-                                start_record_time = datetime.datetime.now()
-                                recording_time_list[record_name] = [start_record_time, record_quality_zh]
                                 rec_info = f"\r{anchor_name} 准备开始录制视频: {full_path}"
                                 logger.info(rec_info)
                                 if show_url:
@@ -1335,6 +1724,10 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     only_audio_record = True
 
                                 record_save_type = video_save_type
+                                if (record_save_type == "TS" and converts_to_mp4 and ts_record_as_fmp4
+                                        and not converts_to_h264):
+                                    # 直接录制为分片 MP4, 省去录制结束后整个文件的转封装读写
+                                    record_save_type = "MP4"
 
                                 if is_flv_preferred_platform(record_url) and port_info.get('flv_url'):
                                     codec = utils.get_query_params(port_info['flv_url'], "codec")
@@ -1412,21 +1805,48 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             error_count += 1
                                             error_window.append(1)
 
+                                if session_stitcher.enabled and not split_video_by_time:
+                                    # 按直播间归并断流前后的录制文件, 取不到房间号时按录制地址
+                                    room_key = str(room_id).strip()
+                                    valid_room = room_key.lower() not in INVALID_IDS
+                                    record_session_keys[record_name] = (
+                                        f'{platform}:{room_key}' if valid_room else record_url)
+
+                                extra_outputs = []
+                                if not only_audio_record and not any(i in record_save_type for i in ['MP3', 'M4A']):
+                                    extra_outputs = get_extra_outputs(
+                                        extra_output_rules, platform, anchor_name, record_save_type)
+                                if extra_outputs and only_flv_record:
+                                    logger.warning(f"[{anchor_name}] {platform} 使用FLV直接下载录制, "
+                                                   f"不支持同一路直播流额外输出, 已忽略: {', '.join(extra_outputs)}")
+                                    extra_outputs = []
+                                if any(kind in AUDIO_OUTPUTS for kind in extra_outputs):
+                                    # 额外输出与主录制共用一个 ffmpeg 进程, 没有音轨时纯音频输出会让整个进程退出
+                                    has_audio = probe_audio_stream(
+                                        real_url, headers, proxy_address, user_agent,
+                                        startupinfo=get_startup_info(os_type)
+                                    )
+                                    if not has_audio:
+                                        logger.warning(f"[{anchor_name}] 直播流没有音轨或探测失败, 跳过纯音频额外输出")
+                                        extra_outputs = [kind for kind in extra_outputs if kind not in AUDIO_OUTPUTS]
+                                if extra_outputs:
+                                    record_extra_outputs[record_name] = extra_outputs
+                                    logger.info(f"[{anchor_name}] 同一路直播流额外输出: {', '.join(extra_outputs)}")
+
+                                native_hls_record = False
+                                # 内置下载器只能写一个文件, 需要额外输出时使用 ffmpeg
+                                if (native_hls_download and record_save_type == "TS" and not only_flv_record
+                                        and not only_audio_record and not extra_outputs and '.m3u8' in real_url):
+                                    native_hls_record = shared_loop.run(check_native_support(
+                                        real_url, get_record_header_dict(platform, record_url), proxy_address))
+
                                 if only_flv_record:
                                     logger.info(f"Use Direct Downloader to Download FLV Stream: {record_url}")
-                                    filename = f'{dy_id}_{room_id}_{anchor_name}_{title_in_name}_' + now + '.flv'
+                                    name_format = "_%03d" if split_video_by_time else ""
+                                    filename = f'{dy_id}_{room_id}_{anchor_name}_{title_in_name}_{now}{name_format}.flv'
                                     save_file_path = f'{full_path}/{filename}'
                                     print(f'{rec_info}/{filename}')
 
-                                    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
-                                    subs_thread_name = f'subs_{Path(subs_file_path).name}'
-                                    if create_time_file:
-                                        create_var[subs_thread_name] = threading.Thread(
-                                            target=generate_subtitles, args=(record_name, subs_file_path)
-                                        )
-                                        create_var[subs_thread_name].daemon = True
-                                        create_var[subs_thread_name].start()
-
                                     try:
                                         flv_url = port_info.get('flv_url')
                                         if flv_url:
@@ -1437,6 +1857,9 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             download_success = direct_download_stream(
                                                 flv_url, save_file_path, record_name, record_url, platform
                                             )
+                                            if record_url not in url_comments and not exit_recording:
+                                                cdn_scores.record_session(
+                                                    get_url_host(flv_url), failed=not download_success)
 
                                             if download_success:
                                                 record_finished = True
@@ -1456,6 +1879,26 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             error_count += 1
                                             error_window.append(1)
 
+                                elif native_hls_record:
+                                    logger.info(f"Use Native HLS Downloader to Download Stream: {record_url}")
+                                    name_format = "_%03d" if split_video_by_time else ""
+                                    if split_video_by_time:
+                                        now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+                                    filename = f'{dy_id}_{room_id}_{anchor_name}_{title_in_name}_{now}{name_format}.ts'
+                                    print(f'{rec_info}/{filename}')
+                                    save_file_path = f'{full_path}/{filename}'
+                                    comment_end = hls_download_stream(
+                                        record_name,
+                                        record_url,
+                                        real_url,
+                                        save_file_path,
+                                        platform,
+                                        proxy_address,
+                                        custom_script
+                                    )
+                                    if comment_end:
+                                        return
+
                                 elif record_save_type == "FLV":
                                     filename =  f'{dy_id}_{room_id}_{anchor_name}_{title_in_name}_' + now + ".flv"
                                     print(f'{rec_info}/{filename}')
@@ -1508,21 +1951,18 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                         if converts_to_mp4:
                                             seg_file_path = f"{full_path}/{dy_id}_{room_id}_{anchor_name}_{title_in_name}_{now}_%03d.mp4"
                                             if split_video_by_time:
-                                                segment_video(
+                                                queue_segment_video(
                                                     save_file_path, seg_file_path,
                                                     segment_format='mp4', segment_time=split_time,
                                                     is_original_delete=delete_origin_file
                                                 )
                                             else:
-                                                threading.Thread(
-                                                    target=converts_mp4,
-                                                    args=(save_file_path, delete_origin_file)
-                                                ).start()
+                                                queue_recorded_files(record_name, [save_file_path], convert=True)
 
                                         else:
                                             seg_file_path = f"{full_path}/{dy_id}_{room_id}_{anchor_name}_{title_in_name}_{now}_%03d.flv"
                                             if split_video_by_time:
-                                                segment_video(
+                                                queue_segment_video(
                                                     save_file_path, seg_file_path,
                                                     segment_format='flv', segment_time=split_time,
                                                     is_original_delete=delete_origin_file
@@ -1595,7 +2035,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 "-segment_time", split_time,
                                                 "-segment_format", "mp4",
                                                 "-reset_timestamps", "1",
-                                                "-movflags", "+frag_keyframe+empty_moov",
+                                                "-movflags", FRAGMENTED_MOVFLAGS if fragmented_mp4 else "+frag_keyframe+empty_moov",
                                                 save_file_path,
                                             ]
 
@@ -1607,6 +2047,9 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 "-f", "mp4",
                                                 save_file_path,
                                             ]
+                                            if fragmented_mp4:
+                                                # 分片写入, 进程被杀时已写入的部分仍可播放
+                                                command[-1:-1] = ["-movflags", FRAGMENTED_MOVFLAGS]
 
                                         ffmpeg_command.extend(command)
                                         comment_end = check_subprocess(
@@ -1654,17 +2097,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             )
                                             if comment_end:
                                                 if converts_to_mp4:
-                                                    file_paths = utils.get_file_paths(os.path.dirname(save_file_path))
-                                                    prefix = os.path.basename(save_file_path).rsplit('_', maxsplit=1)[0]
-                                                    for path in file_paths:
-                                                        if prefix in path:
-                                                            try:
-                                                                threading.Thread(
-                                                                    target=converts_mp4,
-                                                                    args=(path, delete_origin_file)
-                                                                ).start()
-                                                            except subprocess.CalledProcessError as e:
-                                                                logger.error(f"转码失败: {e} ")
+                                                    for path in get_output_files([save_file_path]):
+                                                        queue_converts_mp4(path, delete_origin_file)
                                                 return
 
                                         except subprocess.CalledProcessError as e:
@@ -1697,9 +2131,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 custom_script
                                             )
                                             if comment_end:
-                                                threading.Thread(
-                                                    target=converts_mp4, args=(save_file_path, delete_origin_file)
-                                                ).start()
+                                                queue_recorded_files(record_name, [save_file_path], convert=True)
                                                 return
 
                                         except subprocess.CalledProcessError as e:
@@ -1708,6 +2140,13 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 error_count += 1
                                                 error_window.append(1)
 
+                                room_registry.release(record_url)
+                                disk_quota.release(record_url)
+                                record_extra_outputs.pop(record_name, None)
+                                session_stitcher.end(record_session_keys.pop(record_name, None))
+                                url_refresher = url_refreshers.pop(record_name, None)
+                                if url_refresher and url_refresher.switched:
+                                    refreshed_port_info = url_refresher.port_info
                                 count_time = time.time()
 
                 except Exception as e:
@@ -1736,6 +2175,10 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                 else:
                     x = num
 
+                # 直播流地址已提前刷新, 立即使用新地址继续录制
+                if refreshed_port_info:
+                    x = 0
+
                 # 这里是正常循环
                 while x:
                     x = x - 1
@@ -1940,6 +2383,31 @@ while True:
     enable_proxy_platform_list = enable_proxy_platform.replace('，', ',').split(',') if enable_proxy_platform else None
     extra_enable_proxy = read_config_value(config, '录制设置', '额外使用代理录制的平台(逗号分隔)', '')
     extra_enable_proxy_platform_list = extra_enable_proxy.replace('，', ',').split(',') if extra_enable_proxy else None
+    sign_socket_path = read_config_value(config, '录制设置', '签名服务套接字路径(留空则不启用)', "")
+    record_flush_interval = float(read_config_value(config, '录制设置', '直接下载文件刷新间隔(秒)', 5))
+    record_fsync = options.get(read_config_value(config, '录制设置', '直接下载刷新时是否fsync(是/否)', "否"), False)
+    keyframe_index.enabled = options.get(read_config_value(config, '录制设置', '录制时生成关键帧索引(是/否)', "否"), False)
+    extra_output_rules = parse_output_rules(read_config_value(config, '录制设置', '多路输出配置', ""))
+    retention_rules = read_config_value(config, '录制设置', '录制文件保留策略', "")
+    disk_predict_hours = float(read_config_value(config, '录制设置', '磁盘预留录制时长(小时)', 2))
+    archive_save_path = read_config_value(config, '录制设置', '归档保存路径(不填则不启用)', "")
+    archive_bandwidth = float(read_config_value(config, '录制设置', '归档搬运限速(MB/s,0为不限)', 0))
+    archive_workers = int(read_config_value(config, '录制设置', '归档搬运并发数', 1))
+    stitch_gap = float(read_config_value(config, '录制设置', '断流续录合并间隔(秒,0为不合并)', 300))
+    postprocess_workers = int(read_config_value(config, '录制设置', '后处理并发数(0为自动)', 0))
+    danmaku_flush_interval = float(read_config_value(config, '录制设置', '弹幕文件刷新间隔(秒)', 5))
+    danmaku_rotate_size = float(read_config_value(config, '录制设置', '弹幕文件轮转大小(MB,0为不轮转)', 0))
+    danmaku_compress = options.get(read_config_value(config, '录制设置', '弹幕文件gzip压缩(是/否)', "否"), False)
+    danmaku_file_format = read_config_value(config, '录制设置', '弹幕文件格式(json/bin)', "json").strip().lower()
+    danmaku_sink.configure(danmaku_flush_interval, int(danmaku_rotate_size * 1024 * 1024), danmaku_compress,
+                           danmaku_file_format)
+    postprocess_queue.set_workers(postprocess_workers or DEFAULT_WORKERS)
+    stall_watchdog.window = float(read_config_value(config, '录制设置', '录制卡顿判定时间(秒,0为不检测)', 30))
+    seamless_switch = options.get(read_config_value(config, '录制设置', '切换直播流地址时无缝衔接(是/否)', "是"), True)
+    fragmented_mp4 = options.get(read_config_value(config, '录制设置', 'mp4格式录制使用分片MP4(是/否)', "否"), False)
+    ts_record_as_fmp4 = options.get(
+        read_config_value(config, '录制设置', 'ts转mp4时直接录制为分片MP4(是/否)', "否"), False)
+    native_hls_download = options.get(read_config_value(config, '录制设置', 'ts格式使用内置HLS下载器(是/否)', "否"), False)
     live_status_push = read_config_value(config, '推送配置', '直播状态推送渠道', "")
     dingtalk_api_url = read_config_value(config, '推送配置', '钉钉推送接口链接', "")
     xizhi_api_url = read_config_value(config, '推送配置', '微信推送接口链接', "")
@@ -2037,10 +2505,23 @@ while True:
     else:
         video_save_type = "TS"
 
+    sign_server.set_socket_path(sign_socket_path)
+    if sign_socket_path:
+        sign_server.ensure_server(sign_socket_path)
+
     check_path = video_save_path or default_path
-    if utils.check_disk_capacity(check_path, show=first_run) < disk_space_limit:
-        exit_recording = True
-        if not recording:
+    archive_mover.configure(check_path, archive_save_path, archive_bandwidth * 1024 * 1024, archive_workers)
+    disk_quota.configure(check_path, disk_space_limit, retention_rules, disk_predict_hours * 3600)
+    session_stitcher.configure(stitch_gap)
+    free_space = utils.check_disk_capacity(check_path, show=first_run)
+    if disk_quota.update(int(free_space * 1024 ** 3)) == DISK_CRITICAL:
+        # 空间不足时每次只停止一个优先级最低的录制, 给保留策略清理留出时间
+        active_urls = [url for url, event in stop_events.items() if not event.is_set()]
+        victim_url = disk_quota.pick_victim(active_urls)
+        if victim_url:
+            logger.warning(f"Disk space remaining is below {disk_space_limit} GB, stop recording {victim_url}")
+            stop_events[victim_url].set()
+        elif not recording:
             logger.warning(f"Disk space remaining is below {disk_space_limit} GB. "
                            f"Exiting program due to the disk space limit being reached.")
             sys.exit(-1)
@@ -2228,6 +2709,7 @@ while True:
                     new_word = replace_words[1]
                 update_file(url_config_file, old_str=replace_words[0], new_str=new_word, start_str=start_with)
 
+        signal_stop_events()
         text_no_repeat_url = list(set(url_tuples_list))
 
         if len(text_no_repeat_url) > 0:
@@ -2253,6 +2735,9 @@ while True:
         logger.error(f"错误信息: {err} 发生错误的行数: {err.__traceback__.tb_lineno}")
 
     if first_run:
+        # 继续执行上次退出时未完成的转码/分段任务
+        postprocess_queue.start()
+        session_stitcher.start()
         t = threading.Thread(target=display_info, args=(), daemon=True)
         t.start()
         t2 = threading.Thread(target=adjust_max_request, args=(), daemon=True)
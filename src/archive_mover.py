@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""
+录制文件分层存储
+录制和后处理都在本地高速的临时目录完成, 后台定期把已经完成的文件搬运到归档目录(如 NAS),
+搬运时限速、边复制边计算 sha256 并在写入完成后回读校验, 校验通过才删除本地文件,
+归档目录的延迟不会影响正在进行的录制
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from .logger import logger, script_path
+from .postprocess_queue import PostProcessQueue, postprocess_queue
+
+ARCHIVE_JOBS_FILE = f'{script_path}/config/archive_jobs.json'
+SCAN_INTERVAL = 60
+# 文件超过该时间未修改才认为已经写完
+SETTLE_TIME = 300
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+MOVE_RETRIES = 3
+TEMP_SUFFIXES = ('.part', '.tmp', '.segments.csv')
+
+
+class ArchiveVerifyError(Exception):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, rate: float = 0):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.allowance = 0.0
+        self.last = time.monotonic()
+
+    def consume(self, size: int) -> None:
+        # 所有搬运线程共享同一个限速, 令牌不足时等待
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate) - size
+            self.last = now
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def _hash_file(path: str, limiter: RateLimiter) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            limiter.consume(len(chunk))
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArchiveMover:
+    def __init__(self, jobs_file: str = ARCHIVE_JOBS_FILE):
+        self.scratch_root = ''
+        self.archive_root = ''
+        self.limiter = RateLimiter()
+        self.settle_time = SETTLE_TIME
+        self.queue = PostProcessQueue(jobs_file=jobs_file, workers=1)
+        self.queue.register('archive', self.move)
+        self.lock = threading.Lock()
+        self.holds: dict[str, int] = {}
+        self.thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.scratch_root and self.archive_root)
+
+    def configure(self, scratch_root: str, archive_root: str, bandwidth: float = 0, workers: int = 1) -> None:
+        if scratch_root and archive_root:
+            scratch = os.path.normcase(os.path.realpath(scratch_root))
+            archive = os.path.normcase(os.path.realpath(archive_root))
+            # 归档目录在录制目录内时扫描会把已归档的文件再次加入队列
+            if archive == scratch or archive.startswith(scratch.rstrip(os.sep) + os.sep):
+                logger.warning(f"Archive path {archive_root} must be outside the save path {scratch_root}, "
+                               f"archiving is disabled")
+                archive_root = ''
+        self.scratch_root = scratch_root
+        self.archive_root = archive_root
+        self.limiter.rate = bandwidth
+        self.queue.set_workers(workers)
+        if self.enabled and (self.thread is None or not self.thread.is_alive()):
+            self.queue.start()
+            self.thread = threading.Thread(target=self._scan_loop, name='archive-scan', daemon=True)
+            self.thread.start()
+
+    def hold(self, prefix: str) -> None:
+        # 正在录制的文件(按输出路径前缀)不搬运, 录制结束后的后处理任务仍在排队时也不搬运
+        prefix = os.path.normpath(prefix)
+        with self.lock:
+            self.holds[prefix] = self.holds.get(prefix, 0) + 1
+
+    def release(self, prefix: str) -> None:
+        prefix = os.path.normpath(prefix)
+        with self.lock:
+            count = self.holds.get(prefix, 0) - 1
+            if count > 0:
+                self.holds[prefix] = count
+            else:
+                self.holds.pop(prefix, None)
+
+    def is_held(self, path: str) -> bool:
+        path = os.path.normpath(path)
+        with self.lock:
+            return any(path.startswith(prefix) for prefix in self.holds)
+
+    def get_archive_path(self, path: str) -> str:
+        return os.path.join(self.archive_root, os.path.relpath(path, self.scratch_root))
+
+    def _scan_loop(self) -> None:
+        while True:
+            time.sleep(SCAN_INTERVAL)
+            if not self.enabled:
+                continue
+            try:
+                self.scan()
+            except Exception as e:
+                logger.warning(f"Archive scan failed: {e}")
+
+    def scan(self) -> int:
+        now = time.time()
+        queued = {job['args'][0] for job in self.queue.jobs()}
+        # 等待转码/分段的文件由后处理任务读取, 处理完再搬运
+        busy_paths = postprocess_queue.busy_paths()
+        count = 0
+        for root, _, files in os.walk(self.scratch_root):
+            for file in files:
+                path = os.path.join(root, file)
+                if (path in queued or path in busy_paths or file.endswith(TEMP_SUFFIXES)
+                        or self.is_held(path)):
+                    continue
+                try:
+                    if now - os.path.getmtime(path) < self.settle_time:
+                        continue
+                except OSError:
+                    continue
+                self.queue.submit('archive', path)
+                count += 1
+        return count
+
+    def _copy(self, path: str, archive_path: str) -> None:
+        tmp_path = archive_path + '.part'
+        digest = hashlib.sha256()
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            while chunk := src.read(COPY_CHUNK_SIZE):
+                self.limiter.consume(len(chunk))
+                digest.update(chunk)
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        # 回读归档目录中的文件校验, 确认网络存储上的数据完整后才删除本地文件
+        if _hash_file(tmp_path, self.limiter) != digest.hexdigest():
+            os.remove(tmp_path)
+            raise ArchiveVerifyError(f"Checksum mismatch after copying {path}")
+        shutil.copystat(path, tmp_path)
+        os.replace(tmp_path, archive_path)
+
+    def move(self, path: str) -> bool:
+        if not os.path.exists(path) or self.is_held(path):
+            return False
+        archive_path = self.get_archive_path(path)
+        for attempt in range(1, MOVE_RETRIES + 1):
+            try:
+                os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+                if os.stat(path).st_dev == os.stat(os.path.dirname(archive_path)).st_dev:
+                    os.replace(path, archive_path)
+                else:
+                    self._copy(path, archive_path)
+                    os.remove(path)
+                logger.debug(f"Archived {path} -> {archive_path}")
+                return True
+            except (OSError, ArchiveVerifyError) as e:
+                logger.warning(f"Archive attempt {attempt} failed for {path}: {e}")
+                if attempt < MOVE_RETRIES:
+                    time.sleep(5 * attempt)
+        return False
+
+
+archive_mover = ArchiveMover()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+from .logger import logger, script_path
+
+CDN_SCORE_FILE = f'{script_path}/config/cdn_scores.json'
+EWMA_ALPHA = 0.3
+SAVE_INTERVAL = 30
+# 没有历史数据的节点使用的先验值, 略优于平均水平以便新节点能被尝试
+DEFAULT_LATENCY = 0.5
+FAILURE_WEIGHT = 5.0
+STALL_WEIGHT = 2.0
+
+
+def get_url_host(url: str | None) -> str:
+    if not url:
+        return ''
+    return (urlparse(url).hostname or '').lower()
+
+
+class CdnScoreBoard:
+    def __init__(self, file_path: str = CDN_SCORE_FILE, alpha: float = EWMA_ALPHA):
+        self.file_path = file_path
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.hosts: dict[str, dict] = {}
+        self.last_save = 0.0
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.hosts = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load CDN scores: {e}")
+            self.hosts = {}
+
+    def save(self, force: bool = False) -> None:
+        with self.lock:
+            if not force and time.time() - self.last_save < SAVE_INTERVAL:
+                return
+            self.last_save = time.time()
+            data = json.dumps(self.hosts, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            tmp_path = self.file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.file_path)
+        except OSError as e:
+            logger.warning(f"Failed to save CDN scores: {e}")
+
+    def _ewma(self, old: float | None, value: float) -> float:
+        if old is None:
+            return value
+        return old + self.alpha * (value - old)
+
+    def _entry(self, host: str) -> dict:
+        return self.hosts.setdefault(host, {
+            'connect': None, 'ttfb': None, 'failure': 0.0, 'stall': 0.0,
+            'sessions': 0, 'failures': 0, 'stalls': 0, 'updated': 0
+        })
+
+    def record_probe(self, host: str, connect_time: float | None = None, ttfb: float | None = None,
+                     ok: bool = True) -> None:
+        if not host:
+            return
+        with self.lock:
+            entry = self._entry(host)
+            if connect_time is not None:
+                entry['connect'] = self._ewma(entry['connect'], connect_time)
+            if ttfb is not None:
+                entry['ttfb'] = self._ewma(entry['ttfb'], ttfb)
+            entry['failure'] = self._ewma(entry['failure'], 0.0 if ok else 1.0)
+            entry['updated'] = int(time.time())
+        self.save()
+
+    def record_session(self, host: str, failed: bool = False, stalled: bool = False) -> None:
+        if not host:
+            return
+        with self.lock:
+            entry = self._entry(host)
+            entry['sessions'] += 1
+            entry['failures'] += int(failed)
+            entry['stalls'] += int(stalled)
+            entry['failure'] = self._ewma(entry['failure'], 1.0 if failed else 0.0)
+            entry['stall'] = self._ewma(entry['stall'], 1.0 if stalled else 0.0)
+            entry['updated'] = int(time.time())
+        self.save(force=True)
+
+    def score(self, host: str) -> float:
+        entry = self.hosts.get(host)
+        if not entry:
+            return DEFAULT_LATENCY * 2
+        connect = entry['connect'] if entry['connect'] is not None else DEFAULT_LATENCY
+        ttfb = entry['ttfb'] if entry['ttfb'] is not None else DEFAULT_LATENCY
+        return connect + ttfb + FAILURE_WEIGHT * entry['failure'] + STALL_WEIGHT * entry['stall']
+
+    def rank(self, items: list, key=get_url_host) -> list:
+        return sorted(items, key=lambda item: self.score(key(item)))
+
+
+cdn_scores = CdnScoreBoard()
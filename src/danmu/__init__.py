@@ -6,6 +6,9 @@
 """
 
 from .base import DanmakuBase
+from .hub import DanmakuHub, danmaku_hub
+from .sink import DanmakuSink, danmaku_sink
+from .archive import ArchiveReader, convert_to_ass, convert_to_jsonl, convert_to_xml
 from .douyin_impl import DouyinDanmaku
 from .kuaishou import KuaishouDanmaku
 from .xiaohongshu import XiaohongshuDanmaku
@@ -13,6 +16,14 @@ from .utils import DanmakuUtils
 
 __all__ = [
     'DanmakuBase',
+    'DanmakuHub',
+    'danmaku_hub',
+    'DanmakuSink',
+    'danmaku_sink',
+    'ArchiveReader',
+    'convert_to_jsonl',
+    'convert_to_xml',
+    'convert_to_ass',
     'DouyinDanmaku',
     'KuaishouDanmaku',
     'XiaohongshuDanmaku',
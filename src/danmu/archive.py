@@ -0,0 +1,462 @@
+# -*- encoding: utf-8 -*-
+
+"""
+弹幕二进制归档格式
+文件以 MAGIC 开头, 之后是一串以 varint 长度为前缀的记录, 记录第一个字节为记录类型:
+会话记录写入会话开始时间和平台/房间号并清空字符串表; 字符串记录把用户名、用户 id 等重复出现的字符串追加到字符串表,
+弹幕记录只引用表中的序号; 弹幕记录中时间戳为相对会话开始的毫秒数, 消息类型为枚举值,
+与会话相同的平台/房间号以及与时间戳相同的 id 只记录一个标志位, 其他字段按值类型紧凑编码
+"""
+
+import argparse
+import gzip
+import json
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+MAGIC = b'DMKA\x01'
+FILE_SUFFIX = '.danmu.bin'
+
+RECORD_SESSION = 0
+RECORD_STRING = 1
+RECORD_DANMAKU = 2
+
+TYPES = ('danmaku', 'chat', 'gift', 'like', 'enter', 'follow')
+TYPE_CODES = {name: code for code, name in enumerate(TYPES, start=1)}
+TYPE_ABSENT = 0
+TYPE_OTHER = len(TYPES) + 1
+
+VALUE_ABSENT = 0
+VALUE_NONE = 1
+VALUE_FALSE = 2
+VALUE_TRUE = 3
+VALUE_INT = 4
+VALUE_FLOAT = 5
+VALUE_STRING = 6
+VALUE_TEXT = 7
+VALUE_JSON = 8
+
+FLAG_RELATIVE_TIME = 1
+FLAG_PLATFORM = 2
+FLAG_ROOM_ID = 4
+FLAG_ID = 8
+FLAG_EXTRA = 16
+FLAG_NO_TIMESTAMP = 32
+
+# 按固定顺序编码的字段, 弹幕内容基本不重复, 不放入字符串表
+VALUE_FIELDS = ('user_id', 'username', 'content', 'color', 'font_size')
+TEXT_FIELDS = ('content',)
+# 超过该长度的其他字符串直接内联
+INTERN_MAX_LENGTH = 32
+
+FLOAT = struct.Struct('<d')
+_ABSENT = object()
+TEXT_TYPES = ('danmaku', 'chat')
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _write_text(out: bytearray, text: str) -> None:
+    data = text.encode('utf-8')
+    write_varint(out, len(data))
+    out += data
+
+
+def _read_text(data: bytes, pos: int) -> tuple[str, int]:
+    length, pos = read_varint(data, pos)
+    return data[pos:pos + length].decode('utf-8'), pos + length
+
+
+class ArchiveEncoder:
+    """
+    一个编码器对应一个文件, 文件轮转后需要使用新的编码器
+    """
+
+    def __init__(self):
+        self.strings: Dict[str, int] = {}
+        self.started: Optional[int] = None
+        self.platform = None
+        self.room_id = None
+
+    def encode(self, danmakus: Iterable[Dict[str, Any]]) -> bytes:
+        out = bytearray()
+        for danmaku in danmakus:
+            if self.started is None:
+                self._begin(out, danmaku)
+            self._encode_danmaku(out, danmaku)
+        return bytes(out)
+
+    def _begin(self, out: bytearray, danmaku: Dict[str, Any]) -> None:
+        timestamp = danmaku.get('timestamp')
+        self.started = timestamp if type(timestamp) is int else 0
+        self.platform = danmaku.get('platform')
+        self.room_id = danmaku.get('room_id')
+        payload = bytearray([RECORD_SESSION])
+        write_varint(payload, zigzag(self.started))
+        self._write_value(out, payload, self.platform, intern=False)
+        self._write_value(out, payload, self.room_id, intern=False)
+        write_varint(out, len(payload))
+        out += payload
+
+    def _intern(self, out: bytearray, text: str) -> int:
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+            payload = bytearray([RECORD_STRING])
+            _write_text(payload, text)
+            write_varint(out, len(payload))
+            out += payload
+        return index
+
+    def _write_value(self, out: bytearray, payload: bytearray, value: Any, intern: bool = True) -> None:
+        # 新出现的字符串记录写入 out, 位于引用它的弹幕记录之前
+        if value is None:
+            payload.append(VALUE_NONE)
+        elif value is True or value is False:
+            payload.append(VALUE_TRUE if value else VALUE_FALSE)
+        elif type(value) is int:
+            payload.append(VALUE_INT)
+            write_varint(payload, zigzag(value))
+        elif type(value) is float:
+            payload.append(VALUE_FLOAT)
+            payload += FLOAT.pack(value)
+        elif type(value) is str:
+            if intern and len(value) <= INTERN_MAX_LENGTH:
+                payload.append(VALUE_STRING)
+                write_varint(payload, self._intern(out, value))
+            else:
+                payload.append(VALUE_TEXT)
+                _write_text(payload, value)
+        else:
+            payload.append(VALUE_JSON)
+            _write_text(payload, json.dumps(value, ensure_ascii=False, default=str))
+
+    def _encode_danmaku(self, out: bytearray, danmaku: Dict[str, Any]) -> None:
+        extra = dict(danmaku)
+        flags = 0
+        timestamp = extra.pop('timestamp', None)
+        if type(timestamp) is not int:
+            flags |= FLAG_NO_TIMESTAMP
+            if 'timestamp' in danmaku:
+                extra['timestamp'] = timestamp
+        elif 'id' in extra and extra['id'] == str(timestamp):
+            flags |= FLAG_ID
+            del extra['id']
+        relative_time = extra.pop('relative_time', None)
+        # 只有精确到毫秒的时间才能无损按整数毫秒保存
+        if type(relative_time) is float and round(relative_time * 1000) / 1000 == relative_time:
+            flags |= FLAG_RELATIVE_TIME
+        elif 'relative_time' in danmaku:
+            extra['relative_time'] = relative_time
+        if 'platform' in extra and extra['platform'] == self.platform:
+            flags |= FLAG_PLATFORM
+            del extra['platform']
+        if 'room_id' in extra and extra['room_id'] == self.room_id:
+            flags |= FLAG_ROOM_ID
+            del extra['room_id']
+        message_type = extra.pop('type', None)
+        values = [extra.pop(field, _ABSENT) for field in VALUE_FIELDS]
+        if extra:
+            flags |= FLAG_EXTRA
+
+        payload = bytearray([RECORD_DANMAKU])
+        write_varint(payload, flags)
+        if not flags & FLAG_NO_TIMESTAMP:
+            write_varint(payload, zigzag(timestamp - self.started))
+        if message_type is None and 'type' not in danmaku:
+            payload.append(TYPE_ABSENT)
+        elif type(message_type) is str and message_type in TYPE_CODES:
+            payload.append(TYPE_CODES[message_type])
+        else:
+            payload.append(TYPE_OTHER)
+            self._write_value(out, payload, message_type)
+        if flags & FLAG_RELATIVE_TIME:
+            write_varint(payload, zigzag(round(relative_time * 1000)))
+        for field, value in zip(VALUE_FIELDS, values):
+            if value is _ABSENT:
+                payload.append(VALUE_ABSENT)
+            else:
+                self._write_value(out, payload, value, intern=field not in TEXT_FIELDS)
+        if extra:
+            write_varint(payload, len(extra))
+            for key, value in extra.items():
+                write_varint(payload, self._intern(out, str(key)))
+                self._write_value(out, payload, value)
+        write_varint(out, len(payload))
+        out += payload
+
+
+class ArchiveReader:
+    def __init__(self, path: str):
+        self.path = path
+        self.started: Optional[int] = None
+        self.platform = None
+        self.room_id = None
+
+    def _load(self) -> bytes:
+        opener = gzip.open if self.path.endswith('.gz') else open
+        with opener(self.path, 'rb') as f:
+            data = f.read()
+        if data and not data.startswith(MAGIC):
+            raise ValueError(f"not a danmaku archive: {self.path}")
+        return data
+
+    def read(self, since: Optional[int] = None, until: Optional[int] = None,
+             types: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        按写入顺序返回弹幕, 不满足条件的记录只解析时间和类型后直接跳过
+
+        Args:
+            since: 只返回时间戳(毫秒)不早于该值的弹幕
+            until: 只返回时间戳(毫秒)早于该值的弹幕
+            types: 只返回这些类型的弹幕
+        """
+        data = self._load()
+        types = set(types) if types is not None else None
+        strings: List[str] = []
+        started = 0
+        pos = len(MAGIC) if data else 0
+        size = len(data)
+        while pos < size:
+            try:
+                length, start = read_varint(data, pos)
+            except IndexError:
+                break
+            end = start + length
+            if end > size:
+                # 异常退出时最后一条记录可能不完整
+                break
+            pos = end
+            kind = data[start]
+            if kind == RECORD_STRING:
+                strings.append(_read_text(data, start + 1)[0])
+            elif kind == RECORD_SESSION:
+                value, cursor = read_varint(data, start + 1)
+                started = unzigzag(value)
+                self.platform, cursor = self._read_value(data, cursor, strings)
+                self.room_id, cursor = self._read_value(data, cursor, strings)
+                if self.started is None:
+                    self.started = started
+                strings = []
+            elif kind == RECORD_DANMAKU:
+                danmaku = self._decode_danmaku(data, start + 1, strings, started, since, until, types)
+                if danmaku is not None:
+                    yield danmaku
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.read()
+
+    @staticmethod
+    def _read_value(data: bytes, pos: int, strings: List[str]) -> tuple[Any, int]:
+        tag = data[pos]
+        pos += 1
+        if tag == VALUE_NONE:
+            return None, pos
+        if tag == VALUE_FALSE or tag == VALUE_TRUE:
+            return tag == VALUE_TRUE, pos
+        if tag == VALUE_INT:
+            value, pos = read_varint(data, pos)
+            return unzigzag(value), pos
+        if tag == VALUE_FLOAT:
+            return FLOAT.unpack_from(data, pos)[0], pos + FLOAT.size
+        if tag == VALUE_STRING:
+            index, pos = read_varint(data, pos)
+            return strings[index], pos
+        if tag == VALUE_TEXT:
+            return _read_text(data, pos)
+        if tag == VALUE_JSON:
+            text, pos = _read_text(data, pos)
+            return json.loads(text), pos
+        return _ABSENT, pos
+
+    def _decode_danmaku(self, data: bytes, pos: int, strings: List[str], started: int, since: Optional[int],
+                        until: Optional[int], types: Optional[set]) -> Optional[Dict[str, Any]]:
+        flags, pos = read_varint(data, pos)
+        timestamp = None
+        if not flags & FLAG_NO_TIMESTAMP:
+            value, pos = read_varint(data, pos)
+            timestamp = started + unzigzag(value)
+        if since is not None or until is not None:
+            if timestamp is None or (since is not None and timestamp < since) or \
+                    (until is not None and timestamp >= until):
+                return None
+        code = data[pos]
+        pos += 1
+        if code == TYPE_OTHER:
+            message_type, pos = self._read_value(data, pos, strings)
+        else:
+            message_type = TYPES[code - 1] if code != TYPE_ABSENT else _ABSENT
+        if types is not None and message_type not in types:
+            return None
+
+        danmaku: Dict[str, Any] = {}
+        if flags & FLAG_ID:
+            danmaku['id'] = str(timestamp)
+        if timestamp is not None:
+            danmaku['timestamp'] = timestamp
+        if flags & FLAG_RELATIVE_TIME:
+            value, pos = read_varint(data, pos)
+            danmaku['relative_time'] = unzigzag(value) / 1000
+        for field in VALUE_FIELDS:
+            value, pos = self._read_value(data, pos, strings)
+            if value is not _ABSENT:
+                danmaku[field] = value
+            if field == 'content' and message_type is not _ABSENT:
+                danmaku['type'] = message_type
+        if flags & FLAG_PLATFORM:
+            danmaku['platform'] = self.platform
+        if flags & FLAG_ROOM_ID:
+            danmaku['room_id'] = self.room_id
+        if flags & FLAG_EXTRA:
+            count, pos = read_varint(data, pos)
+            for _ in range(count):
+                index, pos = read_varint(data, pos)
+                danmaku[strings[index]], pos = self._read_value(data, pos, strings)
+        return danmaku
+
+
+def _relative_seconds(danmaku: Dict[str, Any], started: Optional[int]) -> Optional[float]:
+    if 'relative_time' in danmaku:
+        return danmaku['relative_time']
+    timestamp = danmaku.get('timestamp')
+    if timestamp is None or started is None:
+        return None
+    return (timestamp - started) / 1000
+
+
+def _color_value(color: Any) -> int:
+    try:
+        return int(str(color).lstrip('#'), 16)
+    except ValueError:
+        return 0xFFFFFF
+
+
+def _get_output_path(path: str, suffix: str) -> str:
+    base = path[:-3] if path.endswith('.gz') else path
+    if base.endswith(FILE_SUFFIX):
+        base = base[:-len(FILE_SUFFIX)]
+    return f'{base}{suffix}'
+
+
+def convert_to_jsonl(path: str, output_path: Optional[str] = None) -> str:
+    """
+    转换为与 .danmu.json 相同的每行一条 JSON
+    """
+    output_path = output_path or _get_output_path(path, '.danmu.json')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for danmaku in ArchiveReader(path):
+            f.write(json.dumps(danmaku, ensure_ascii=False) + '\n')
+    return output_path
+
+
+def convert_to_xml(path: str, output_path: Optional[str] = None, types: Iterable[str] = TEXT_TYPES) -> str:
+    """
+    转换为 B 站格式的 XML 弹幕, 时间以录制开始为零点
+    """
+    output_path = output_path or _get_output_path(path, '.xml')
+    reader = ArchiveReader(path)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<i>\n')
+        for index, danmaku in enumerate(reader.read(types=types)):
+            seconds = _relative_seconds(danmaku, reader.started)
+            if seconds is None:
+                continue
+            attrs = ','.join(str(value) for value in (
+                f'{max(seconds, 0):.3f}', 1, danmaku.get('font_size', 25), _color_value(danmaku.get('color')),
+                danmaku.get('timestamp', 0) // 1000, 0, danmaku.get('user_id', ''), index
+            ))
+            content = escape(str(danmaku.get('content', '')))
+            f.write(f'  <d p={quoteattr(attrs)}>{content}</d>\n')
+        f.write('</i>\n')
+    return output_path
+
+
+def _format_ass_time(seconds: float) -> str:
+    centiseconds = int(round(seconds * 100))
+    s, cs = divmod(centiseconds, 100)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return f'{h}:{m:02d}:{s:02d}.{cs:02d}'
+
+
+def convert_to_ass(path: str, output_path: Optional[str] = None, types: Iterable[str] = TEXT_TYPES,
+                   width: int = 1920, height: int = 1080, font_size: int = 48, duration: float = 8) -> str:
+    """
+    转换为从右向左滚动的 ASS 字幕, 按行分配位置, 同一行的弹幕完全进入画面后才放下一条
+    """
+    output_path = output_path or _get_output_path(path, '.ass')
+    reader = ArchiveReader(path)
+    rows = max(1, height // 2 // (font_size + 4))
+    row_free = [0.0] * rows
+    with open(output_path, 'w', encoding='utf-8-sig') as f:
+        f.write(
+            "[Script Info]\nScriptType: v4.00+\n"
+            f"PlayResX: {width}\nPlayResY: {height}\n\n"
+            "[V4+ Styles]\n"
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+            "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, "
+            "MarginR, MarginV, Encoding\n"
+            f"Style: Danmaku,Microsoft YaHei,{font_size},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,0,0,0,0,"
+            "100,100,0,0,1,1,0,7,0,0,0,1\n\n"
+            "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        )
+        for danmaku in reader.read(types=types):
+            start = _relative_seconds(danmaku, reader.started)
+            if start is None or start < 0:
+                continue
+            text = str(danmaku.get('content', '')).replace('\n', ' ').replace('{', '｛').replace('}', '｝')
+            if not text:
+                continue
+            text_width = len(text) * font_size
+            row = next((index for index, free in enumerate(row_free) if free <= start),
+                       min(range(rows), key=row_free.__getitem__))
+            row_free[row] = start + duration * text_width / (width + text_width)
+            y = row * (font_size + 4)
+            color = _color_value(danmaku.get('color'))
+            tags = f'\\move({width},{y},{-text_width},{y})'
+            if color != 0xFFFFFF:
+                tags += f'\\c&H{color & 0xFF:02X}{color >> 8 & 0xFF:02X}{color >> 16:02X}&'
+            f.write(f'Dialogue: 0,{_format_ass_time(start)},{_format_ass_time(start + duration)},'
+                    f'Danmaku,,0,0,0,,{{{tags}}}{text}\n')
+    return output_path
+
+
+CONVERTERS = {'jsonl': convert_to_jsonl, 'xml': convert_to_xml, 'ass': convert_to_ass}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Convert danmaku archive (.danmu.bin)')
+    parser.add_argument('path', help='archive path')
+    parser.add_argument('--format', choices=CONVERTERS, default='jsonl', help='output format')
+    parser.add_argument('--output', help='output path')
+    args = parser.parse_args()
+    print(CONVERTERS[args.format](args.path, args.output))
+
+
+if __name__ == '__main__':
+    main()
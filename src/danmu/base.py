@@ -3,15 +3,135 @@
 """
 弹幕获取基础类
 定义通用的弹幕获取接口和方法
+连接由弹幕连接中心(hub.py)统一维护, 各平台只需要提供连接地址、进房/心跳消息和消息解析
 """
 
 import abc
 import asyncio
 import json
 import time
+from collections import deque
+from functools import partial
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+DEFAULT_BUFFER_SIZE = 1000
+
+
+def _set_waiter_result(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class DanmakuBuffer:
+    """
+    有界弹幕环形缓冲区
+    写入为单生产者无锁操作(deque 的 append/popleft 是原子操作), 写满时丢弃最旧的一条并计数;
+    读取一次取出全部数据, 不复制或重建缓冲区; 生产者和消费者都可以异步等待, 各自只支持一个等待者
+    """
+    
+    def __init__(self, capacity: int = DEFAULT_BUFFER_SIZE):
+        """
+        Args:
+            capacity: 缓冲区容量
+        """
+        self.capacity = capacity
+        self._items = deque(maxlen=capacity)
+        self.total = 0
+        self.dropped = 0
+        self._reported_drops = 0
+        self._data_waiter = None
+        self._space_waiter = None
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def put_nowait(self, item: Any) -> bool:
+        """
+        写入一条数据, 缓冲区已满时丢弃最旧的一条
+        
+        Returns:
+            bool: 是否写入时没有发生丢弃
+        """
+        full = len(self._items) >= self.capacity
+        if full:
+            self.dropped += 1
+        self._items.append(item)
+        self.total += 1
+        if self._data_waiter is not None:
+            self._wake('_data_waiter')
+        return not full
+    
+    async def put(self, item: Any, timeout: Optional[float] = None) -> bool:
+        """
+        缓冲区已满时等待消费者取走数据(背压), 超时后仍然写入并丢弃最旧的一条
+        
+        Returns:
+            bool: 是否写入时没有发生丢弃
+        """
+        if len(self._items) >= self.capacity:
+            await self._wait('_space_waiter', timeout, lambda: len(self._items) < self.capacity)
+        return self.put_nowait(item)
+    
+    def drain(self, limit: Optional[int] = None) -> List[Any]:
+        """
+        取出缓冲区中的数据
+        
+        Args:
+            limit: 最多取出的条数, None 表示全部
+            
+        Returns:
+            List[Any]: 按写入顺序排列的数据
+        """
+        count = len(self._items) if limit is None else min(limit, len(self._items))
+        popleft = self._items.popleft
+        items = [popleft() for _ in range(count)]
+        if items and self._space_waiter is not None:
+            self._wake('_space_waiter')
+        return items
+    
+    async def get(self, timeout: Optional[float] = None, limit: Optional[int] = None) -> List[Any]:
+        """
+        等待直到缓冲区有数据后取出, 超时返回空列表
+        """
+        if not self._items:
+            await self._wait('_data_waiter', timeout, lambda: bool(self._items))
+        return self.drain(limit)
+    
+    def snapshot(self) -> List[Any]:
+        return list(self._items)
+    
+    def clear(self):
+        self._items.clear()
+    
+    def take_dropped(self) -> int:
+        """
+        返回上次调用以来新丢弃的条数
+        """
+        dropped = self.dropped - self._reported_drops
+        self._reported_drops = self.dropped
+        return dropped
+    
+    def _wake(self, name: str):
+        waiter = getattr(self, name)
+        setattr(self, name, None)
+        if waiter is not None:
+            loop, future = waiter
+            # 生产者可能在其他线程(如独立运行的抖音抓取线程)
+            loop.call_soon_threadsafe(_set_waiter_result, future)
+    
+    async def _wait(self, name: str, timeout: Optional[float], ready):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        setattr(self, name, (loop, future))
+        # 注册等待后再检查一次, 避免错过注册前发生的写入或读取
+        if not ready():
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                pass
+        setattr(self, name, None)
+
 
 class DanmakuBase(metaclass=abc.ABCMeta):
     """
@@ -33,36 +153,116 @@ class DanmakuBase(metaclass=abc.ABCMeta):
         self.logger = logger
         self.is_running = False
         self.start_time = None
-        self.danmaku_buffer = []
-        self.max_buffer_size = 1000
+        self.max_buffer_size = DEFAULT_BUFFER_SIZE
+        self.danmaku_buffer = DanmakuBuffer(self.max_buffer_size)
         self._stop_event = asyncio.Event()
         self.platform = "unknown"
+        # 心跳间隔(秒), 0 表示不发送心跳
+        self.heartbeat_interval = 0
+        # 阻塞操作使用的线程池, 由弹幕连接中心设置
+        self.executor = None
+        self.hub_session = None
     
-    @abc.abstractmethod
     async def connect(self) -> bool:
         """
-        连接到弹幕服务器
+        连接到弹幕服务器, 收到的弹幕写入缓冲区, 通过 get_danmaku 读取
         
         Returns:
             bool: 连接是否成功
         """
-        pass
+        # 延迟导入避免循环依赖
+        from .hub import danmaku_hub
+        if self.hub_session is None:
+            self.hub_session = danmaku_hub.start(
+                self, lambda danmakus: [self.add_to_buffer(danmaku) for danmaku in danmakus])
+        return True
     
-    @abc.abstractmethod
     async def disconnect(self):
         """
         断开与弹幕服务器的连接
         """
-        pass
+        from .hub import danmaku_hub
+        if self.hub_session is not None:
+            session, self.hub_session = self.hub_session, None
+            # 可能在事件循环内调用, 只投递关闭任务不等待
+            danmaku_hub.stop(session, timeout=None)
     
-    @abc.abstractmethod
     async def get_danmaku(self) -> List[Dict[str, Any]]:
         """
-        获取弹幕数据
+        获取并清空缓冲区中的弹幕数据
         
         Returns:
             List[Dict[str, Any]]: 弹幕数据列表
         """
+        self._report_dropped()
+        return self.danmaku_buffer.drain()
+    
+    async def wait_danmaku(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        等待直到有新弹幕后取出, 不需要轮询
+        
+        Args:
+            timeout: 超时时间(秒), 超时返回空列表
+            
+        Returns:
+            List[Dict[str, Any]]: 弹幕数据列表
+        """
+        danmakus = await self.danmaku_buffer.get(timeout)
+        self._report_dropped()
+        return danmakus
+    
+    def _report_dropped(self):
+        dropped = self.danmaku_buffer.take_dropped()
+        if dropped and self.logger:
+            self.logger.warning(f"[{self.platform}] 弹幕缓冲区已满, 丢弃了 {dropped} 条最早的弹幕 room_id={self.room_id}")
+    
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        在线程池中执行阻塞操作(同步 HTTP 请求、签名计算等), 避免阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+    
+    @abc.abstractmethod
+    async def get_ws_endpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        获取弹幕服务器连接信息, 每次(重新)连接前调用
+        
+        Returns:
+            Optional[Dict[str, Any]]: {"urls": [按顺序尝试的地址], "headers": 请求头}, None表示获取失败
+        """
+        pass
+    
+    async def on_open(self, ws):
+        """
+        连接建立后调用, 用于发送认证/进房消息
+        
+        Args:
+            ws: websocket连接
+        """
+        pass
+    
+    async def send_heartbeat(self, ws):
+        """
+        按 heartbeat_interval 定时调用
+        
+        Args:
+            ws: websocket连接
+        """
+        pass
+    
+    @abc.abstractmethod
+    async def on_message(self, ws, message: Any) -> List[Dict[str, Any]]:
+        """
+        处理收到的一条websocket消息
+        
+        Args:
+            ws: websocket连接, 需要回复确认消息时使用
+            message: 原始消息
+            
+        Returns:
+            List[Dict[str, Any]]: 解析出的弹幕数据列表
+        """
         pass
     
     @abc.abstractmethod
@@ -140,9 +340,7 @@ class DanmakuBase(metaclass=abc.ABCMeta):
         Args:
             danmaku: 弹幕数据
         """
-        self.danmaku_buffer.append(danmaku)
-        if len(self.danmaku_buffer) > self.max_buffer_size:
-            self.danmaku_buffer.pop(0)
+        self.danmaku_buffer.put_nowait(danmaku)
     
     def clear_buffer(self):
         """
@@ -157,4 +355,4 @@ class DanmakuBase(metaclass=abc.ABCMeta):
         Returns:
             List[Dict[str, Any]]: 弹幕数据列表
         """
-        return self.danmaku_buffer.copy()
+        return self.danmaku_buffer.snapshot()
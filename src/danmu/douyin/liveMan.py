@@ -25,6 +25,7 @@ import requests
 import websocket
 from py_mini_racer import MiniRacer
 
+from ..base import DanmakuBuffer
 from .ac_signature import get__ac_signature
 from .protobuf.douyin import *
 
@@ -39,6 +40,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.
 from src.spider import get_douyin_stream_data
 from src.room import get_sec_user_id
 from src.logger import logger
+from src.sign_server import SIGN_SCRIPTS, js_call
 
 
 def execute_js(js_file: str):
@@ -91,13 +93,15 @@ def generateSignature(wss, script_file='sign.js'):
         logger.error(f"【X】脚本文件不存在: {script_path}")
         return None
     
-    with codecs.open(script_path, 'r', encoding='utf8') as f:
-        script = f.read()
-    
-    ctx = MiniRacer()
-    ctx.eval(script)
-    
     try:
+        if os.path.abspath(script_path) == str(SIGN_SCRIPTS['sign'][1]):
+            # 默认签名脚本由签名服务(或本进程缓存的运行时)执行
+            return js_call('sign', 'get_sign', md5_param)
+
+        with codecs.open(script_path, 'r', encoding='utf8') as f:
+            script = f.read()
+        ctx = MiniRacer()
+        ctx.eval(script)
         signature = ctx.call("get_sign", md5_param)
         return signature
     except Exception as e:
@@ -154,8 +158,8 @@ class DouyinLiveWebFetcher:
             'User-Agent': self.user_agent
         }
         # 添加弹幕缓冲区
-        self.danmaku_buffer = []
         self.max_buffer_size = 1000
+        self.danmaku_buffer = DanmakuBuffer(self.max_buffer_size)
     
     def start(self):
         self._connectWebSocket()
@@ -171,10 +175,8 @@ class DouyinLiveWebFetcher:
         Args:
             danmaku_data: 弹幕数据字典
         """
-        self.danmaku_buffer.append(danmaku_data)
-        # 保持缓冲区大小在限制内
-        if len(self.danmaku_buffer) > self.max_buffer_size:
-            self.danmaku_buffer = self.danmaku_buffer[-self.max_buffer_size:]
+        # 缓冲区已满时丢弃最旧的弹幕
+        self.danmaku_buffer.put_nowait(danmaku_data)
     
     def get_danmaku_buffer(self):
         """
@@ -183,11 +185,7 @@ class DouyinLiveWebFetcher:
         Returns:
             list: 缓冲区中的弹幕数据列表
         """
-        result = []
-        if self.danmaku_buffer:
-            result = self.danmaku_buffer.copy()
-            self.danmaku_buffer = []
-        return result
+        return self.danmaku_buffer.drain()
     
     @property
     def ttwid(self):
@@ -314,6 +312,8 @@ class DouyinLiveWebFetcher:
         """
         try:
             url = urllib.parse.urlencode(url_params)
+            if os.path.abspath(self.abogus_file) == str(SIGN_SCRIPTS['a_bogus'][1]):
+                return js_call('a_bogus', 'get_ab', url, self.user_agent)
             ctx = execute_js(self.abogus_file)
             _a_bogus = ctx.call("get_ab", url, self.user_agent)
             return _a_bogus
@@ -356,38 +356,49 @@ class DouyinLiveWebFetcher:
             nickname = user.get('nickname')
             logger.info(f"【{nickname}】[{user_id}]直播间：{['正在直播', '已结束'][bool(room_status)]}.")
     
+    def get_websocket_endpoint(self):
+        """
+        生成带签名的直播间websocket服务器地址和请求头
+        :return: (wss, headers)，生成签名失败时返回 None
+        """
+        wss = ("wss://webcast100-ws-web-lq.douyin.com/webcast/im/push/v2/?app_name=douyin_web"
+               "&version_code=180800&webcast_sdk_version=1.0.14-beta.0"
+               "&update_version_code=1.0.14-beta.0&compress=gzip&device_platform=web&cookie_enabled=true"
+               "&screen_width=1536&screen_height=864&browser_language=zh-CN&browser_platform=Win32"
+               "&browser_name=Mozilla"
+               "&browser_version=5.0%20(Windows%20NT%2010.0;%20Win64;%20x64)%20AppleWebKit/537.36%20(KHTML,"
+               "%20like%20Gecko)%20Chrome/126.0.0.0%20Safari/537.36"
+               "&browser_online=true&tz_name=Asia/Shanghai"
+               "&cursor=d-1_u-1_fh-7392091211001140287_t-1721106114633_r-1"
+               f"&internal_ext=internal_src:dim|wss_push_room_id:{self.room_id}|wss_push_did:7319483754668557238"
+               f"|first_req_ms:1721106114541|fetch_time:1721106114633|seq:1|wss_info:0-1721106114633-0-0|"
+               f"&host=https://live.douyin.com&aid=6383&live_id=1&did_rule=3&endpoint=live_pc&support_wrds=1"
+               f"&user_unique_id=7319483754668557238&im_path=/webcast/im/fetch/&identity=audience"
+               f"&need_persist_msg_count=15&insert_task_id=&live_reason=&room_id={self.room_id}&heartbeatDuration=0")
+        
+        # 使用正确的签名文件路径
+        signature = generateSignature(wss, self.sign_file)
+        if signature is None:
+            logger.error("【X】生成签名失败，无法连接WebSocket")
+            return None
+        
+        wss += f"&signature={signature}"
+        
+        headers = {
+            "cookie": f"ttwid={self.ttwid}",
+            'user-agent': self.user_agent,
+        }
+        return wss, headers
+    
     def _connectWebSocket(self):
         """
         连接抖音直播间websocket服务器，请求直播间数据
         """
         try:
-            wss = ("wss://webcast100-ws-web-lq.douyin.com/webcast/im/push/v2/?app_name=douyin_web"
-                   "&version_code=180800&webcast_sdk_version=1.0.14-beta.0"
-                   "&update_version_code=1.0.14-beta.0&compress=gzip&device_platform=web&cookie_enabled=true"
-                   "&screen_width=1536&screen_height=864&browser_language=zh-CN&browser_platform=Win32"
-                   "&browser_name=Mozilla"
-                   "&browser_version=5.0%20(Windows%20NT%2010.0;%20Win64;%20x64)%20AppleWebKit/537.36%20(KHTML,"
-                   "%20like%20Gecko)%20Chrome/126.0.0.0%20Safari/537.36"
-                   "&browser_online=true&tz_name=Asia/Shanghai"
-                   "&cursor=d-1_u-1_fh-7392091211001140287_t-1721106114633_r-1"
-                   f"&internal_ext=internal_src:dim|wss_push_room_id:{self.room_id}|wss_push_did:7319483754668557238"
-                   f"|first_req_ms:1721106114541|fetch_time:1721106114633|seq:1|wss_info:0-1721106114633-0-0|"
-                   f"&host=https://live.douyin.com&aid=6383&live_id=1&did_rule=3&endpoint=live_pc&support_wrds=1"
-                   f"&user_unique_id=7319483754668557238&im_path=/webcast/im/fetch/&identity=audience"
-                   f"&need_persist_msg_count=15&insert_task_id=&live_reason=&room_id={self.room_id}&heartbeatDuration=0")
-            
-            # 使用正确的签名文件路径
-            signature = generateSignature(wss, self.sign_file)
-            if signature is None:
-                logger.error("【X】生成签名失败，无法连接WebSocket")
+            endpoint = self.get_websocket_endpoint()
+            if endpoint is None:
                 return
-            
-            wss += f"&signature={signature}"
-            
-            headers = {
-                "cookie": f"ttwid={self.ttwid}",
-                'user-agent': self.user_agent,
-            }
+            wss, headers = endpoint
             
             self.ws = websocket.WebSocketApp(wss,
                                              header=headers,
@@ -409,8 +420,7 @@ class DouyinLiveWebFetcher:
         """
         while True:
             try:
-                heartbeat = PushFrame(payload_type='hb').SerializeToString()
-                self.ws.send(heartbeat, websocket.ABNF.OPCODE_PING)
+                self.ws.send(self.build_heartbeat(), websocket.ABNF.OPCODE_PING)
                 logger.info("【√】发送心跳包")
             except Exception as e:
                 logger.error(f"【X】心跳包检测错误: {e}")
@@ -425,24 +435,39 @@ class DouyinLiveWebFetcher:
         logger.info("【√】WebSocket连接成功.")
         threading.Thread(target=self._sendHeartbeat).start()
     
+    def build_heartbeat(self):
+        """
+        心跳包，以 ping 帧发送
+        """
+        return PushFrame(payload_type='hb').SerializeToString()
+    
     def _wsOnMessage(self, ws, message):
         """
         接收到数据
         :param ws: websocket实例
         :param message: 数据
         """
-        
+        ack = self.handle_frame(message)
+        if ack:
+            ws.send(ack, websocket.ABNF.OPCODE_BINARY)
+    
+    def handle_frame(self, message):
+        """
+        解析一帧数据，弹幕写入缓冲区
+        :param message: 数据
+        :return: 需要回复的存活确认帧，不需要时返回 None
+        """
         # 根据proto结构体解析对象
         package = PushFrame().parse(message)
         response = Response().parse(gzip.decompress(package.payload))
         
         # 返回直播间服务器链接存活确认消息，便于持续获取数据
+        ack = None
         if response.need_ack:
             ack = PushFrame(log_id=package.log_id,
                             payload_type='ack',
                             payload=response.internal_ext.encode('utf-8')
                             ).SerializeToString()
-            ws.send(ack, websocket.ABNF.OPCODE_BINARY)
         
         # 根据消息类别解析消息体
         for msg in response.messages_list:
@@ -465,6 +490,7 @@ class DouyinLiveWebFetcher:
                 }.get(method)(msg.payload)
             except Exception:
                 pass
+        return ack
     
     def _wsOnError(self, ws, error):
         logger.error(f"WebSocket error: {error}")
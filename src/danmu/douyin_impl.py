@@ -6,18 +6,17 @@
 支持 cookie 传递，解决获取 room_id 失败的问题
 """
 
-import asyncio
-import json
-import threading
 from typing import Dict, List, Optional, Any
 
 from src.danmu.base import DanmakuBase
 
+HEARTBEAT_INTERVAL = 5
+
 
 class DouyinDanmaku(DanmakuBase):
     """
     抖音直播弹幕获取类
-    使用 douyin/liveMan.py 下的 DouyinLiveWebFetcher 实现
+    使用 douyin/liveMan.py 下的 DouyinLiveWebFetcher 生成连接地址和解析消息，连接由弹幕连接中心维护
     支持 cookie 传递
     """
 
@@ -35,64 +34,48 @@ class DouyinDanmaku(DanmakuBase):
         self.platform = "douyin"
         self.fetcher = None
         self.cookies = cookies  # 保存 cookie
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
 
-    async def connect(self) -> bool:
-        """
-        连接到抖音弹幕服务器
-
-        Returns:
-            bool: 连接是否成功
-        """
-        try:
+    def _get_fetcher(self):
+        if self.fetcher is None:
             # 延迟导入避免循环依赖
             from .douyin.liveMan import DouyinLiveWebFetcher
 
-            # 初始化 DouyinLiveWebFetcher，传入 cookies
             # main.py 已经传入的是获取到的真实 room_id，因此不需要再通过 API 获取
             self.logger.info(f"初始化 DouyinLiveWebFetcher，传入 cookies（不使用API获取room_id）")
             self.fetcher = DouyinLiveWebFetcher(self.room_id, cookies=self.cookies, use_api_for_room_id=False)
+        return self.fetcher
 
-            # 启动一个线程来运行 fetcher
-            def run_fetcher():
-                try:
-                    self.fetcher.start()
-                except Exception as e:
-                    self.logger.error(f"[{self.platform}] 弹幕获取线程失败: {e}")
-
-            # 启动线程
-            threading.Thread(target=run_fetcher, daemon=True).start()
-
-            self.logger.info(f"[{self.platform}] 弹幕连接成功")
+    async def get_ws_endpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        获取带签名的弹幕服务器地址，签名计算和获取 ttwid 是阻塞操作，在线程池中执行
 
-            return True
-        except Exception as e:
-            self.logger.error(f"[{self.platform}] 弹幕连接失败: {e}")
-            return False
+        Returns:
+            Optional[Dict[str, Any]]: 连接信息
+        """
+        endpoint = await self.run_blocking(self._get_fetcher().get_websocket_endpoint)
+        if endpoint is None:
+            return None
+        wss, headers = endpoint
+        return {"urls": [wss], "headers": headers}
 
-    async def disconnect(self):
+    async def send_heartbeat(self, ws):
         """
-        断开与抖音弹幕服务器的连接
+        发送心跳包，抖音的心跳以 ping 帧发送
         """
-        if self.fetcher:
-            try:
-                self.fetcher.stop()
-                self.logger.info(f"[{self.platform}] 弹幕连接已断开")
-            except Exception as e:
-                self.logger.error(f"[{self.platform}] 断开弹幕连接失败: {e}")
-            finally:
-                self.fetcher = None
-
-    async def get_danmaku(self) -> List[Dict[str, Any]]:
+        await ws.ping(self.fetcher.build_heartbeat())
+
+    async def on_message(self, ws, message: Any) -> List[Dict[str, Any]]:
         """
-        获取抖音弹幕数据
-        从 DouyinLiveWebFetcher 的缓冲区中获取已解析的弹幕数据
+        解析弹幕帧，需要时回复存活确认
 
         Returns:
             List[Dict[str, Any]]: 弹幕数据列表
         """
-        if self.fetcher:
-            return self.fetcher.get_danmaku_buffer()
-        return []
+        ack = self.fetcher.handle_frame(message)
+        if ack:
+            await ws.send(ack)
+        return self.fetcher.get_danmaku_buffer()
 
     async def _process_message(self, message: Any) -> Optional[Dict[str, Any]]:
         """
@@ -0,0 +1,189 @@
+# -*- encoding: utf-8 -*-
+
+"""
+弹幕连接中心
+所有直播间的弹幕连接都运行在进程共享的事件循环中, 使用异步 websockets 连接,
+心跳、断线检测和停止检查由同一个每秒触发的定时任务统一处理, 断线后按统一的退避策略重连;
+获取签名、请求房间信息等阻塞操作在固定大小的线程池中执行, 线程数量不随直播间数量增加
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import websockets
+
+from ..event_loop import shared_loop
+from ..logger import logger
+
+SETUP_WORKERS = 4
+TICK_INTERVAL = 1
+CONNECT_TIMEOUT = 15
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# 连接保持超过该时间才视为恢复正常, 重置退避
+STABLE_TIME = 60
+BACKOFF_BASE = 2
+BACKOFF_MAX = 120
+# 超过该时间没有收到任何消息视为连接已失效, 主动断开重连
+STALE_TIMEOUT = 90
+
+
+class DanmakuSession:
+    def __init__(self, client, on_danmaku: Callable[[List[Dict[str, Any]]], None],
+                 should_stop: Optional[Callable[[], bool]] = None, on_close: Optional[Callable[[], None]] = None):
+        self.client = client
+        self.on_danmaku = on_danmaku
+        self.should_stop = should_stop
+        self.on_close = on_close
+        self.task: Optional[asyncio.Task] = None
+        self.ws = None
+        self.next_heartbeat = 0.0
+        self.last_message = 0.0
+        self.reconnects = 0
+        self.closed = False
+
+
+class DanmakuHub:
+    def __init__(self, setup_workers: int = SETUP_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=setup_workers, thread_name_prefix='danmaku-setup')
+        self.sessions: set[DanmakuSession] = set()
+        self.ticker: Optional[asyncio.Task] = None
+
+    def start(self, client, on_danmaku: Callable[[List[Dict[str, Any]]], None],
+              should_stop: Optional[Callable[[], bool]] = None,
+              on_close: Optional[Callable[[], None]] = None) -> DanmakuSession:
+        """
+        可在任意线程调用; should_stop 由定时任务每秒检查一次, 返回 True 时结束连接并调用 on_close
+        """
+        session = DanmakuSession(client, on_danmaku, should_stop, on_close)
+        client.executor = self.executor
+        shared_loop.call_soon(self._add, session)
+        return session
+
+    def stop(self, session: Optional[DanmakuSession], timeout: float | None = 10) -> None:
+        if session is None:
+            return
+        future = shared_loop.submit(self.close(session))
+        if timeout:
+            try:
+                future.result(timeout)
+            except Exception as e:
+                logger.debug(f"Failed to close danmaku session: {e}")
+
+    @property
+    def connected(self) -> int:
+        return sum(1 for session in self.sessions if session.ws is not None)
+
+    def _add(self, session: DanmakuSession) -> None:
+        self.sessions.add(session)
+        session.task = asyncio.create_task(self._run(session))
+        if self.ticker is None or self.ticker.done():
+            self.ticker = asyncio.create_task(self._tick())
+
+    async def close(self, session: DanmakuSession) -> None:
+        if session.closed:
+            return
+        session.closed = True
+        self.sessions.discard(session)
+        if session.task and session.task is not asyncio.current_task():
+            session.task.cancel()
+            try:
+                await session.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await session.client.stop()
+        if session.on_close:
+            try:
+                session.on_close()
+            except Exception as e:
+                logger.error(f"[{session.client.platform}] 弹幕会话关闭回调失败: {e}")
+
+    async def _connect(self, session: DanmakuSession, endpoint: Dict[str, Any]):
+        client = session.client
+        last_error = None
+        for url in endpoint['urls']:
+            try:
+                return await websockets.connect(
+                    url,
+                    additional_headers=endpoint.get('headers'),
+                    proxy=client.proxy_addr or None,
+                    open_timeout=CONNECT_TIMEOUT,
+                    # 心跳由定时任务统一发送, 不为每个连接单独启动 ping 任务
+                    ping_interval=None,
+                    max_size=MAX_MESSAGE_SIZE,
+                )
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                last_error = e
+                logger.debug(f"[{client.platform}] 弹幕地址连接失败 {url}: {e}")
+        raise ConnectionError(f"all danmaku endpoints failed: {last_error}")
+
+    async def _run(self, session: DanmakuSession) -> None:
+        client = session.client
+        await client.start()
+        attempt = 0
+        while not session.closed:
+            connected_at = None
+            try:
+                endpoint = await client.get_ws_endpoint()
+                if not endpoint or not endpoint.get('urls'):
+                    raise ConnectionError("no danmaku endpoint")
+                ws = await self._connect(session, endpoint)
+                connected_at = time.monotonic()
+                session.ws = ws
+                session.last_message = connected_at
+                session.next_heartbeat = connected_at + client.heartbeat_interval
+                logger.info(f"[{client.platform}] 弹幕连接成功 room_id={client.room_id}")
+                await client.on_open(ws)
+                async for message in ws:
+                    session.last_message = time.monotonic()
+                    danmakus = await client.on_message(ws, message)
+                    if danmakus:
+                        session.on_danmaku(danmakus)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[{client.platform}] 弹幕连接中断 room_id={client.room_id}: {e}")
+            finally:
+                if session.ws is not None:
+                    ws, session.ws = session.ws, None
+                    await ws.close()
+            if session.closed:
+                break
+            if connected_at is not None and time.monotonic() - connected_at >= STABLE_TIME:
+                attempt = 0
+            attempt += 1
+            session.reconnects += 1
+            # 网络抖动时大量直播间同时断开, 随机化等待时间避免同时重连
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+            logger.debug(f"[{client.platform}] {delay:.0f} 秒后重新连接弹幕 room_id={client.room_id}")
+            await asyncio.sleep(delay)
+
+    async def _send_heartbeat(self, session: DanmakuSession, ws) -> None:
+        try:
+            await session.client.send_heartbeat(ws)
+        except Exception as e:
+            logger.debug(f"[{session.client.platform}] 发送弹幕心跳失败: {e}")
+            await ws.close()
+
+    async def _tick(self) -> None:
+        while self.sessions:
+            await asyncio.sleep(TICK_INTERVAL)
+            now = time.monotonic()
+            for session in list(self.sessions):
+                if session.should_stop and session.should_stop():
+                    asyncio.create_task(self.close(session))
+                    continue
+                ws = session.ws
+                if ws is None:
+                    continue
+                if now - session.last_message >= STALE_TIMEOUT:
+                    logger.debug(f"[{session.client.platform}] 弹幕连接长时间无数据, 重新连接")
+                    asyncio.create_task(ws.close())
+                elif session.client.heartbeat_interval and now >= session.next_heartbeat:
+                    session.next_heartbeat = now + session.client.heartbeat_interval
+                    asyncio.create_task(self._send_heartbeat(session, ws))
+
+
+danmaku_hub = DanmakuHub()
@@ -5,21 +5,19 @@
 使用 WebSocket + Protobuf + AES 加密
 """
 
-import asyncio
 import struct
 import time
 import gzip
 import binascii
 import requests
-import websockets
-import websocket
-import threading
 from typing import Dict, List, Optional, Any
 from .base import DanmakuBase
 from .kuaishou_resources.aes_cipher import KuaishouAESCipher
 from .kuaishou_resources import kuaishou_pb2 as ksp
 from .kuaishou_resources.message_parser import KuaishouMessageParser, MessageType
 
+HEARTBEAT_INTERVAL = 20
+
 
 class KuaishouDanmaku(DanmakuBase):
     """
@@ -66,10 +64,8 @@ class KuaishouDanmaku(DanmakuBase):
             }
         
         # WebSocket相关
-        self.websocket = None
-        self.heartbeat_task = None
-        self.receive_task = None
         self.ws_url = None
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
         self.token = None
         
         # AES加密器
@@ -77,12 +73,6 @@ class KuaishouDanmaku(DanmakuBase):
         
         # 消息解析器（支持多种消息类型）
         self.message_parser = KuaishouMessageParser(logger=self.logger)
-        
-        # 弹幕缓冲
-        self.danmaku_buffer = []
-        self.max_buffer_size = 1000
-        # 线程锁，保护弹幕缓冲的读写
-        self.buffer_lock = threading.Lock()
 
     def _get_websocket_info(self) -> Optional[Dict[str, Any]]:
         """
@@ -495,41 +485,25 @@ class KuaishouDanmaku(DanmakuBase):
             self.logger.debug(f"[{self.platform}] 提取消息失败: {e}")
             return []
     
-    async def _send_heartbeat(self):
+    async def send_heartbeat(self, ws):
         """
         发送心跳包
         """
-        try:
-            while self.is_running and self.websocket:
-                try:
-                    # 构造CSWebHeartbeat消息
-                    heartbeat = ksp.CSWebHeartbeat()
-                    heartbeat.timestamp = int(time.time() * 1000)
-                    
-                    # 序列化Protobuf
-                    payload = heartbeat.SerializeToString()
-                    
-                    # 打包消息（CS_HEARTBEAT = 1）
-                    msg = self._pack_message(1, payload, 1)
-                    
-                    await self.websocket.send(msg)
-                    self.logger.debug(f"[{self.platform}] 发送心跳")
-                    
-                except Exception as e:
-                    self.logger.error(f"[{self.platform}] 发送心跳失败: {e}")
-                    break
-                
-                await asyncio.sleep(20)  # 每20秒发送一次心跳
-                
-        except Exception as e:
-            self.logger.error(f"[{self.platform}] 心跳任务异常: {e}")
+        # 构造CSWebHeartbeat消息
+        heartbeat = ksp.CSWebHeartbeat()
+        heartbeat.timestamp = int(time.time() * 1000)
+        
+        # 打包消息（CS_HEARTBEAT = 1）
+        msg = self._pack_message(1, heartbeat.SerializeToString(), 1)
+        await ws.send(msg)
+        self.logger.debug(f"[{self.platform}] 发送心跳")
 
-    async def _send_enter_room_wsclient(self, ws):
+    async def on_open(self, ws):
         """
-        通过websocket-client库发送进入房间消息（使用与浏览器完全一致的格式）
+        连接建立后发送进入房间消息（使用与浏览器完全一致的格式）
         
         Args:
-            ws: websocket-client连接实例
+            ws: websocket连接
 
         发起消息结构：
         # 构成：
@@ -594,8 +568,7 @@ class KuaishouDanmaku(DanmakuBase):
                 self.logger.debug(f"[{self.platform}] 无法按UTF-8解码消息: {e}")
             
             # 使用Binary帧发送消息
-            import websocket
-            ws.send(msg, opcode=websocket.ABNF.OPCODE_BINARY)
+            await ws.send(msg)
             self.logger.info(f"[{self.platform}] 发送进入房间消息（Binary帧）成功")
             
         except Exception as e:
@@ -603,18 +576,23 @@ class KuaishouDanmaku(DanmakuBase):
             import traceback
             self.logger.debug(traceback.format_exc())
 
-    async def _process_message_wsclient(self, message):
+    async def on_message(self, ws, message: Any) -> List[Dict[str, Any]]:
         """
-        处理通过websocket-client库接收到的消息
+        处理接收到的消息
         
         Args:
+            ws: websocket连接
             message: 接收到的原始消息
+            
+        Returns:
+            List[Dict[str, Any]]: 弹幕数据列表
         """
+        result = []
         try:
             # 解包消息
             msg = self._unpack_message(message)
             if not msg:
-                return
+                return result
             
             payload_type = msg.get('payloadType')
             compression_type = msg.get('compressionType')
@@ -632,126 +610,12 @@ class KuaishouDanmaku(DanmakuBase):
                         # 处理并存储弹幕
                         processed = await self._process_message(danmaku)
                         if processed:
-                            self.add_to_buffer(processed)
+                            result.append(processed)
                             self.logger.debug(f"[{self.platform}] 收到弹幕: {processed.get('username', '')}: {processed.get('content', '')}")
         except Exception as e:
             self.logger.error(f"[{self.platform}] 处理消息失败: {e}")
+        return result
 
-    async def _send_heartbeat_wsclient(self):
-        """
-        通过websocket-client库发送心跳消息
-        """
-        try:
-            while self.is_running and self.websocket:
-                try:
-                    # 构造CSWebHeartbeat消息
-                    heartbeat = ksp.CSWebHeartbeat()
-                    heartbeat.timestamp = int(time.time() * 1000)
-                    
-                    # 序列化Protobuf
-                    payload = heartbeat.SerializeToString()
-                    
-                    # 打包消息（CS_HEARTBEAT = 1）
-                    msg = self._pack_message(1, payload, 1)
-                    
-                    # 检查websocket-client实例是否可用
-                    if hasattr(self.websocket, 'sock') and self.websocket.sock and self.websocket.sock.connected:
-                        self.websocket.sock.send(msg)
-                        self.logger.debug(f"[{self.platform}] 发送心跳")
-                    else:
-                        self.logger.error(f"[{self.platform}] WebSocket连接已关闭，无法发送心跳")
-                        break
-                    
-                except Exception as e:
-                    self.logger.error(f"[{self.platform}] 发送心跳失败: {e}")
-                    break
-                
-                import asyncio
-                await asyncio.sleep(20)  # 每20秒发送一次心跳
-                
-        except Exception as e:
-            self.logger.error(f"[{self.platform}] 心跳任务异常: {e}")
-
-    async def _send_enter_room(self):
-        """
-        发送进入房间消息
-        """
-        try:
-            # 构造CSWebEnterRoom消息
-            enter_room = ksp.CSWebEnterRoom()
-            enter_room.liveStreamId = self.room_id
-            enter_room.token = self.token
-            
-            # 序列化Protobuf
-            payload = enter_room.SerializeToString()
-            
-            # 打包消息（CS_ENTER_ROOM = 200）
-            msg = self._pack_message(200, payload, 1)
-            
-            await self.websocket.send(msg)
-            self.logger.info(f"[{self.platform}] 发送进入房间消息")
-            
-        except Exception as e:
-            self.logger.error(f"[{self.platform}] 发送进入房间消息失败: {e}")
-    
-    async def _receive_message(self):
-        """
-        接收WebSocket消息
-        """
-        try:
-            while self.is_running and self.websocket:
-                try:
-                    data = await self.websocket.recv()
-                    
-                    # 解包消息
-                    msg = self._unpack_message(data)
-                    if not msg:
-                        continue
-                    
-                    payload_type = msg.get('payloadType')
-                    compression_type = msg.get('compressionType')
-                    payload = msg.get('payload', b'')
-                    
-                    # 如果是SC_FEED_PUSH消息（310），提取弹幕
-                    if payload_type == 310:
-                        # 解密消息内容
-                        decrypted_payload = self._decrypt_payload(payload, compression_type)
-                        if decrypted_payload:
-                            # 提取弹幕
-                            danmaku_list = self._extract_danmaku_from_payload(decrypted_payload)
-                            
-                            for danmaku in danmaku_list:
-                                # 处理并存储弹幕
-                                processed = await self._process_message(danmaku)
-                                if processed:
-                                    self.add_to_buffer(processed)
-                                    self.logger.debug(f"[{self.platform}] 收到弹幕: {processed.get('username', '')}: {processed.get('content', '')}")
-                
-                except websockets.exceptions.ConnectionClosed:
-                    self.logger.warning(f"[{self.platform}] WebSocket连接已关闭")
-                    break
-                except Exception as e:
-                    self.logger.error(f"[{self.platform}] 接收消息失败: {e}")
-                    await asyncio.sleep(1)
-                    
-        except Exception as e:
-            self.logger.error(f"[{self.platform}] 接收任务异常: {e}")
-    
-    def add_to_buffer(self, danmaku: Dict[str, Any]):
-        """
-        添加弹幕到缓冲区
-        
-        Args:
-            danmaku: 弹幕数据
-        """
-        # 使用线程锁保证线程安全
-        with self.buffer_lock:
-            self.danmaku_buffer.append(danmaku)
-            
-            # 限制缓冲区大小
-            if len(self.danmaku_buffer) > self.max_buffer_size:
-                self.danmaku_buffer = self.danmaku_buffer[-self.max_buffer_size:]
-    
     def _extract_livestreamid_from_url(self, url: str) -> Optional[str]:
         """
         从快手直播间URL或用户主页URL中提取liveStreamId
@@ -1032,191 +896,65 @@ class KuaishouDanmaku(DanmakuBase):
             self.logger.debug(f"[{self.platform}] 错误详情: {traceback.format_exc()}")
             return None
 
-    async def connect(self) -> bool:
+    def _resolve_websocket_info(self) -> bool:
         """
-        连接到快手弹幕服务器
-        使用WebSocket方式获取实时弹幕
+        解析 liveStreamId 并获取WebSocket连接信息（同步请求，在线程池中执行）
         
         Returns:
-            bool: 连接是否成功
+            bool: 是否获取成功
         """
-        try:
-            # 步骤 1: 尝试解析真实的 liveStreamId
-            # 只有当传入的 liveStreamId 为空时，才尝试从页面上获取最新的 liveStreamId
-            # 因为如果已经传入了有效的 liveStreamId，就不需要再从页面上获取了
-            if not self.room_id:
-                self.logger.info(f"[{self.platform}] 传入的 liveStreamId 为空，尝试从页面获取")
-                real_livestream_id = self._extract_livestreamid_from_url(self.ks_id)
-                
-                if real_livestream_id:
-                    self.logger.info(f"[{self.platform}] 从页面获取到 liveStreamId: {real_livestream_id}")
-                    self.room_id = real_livestream_id
-                else:
-                    self.logger.error(f"[{self.platform}] 无法从页面解析 liveStreamId，连接失败")
-                    return False
+        # 步骤 1: 尝试解析真实的 liveStreamId
+        # 只有当传入的 liveStreamId 为空时，才尝试从页面上获取最新的 liveStreamId
+        # 因为如果已经传入了有效的 liveStreamId，就不需要再从页面上获取了
+        if not self.room_id:
+            self.logger.info(f"[{self.platform}] 传入的 liveStreamId 为空，尝试从页面获取")
+            real_livestream_id = self._extract_livestreamid_from_url(self.ks_id)
+            
+            if real_livestream_id:
+                self.logger.info(f"[{self.platform}] 从页面获取到 liveStreamId: {real_livestream_id}")
+                self.room_id = real_livestream_id
             else:
-                self.logger.info(f"[{self.platform}] 直接使用传入的 liveStreamId: {self.room_id}")
-
-            # 步骤 2: 获取WebSocket连接信息
-            ws_info = self._get_websocket_info()
-            if not ws_info:
-                # 如果获取失败，尝试从页面重新提取liveStreamId（可能之前的提取失败了）
-                self.logger.info(f"[{self.platform}] 获取WebSocket信息失败，尝试重新从页面提取liveStreamId")
-                # 构造标准直播间URL
-                url = f"https://live.kuaishou.com/u/{self.ks_id}"
-                real_livestream_id = self._extract_livestreamid_from_url(url)
-                if real_livestream_id and real_livestream_id != self.room_id:
-                    self.logger.info(f"[{self.platform}] 重新转换 ID: {self.room_id} -> {real_livestream_id}")
-                    self.room_id = real_livestream_id
-                    # 再次尝试获取WebSocket连接信息
-                    ws_info = self._get_websocket_info()
-                    if not ws_info:
-                        return False
-                else:
-                    return False
-            
-            # 尝试连接WebSocket
-            self.logger.info(f"[{self.platform}] 正在连接WebSocket...")
-            
-            # 尝试连接可用的WebSocket地址
-            for url in self.ws_url:
-                try:
-                    # 使用websocket-client库连接
-                    import websocket
-                    import threading
-                    
-                    # 保存WebSocket连接
-                    ws_client = None
-                    
-                    def on_open(ws):
-                        nonlocal ws_client
-                        ws_client = ws
-                        self.logger.info(f"[{self.platform}] WebSocket连接成功: {url}")
-                        # 发送进入房间消息
-                        import asyncio
-                        asyncio.run(self._send_enter_room_wsclient(ws))
-                        
-                    def on_message(ws, message):
-                        # 处理接收到的消息
-                        import asyncio
-                        asyncio.run(self._process_message_wsclient(message))
-                        
-                    def on_error(ws, error):
-                        self.logger.error(f"[{self.platform}] WebSocket错误: {error}")
-                        
-                    def on_close(ws, close_status_code, close_msg):
-                        self.logger.info(f"[{self.platform}] WebSocket连接关闭")
-                        self.is_running = False
-                    
-                    # 直接使用原始的WebSocket URL，不添加额外参数
-                    self.logger.debug(f"[{self.platform}] 使用原始WebSocket URL: {url}")
-                    
-                    # 构建WebSocket连接的Headers 但目前未使用
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36 Edg/144.0.0.0',
-                        'Origin': 'https://live.kuaishou.com',
-                    }
-                    if 'Cookie' in self.session.headers:
-                        headers['Cookie'] = self.session.headers['Cookie']
-                    
-                    # 创建WebSocket客户端
-                    websocket.enableTrace(True)
-                    ws_app = websocket.WebSocketApp(
-                        url,
-                        on_open=on_open,
-                        on_message=on_message,
-                        on_error=on_error,
-                        on_close=on_close,
-                        # header = headers, # 携带cookie
-                    )
-                    
-                    # 启动WebSocket客户端（非阻塞）
-                    def run_websocket():
-                        try:
-                            ws_app.run_forever(
-                                ping_interval=20,
-                                ping_timeout=10
-                            )
-                        except Exception as e:
-                            self.logger.error(f"[{self.platform}] WebSocket线程异常: {e}")
-                            import traceback
-                            self.logger.debug(traceback.format_exc())
-                            self.is_running = False
-                    
-                    ws_thread = threading.Thread(target=run_websocket)
-                    ws_thread.daemon = True
-                    ws_thread.start()
-                    
-                    # 等待连接建立
-                    import time
-                    time.sleep(2)
-                    
-                    if ws_client:
-                        self.websocket = ws_app
-                        self.ws_thread = ws_thread
-                        break
-                    else:
-                        self.logger.warning(f"[{self.platform}] 连接 {url} 失败: 连接未建立")
-                        continue
-                    
-                except Exception as e:
-                    self.logger.warning(f"[{self.platform}] 连接 {url} 失败: {e}")
-                    continue
-            else:
-                self.logger.error(f"[{self.platform}] 所有WebSocket地址连接失败")
+                self.logger.error(f"[{self.platform}] 无法从页面解析 liveStreamId，连接失败")
                 return False
-            
-            # 设置运行状态
-            self.is_running = True
-            self.start_time = time.time()
-            
-            # 启动心跳任务
-            import asyncio
-            self.heartbeat_task = asyncio.create_task(self._send_heartbeat_wsclient())
-            
-            self.logger.info(f"[{self.platform}] 弹幕连接成功，开始接收弹幕")
+        else:
+            self.logger.info(f"[{self.platform}] 直接使用传入的 liveStreamId: {self.room_id}")
+
+        # 步骤 2: 获取WebSocket连接信息
+        if self._get_websocket_info():
             return True
-            
+        # 如果获取失败，尝试从页面重新提取liveStreamId（可能之前的提取失败了）
+        self.logger.info(f"[{self.platform}] 获取WebSocket信息失败，尝试重新从页面提取liveStreamId")
+        # 构造标准直播间URL
+        url = f"https://live.kuaishou.com/u/{self.ks_id}"
+        real_livestream_id = self._extract_livestreamid_from_url(url)
+        if real_livestream_id and real_livestream_id != self.room_id:
+            self.logger.info(f"[{self.platform}] 重新转换 ID: {self.room_id} -> {real_livestream_id}")
+            self.room_id = real_livestream_id
+            # 再次尝试获取WebSocket连接信息
+            return bool(self._get_websocket_info())
+        return False
+
+    async def get_ws_endpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        获取弹幕服务器地址，按顺序尝试可用的WebSocket地址
+        
+        Returns:
+            Optional[Dict[str, Any]]: 连接信息
+        """
+        try:
+            if not await self.run_blocking(self._resolve_websocket_info):
+                return None
         except Exception as e:
-            self.logger.error(f"[{self.platform}] 连接失败: {e}")
-            import traceback
-            self.logger.debug(traceback.format_exc())
-            return False
+            self.logger.error(f"[{self.platform}] 获取WebSocket信息失败: {e}")
+            return None
+        # 直接使用原始的WebSocket URL，不携带额外请求头
+        return {"urls": list(self.ws_url), "headers": None}
 
-    
     async def disconnect(self):
         """
         断开与快手弹幕服务器的连接
         """
-        self.is_running = False
-        
-        # 取消任务
-        if self.receive_task:
-            self.receive_task.cancel()
-            try:
-                await self.receive_task
-            except:
-                pass
-        
-        if self.heartbeat_task:
-            self.heartbeat_task.cancel()
-            try:
-                await self.heartbeat_task
-            except:
-                pass
-        
-        # 关闭WebSocket
-        if self.websocket:
-            try:
-                # 检查是否是websocket-client实例
-                if hasattr(self.websocket, 'close'):
-                    # 对于websocket-client实例
-                    self.websocket.close()
-                else:
-                    # 对于websockets库实例
-                    await self.websocket.close()
-            except Exception as e:
-                self.logger.error(f"关闭WebSocket失败: {e}")
+        await super().disconnect()
         
         # 关闭session
         if self.session:
@@ -1520,37 +1258,6 @@ class KuaishouDanmaku(DanmakuBase):
         
         return comments
     
-    async def get_danmaku(self) -> List[Dict[str, Any]]:
-        """
-        获取快手弹幕数据
-        从缓冲区获取已经接收到的弹幕（WebSocket在后台持续接收）
-        
-        Returns:
-            List[Dict[str, Any]]: 弹幕数据列表
-        """
-        danmaku_list = []
-        
-        # 暂时关闭HTTP API方式获取弹幕
-        # if not self.is_running:
-        #     # 如果WebSocket未运行，尝试通过HTTP API获取评论
-        #     self.logger.info(f"[{self.platform}] WebSocket未运行，尝试通过HTTP API获取评论")
-        #     danmaku_list = self._get_comments_via_http()
-        #     return danmaku_list
-        
-        try:
-            # 从缓冲区获取弹幕（使用线程锁保证线程安全）
-            with self.buffer_lock:
-                if self.danmaku_buffer:
-                    danmaku_list = self.danmaku_buffer.copy()
-                    self.danmaku_buffer = []
-                    
-                    self.logger.debug(f"[{self.platform}] 返回 {len(danmaku_list)} 条弹幕")
-                
-        except Exception as e:
-            self.logger.error(f"获取快手弹幕失败: {e}")
-        
-        return danmaku_list
-    
     async def _process_message(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         处理单条弹幕消息
@@ -0,0 +1,226 @@
+# -*- encoding: utf-8 -*-
+
+"""
+弹幕文件写入
+所有直播间的弹幕文件由一个后台线程统一写入: 连接中心收到的弹幕按批放入队列, 后台线程批量序列化后先放在内存缓冲中,
+缓冲数据超过设定大小或距上次落盘超过设定时间才写入文件; 支持 JSON 和二进制归档(archive.py)两种格式、按大小轮转文件和 gzip 流式压缩
+"""
+
+import atexit
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from ..logger import logger
+from .archive import MAGIC, ArchiveEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FILE_SUFFIX = '.danmu.json'
+FILE_FORMATS = {'json': FILE_SUFFIX, 'bin': '.danmu.bin'}
+TICK_INTERVAL = 1
+FLUSH_INTERVAL = 5
+FLUSH_SIZE = 1024 * 1024
+# 积压的批次超过该数量时立即唤醒写入线程
+WAKEUP_BATCHES = 256
+
+
+def encode_danmakus(danmakus: List[Dict[str, Any]]) -> bytes:
+    """
+    序列化为每行一条的 JSON, 安装了 orjson 时使用 orjson
+    """
+    if orjson is not None:
+        try:
+            return b''.join(orjson.dumps(danmaku, option=orjson.OPT_APPEND_NEWLINE) for danmaku in danmakus)
+        except TypeError:
+            pass
+    return ''.join(json.dumps(danmaku, ensure_ascii=False, default=str) + '\n' for danmaku in danmakus).encode('utf-8')
+
+
+class DanmakuWriter:
+    def __init__(self, base_path: str, compress: bool = False, rotate_size: int = 0, file_format: str = 'json'):
+        """
+        Args:
+            base_path: 不含扩展名的文件路径, 轮转后的文件依次加上 _001、_002 后缀
+            compress: 是否写入 gzip 压缩文件
+            rotate_size: 单个文件写入超过该字节数后轮转, 0 为不轮转
+            file_format: json 为每行一条 JSON, bin 为二进制归档
+        """
+        self.base_path = base_path
+        self.binary = file_format == 'bin'
+        self.suffix = FILE_FORMATS.get(file_format, FILE_SUFFIX)
+        self.encoder: Optional[ArchiveEncoder] = None
+        self.compress = compress
+        self.rotate_size = rotate_size
+        self.part = 0
+        self.written = 0
+        self.count = 0
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        self.last_flush = time.monotonic()
+        self.paths: List[str] = []
+        self._raw = None
+        self._file = None
+        self._open()
+
+    @property
+    def path(self) -> str:
+        return self.paths[-1]
+
+    def _open(self) -> None:
+        suffix = f'_{self.part:03d}' if self.part else ''
+        path = f'{self.base_path}{suffix}{self.suffix}' + ('.gz' if self.compress else '')
+        # 自行缓冲, 落盘时整块写入, 不再经过文件对象的缓冲区
+        self._raw = open(path, 'ab', buffering=0)
+        is_new = self._raw.tell() == 0
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='ab') if self.compress else self._raw
+        if self.binary:
+            # 二进制归档的字符串表只在单个文件内有效, 每个文件使用新的编码器
+            self.encoder = ArchiveEncoder()
+            if is_new:
+                self._file.write(MAGIC)
+        self.paths.append(path)
+        self.written = 0
+
+    def _close_file(self) -> None:
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+
+    def write(self, danmakus: List[Dict[str, Any]]) -> None:
+        data = self.encoder.encode(danmakus) if self.encoder else encode_danmakus(danmakus)
+        self.pending.append(data)
+        self.pending_size += len(data)
+        self.count += len(danmakus)
+
+    def flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        data = b''.join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        self._file.write(data)
+        if self.compress:
+            # 同步刷新压缩流, 保证已落盘的部分可以直接解压读取
+            self._file.flush()
+        self.written += len(data)
+        if self.rotate_size and self.written >= self.rotate_size:
+            self._close_file()
+            self.part += 1
+            self._open()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._close_file()
+
+
+class DanmakuSink:
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.rotate_size = 0
+        self.compress = False
+        self.file_format = 'json'
+        self.queue: deque = deque()
+        self.writers: set[DanmakuWriter] = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def configure(self, flush_interval: float = FLUSH_INTERVAL, rotate_size: int = 0, compress: bool = False,
+                  file_format: str = 'json') -> None:
+        self.flush_interval = flush_interval
+        self.rotate_size = rotate_size
+        self.compress = compress
+        self.file_format = file_format if file_format in FILE_FORMATS else 'json'
+
+    def open(self, base_path: str) -> Optional[DanmakuWriter]:
+        try:
+            writer = DanmakuWriter(base_path, self.compress, self.rotate_size, self.file_format)
+        except OSError as e:
+            logger.error(f"弹幕文件创建失败 {base_path}: {e}")
+            return None
+        with self.lock:
+            self.writers.add(writer)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='danmaku-sink', daemon=True)
+                self.thread.start()
+        return writer
+
+    def put(self, writer: DanmakuWriter, danmakus: List[Dict[str, Any]]) -> None:
+        """
+        可在任意线程调用, 只入队不做序列化和磁盘操作
+        """
+        self.queue.append((writer, danmakus))
+        if len(self.queue) >= WAKEUP_BATCHES:
+            self.wakeup.set()
+
+    def close(self, writer: Optional[DanmakuWriter]) -> None:
+        if writer is None:
+            return
+        self.queue.append((writer, None))
+        self.wakeup.set()
+
+    def close_all(self) -> None:
+        with self.lock:
+            self._process()
+            for writer in list(self.writers):
+                self._close_writer(writer)
+
+    def _close_writer(self, writer: DanmakuWriter) -> None:
+        # 调用方持有锁
+        self.writers.discard(writer)
+        try:
+            writer.close()
+        except OSError as e:
+            logger.warning(f"弹幕文件写入失败 {writer.path}: {e}")
+        else:
+            logger.debug(f"弹幕文件已关闭 {writer.path}, 共 {writer.count} 条")
+
+    def _process(self) -> None:
+        # 调用方持有锁; 同一个文件的多个批次合并后一次序列化
+        batches: Dict[DanmakuWriter, List[Dict[str, Any]]] = {}
+        closing = []
+        while self.queue:
+            writer, danmakus = self.queue.popleft()
+            if writer not in self.writers:
+                continue
+            if danmakus is None:
+                closing.append(writer)
+            else:
+                batches.setdefault(writer, []).extend(danmakus)
+        now = time.monotonic()
+        for writer in list(self.writers):
+            danmakus = batches.get(writer)
+            try:
+                if danmakus:
+                    writer.write(danmakus)
+                if writer.pending_size >= self.flush_size or now - writer.last_flush >= self.flush_interval:
+                    writer.flush()
+            except OSError as e:
+                logger.warning(f"弹幕文件写入失败 {writer.path}: {e}")
+                writer.pending = []
+                self._close_writer(writer)
+        for writer in closing:
+            self._close_writer(writer)
+
+    def _run(self) -> None:
+        while True:
+            self.wakeup.wait(TICK_INTERVAL)
+            self.wakeup.clear()
+            with self.lock:
+                self._process()
+
+
+danmaku_sink = DanmakuSink()
+# 正常退出时写入缓冲中的弹幕
+atexit.register(danmaku_sink.close_all)
@@ -4,10 +4,8 @@
 小红书直播弹幕获取类
 """
 
-import asyncio
 import json
 import time
-import websockets
 from typing import Dict, List, Optional, Any
 from .base import DanmakuBase
 from .utils import DanmakuUtils
@@ -29,125 +27,55 @@ class XiaohongshuDanmaku(DanmakuBase):
         """
         super().__init__(room_id, proxy_addr, logger)
         self.platform = "xiaohongshu"
-        self.websocket = None
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Referer': f'https://www.xiaohongshu.com/live/{room_id}'
         }
         self.heartbeat_interval = 30  # 心跳间隔（秒）
     
-    async def connect(self) -> bool:
+    async def get_ws_endpoint(self) -> Optional[Dict[str, Any]]:
         """
-        连接到小红书弹幕服务器
+        获取弹幕服务器连接信息
         
         Returns:
-            bool: 连接是否成功
+            Optional[Dict[str, Any]]: 连接信息
         """
-        try:
-            # 获取WebSocket连接地址
-            ws_url = await self._get_ws_url()
-            if not ws_url:
-                self.logger.error(f"[{self.platform}] 获取WebSocket连接地址失败")
-                return False
-            
-            self.logger.debug(f"[{self.platform}] 尝试连接WebSocket: {ws_url}")
-            if self.proxy_addr:
-                self.logger.debug(f"[{self.platform}] 使用代理: {self.proxy_addr}")
-            else:
-                self.logger.debug(f"[{self.platform}] 不使用代理")
-            
-            # 建立WebSocket连接
-            retry_count = 3
-            for i in range(retry_count):
-                try:
-                    if self.proxy_addr:
-                        # 使用代理时，避免传递headers参数
-                        self.websocket = await websockets.connect(
-                            ws_url,
-                            proxy=self.proxy_addr,
-                            ping_interval=self.heartbeat_interval,
-                            ping_timeout=10
-                        )
-                    else:
-                        # 不使用代理时，也避免传递headers参数，以确保与不同版本的websockets库兼容
-                        self.websocket = await websockets.connect(
-                            ws_url,
-                            ping_interval=self.heartbeat_interval,
-                            ping_timeout=10
-                        )
-                    break
-                except Exception as e:
-                    if i == retry_count - 1:
-                        raise
-                    self.logger.warning(f"[{self.platform}] WebSocket连接失败 (尝试 {i+1}/{retry_count}): {e}")
-                    await asyncio.sleep(2)
-            
-            self.logger.info(f"[{self.platform}] WebSocket连接成功")
-            
-            await self._send_auth_message()
-            self.logger.debug(f"[{self.platform}] 发送认证消息成功")
-            
-            asyncio.create_task(self._heartbeat_task())
-            self.logger.debug(f"[{self.platform}] 启动心跳任务")
-            
-            return True
-        except Exception as e:
-            self.logger.error(f"[{self.platform}] 弹幕连接失败: {e}")
-            if "getaddrinfo failed" in str(e):
-                self.logger.error(f"[{self.platform}] 网络连接错误: 无法解析主机名，请检查网络连接和DNS设置")
-            elif "proxy" in str(e).lower():
-                self.logger.error(f"[{self.platform}] 代理错误: 请检查代理配置是否正确")
-            return False
+        ws_url = await self._get_ws_url()
+        if not ws_url:
+            self.logger.error(f"[{self.platform}] 获取WebSocket连接地址失败")
+            return None
+        self.logger.debug(f"[{self.platform}] 尝试连接WebSocket: {ws_url}")
+        # 不传递headers参数，与原先的连接方式保持一致
+        return {"urls": [ws_url], "headers": None}
+    
+    async def on_open(self, ws):
+        """
+        连接建立后发送认证消息
+        """
+        await self._send_auth_message(ws)
+        self.logger.debug(f"[{self.platform}] 发送认证消息成功")
     
-    async def disconnect(self):
+    async def send_heartbeat(self, ws):
         """
-        断开与小红书弹幕服务器的连接
+        发送心跳消息
         """
-        if self.websocket:
-            try:
-                await self.websocket.close()
-            except Exception as e:
-                self.logger.error(f"断开小红书弹幕连接失败: {e}")
-            finally:
-                self.websocket = None
+        await ws.send(json.dumps({"type": "heartbeat"}))
     
-    async def get_danmaku(self) -> List[Dict[str, Any]]:
+    async def on_message(self, ws, message: Any) -> List[Dict[str, Any]]:
         """
-        获取小红书弹幕数据
+        处理接收到的消息
         
         Returns:
             List[Dict[str, Any]]: 弹幕数据列表
         """
         danmaku_list = []
-        
-        if not self.websocket:
+        parsed_message = await self._parse_message(message)
+        if not parsed_message:
             return danmaku_list
-        
-        try:
-            # 接收消息
-            message = await self.websocket.recv()
-            
-            # 解析消息
-            parsed_message = await self._parse_message(message)
-            
-            # 处理消息
-            if isinstance(parsed_message, list):
-                for msg in parsed_message:
-                    danmaku = await self._process_message(msg)
-                    if danmaku:
-                        danmaku_list.append(danmaku)
-                        self.add_to_buffer(danmaku)
-            elif parsed_message:
-                danmaku = await self._process_message(parsed_message)
-                if danmaku:
-                    danmaku_list.append(danmaku)
-                    self.add_to_buffer(danmaku)
-        except websockets.ConnectionClosed:
-            self.logger.info("小红书弹幕连接已关闭")
-            self.websocket = None
-        except Exception as e:
-            self.logger.error(f"获取小红书弹幕失败: {e}")
-        
+        for msg in parsed_message if isinstance(parsed_message, list) else [parsed_message]:
+            danmaku = await self._process_message(msg)
+            if danmaku:
+                danmaku_list.append(danmaku)
         return danmaku_list
     
     async def _get_ws_url(self) -> Optional[str]:
@@ -167,13 +95,10 @@ class XiaohongshuDanmaku(DanmakuBase):
             self.logger.error(f"获取小红书WebSocket地址失败: {e}")
             return None
     
-    async def _send_auth_message(self):
+    async def _send_auth_message(self, ws):
         """
         发送认证消息
         """
-        if not self.websocket:
-            return
-        
         try:
             auth_message = {
                 "type": "join_room",
@@ -183,23 +108,10 @@ class XiaohongshuDanmaku(DanmakuBase):
                 "platform": "web"
             }
             
-            await self.websocket.send(json.dumps(auth_message))
+            await ws.send(json.dumps(auth_message))
         except Exception as e:
             self.logger.error(f"发送小红书认证消息失败: {e}")
     
-    async def _heartbeat_task(self):
-        """
-        心跳任务
-        """
-        while self.is_running and self.websocket:
-            try:
-                heartbeat_message = {"type": "heartbeat"}
-                await self.websocket.send(json.dumps(heartbeat_message))
-                await asyncio.sleep(self.heartbeat_interval)
-            except Exception as e:
-                self.logger.error(f"发送小红书心跳消息失败: {e}")
-                break
-    
     async def _parse_message(self, message: str) -> Optional[Any]:
         """
         解析消息
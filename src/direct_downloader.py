@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+直接下载直播流
+在共享事件循环上用共享连接池拉流, 收到的数据块不做拷贝, 攒够一批(大小随实时码率自适应)后
+一次交给写入线程, 停止信号通过每个录制独立的 Event 传递
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable
+import httpx
+from .event_loop import shared_loop
+from .logger import logger
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+# 每批数据量按约 0.25 秒的数据量自适应
+CHUNK_TARGET_SECONDS = 0.25
+STOP_CHECK_INTERVAL = 0.5
+
+
+class DownloadStatusError(Exception):
+    pass
+
+
+class ChunkBatch:
+    def __init__(self, size: int = MIN_CHUNK_SIZE):
+        self.chunks: list[bytes] = []
+        self.size = size
+        self.length = 0
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+
+    def add(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+
+    @property
+    def full(self) -> bool:
+        return self.length >= self.size
+
+    def consume(self) -> list[bytes]:
+        chunks = self.chunks
+        self._window_bytes += self.length
+        self.chunks = []
+        self.length = 0
+        return chunks
+
+    def adapt(self) -> None:
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < 1:
+            return
+        rate = self._window_bytes / elapsed
+        target = int(rate * CHUNK_TARGET_SECONDS)
+        self.size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, target))
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+
+
+def _write_chunks(write: Callable[[bytes], None], chunks: list[bytes]) -> None:
+    for chunk in chunks:
+        write(chunk)
+
+
+async def _watch_stop_event(task: asyncio.Task, *events: threading.Event) -> None:
+    while not task.done():
+        if any(event.is_set() for event in events):
+            task.cancel()
+            return
+        await asyncio.sleep(STOP_CHECK_INTERVAL)
+
+
+async def _download(url: str, write: Callable[[bytes], None], headers: dict | None,
+                    proxy_addr: str | None) -> int:
+    client = shared_loop.get_client(proxy_addr)
+    batch = ChunkBatch()
+    downloaded = 0
+    async with client.stream('GET', url, headers=headers, timeout=httpx.Timeout(20, connect=10)) as response:
+        if response.status_code != 200:
+            raise DownloadStatusError(f"请求直播流失败，状态码: {response.status_code}")
+        async for data in response.aiter_bytes():
+            batch.add(data)
+            if batch.full:
+                downloaded += batch.length
+                # 写盘放到线程池, 不阻塞同一循环上的其他下载
+                await asyncio.to_thread(_write_chunks, write, batch.consume())
+                batch.adapt()
+        if batch.length:
+            downloaded += batch.length
+            await asyncio.to_thread(_write_chunks, write, batch.consume())
+    return downloaded
+
+
+async def download_stream(url: str, write: Callable[[bytes], None], headers: dict | None = None,
+                          proxy_addr: str | None = None, stop_event: threading.Event | None = None,
+                          abort_event: threading.Event | None = None) -> bool:
+    # stop_event 表示用户停止录制, abort_event 表示需要中断本次下载(如卡顿)后重新开始
+    task = asyncio.create_task(_download(url, write, headers, proxy_addr))
+    events = [event for event in (stop_event, abort_event) if event]
+    watcher = asyncio.create_task(_watch_stop_event(task, *events)) if events else None
+    try:
+        downloaded = await task
+        logger.debug(f"Direct download finished, {downloaded} bytes")
+        return True
+    except asyncio.CancelledError:
+        if any(event.is_set() for event in events):
+            return False
+        raise
+    finally:
+        if watcher:
+            watcher.cancel()
+
+
+def run_download(url: str, write: Callable[[bytes], None], headers: dict | None = None,
+                 proxy_addr: str | None = None, stop_event: threading.Event | None = None,
+                 abort_event: threading.Event | None = None) -> bool:
+    return shared_loop.run(download_stream(url, write, headers, proxy_addr, stop_event, abort_event))
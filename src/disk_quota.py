@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+"""
+磁盘配额管理
+根据正在录制的总写入速率预测磁盘写满的时间, 提前按保留策略清理(或交给归档搬运)最早的已完成录制文件;
+保留策略格式: 名称=条件[,条件]; 多条用 ; 分隔, 名称为平台名、主播名或 * (全部),
+条件支持 7d(保留天数)、50GB(总大小上限)、p5(优先级, 越大越晚被拒绝/停止), 如 *=30d;抖音直播=200GB;某主播=7d,p5
+空间仍然不足时先按优先级拒绝新的录制, 低于剩余阈值时每次只停止一个优先级最低的录制, 不再一次停止全部录制;
+预测将要写满时的提前清理只处理媒体文件, 每个媒体文件和它的关键帧索引、字幕、分段清单一起删除
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from .archive_mover import archive_mover
+from .keyframe_index import get_index_path
+from .logger import logger
+from .postprocess_queue import postprocess_queue
+from .segment_manifest import MANIFEST_SUFFIX, SEGMENT_LIST_SUFFIX
+from .session_stitcher import session_stitcher
+from .stall_watchdog import stall_watchdog
+
+DISK_OK = 'ok'
+DISK_REFUSE = 'refuse'
+DISK_CRITICAL = 'critical'
+
+GB = 1024 ** 3
+# 预测剩余可录制时间低于该值时提前清理, 低于其 1/4 时拒绝新的低优先级录制
+PREDICT_HORIZON = 2 * 3600
+RETENTION_INTERVAL = 600
+SHED_INTERVAL = 60
+# 最近修改过的文件可能仍在写入或等待后处理
+MIN_FILE_AGE = 600
+FREE_RATE_ALPHA = 0.2
+MEDIA_EXTENSIONS = ('.ts', '.flv', '.mkv', '.mp4', '.mp3', '.m4a')
+# 分段录制的文件名以 _000 这样的序号结尾, 分段清单按去掉序号后的名称保存
+SEGMENT_INDEX = re.compile(r'_\d{3,}$')
+
+
+@dataclass
+class RetentionRule:
+    name: str
+    max_days: float = 0
+    max_bytes: int = 0
+    priority: int = 0
+
+
+def parse_retention_rules(text: str) -> list[RetentionRule]:
+    rules = []
+    for item in re.split(r'[;；]', text or ''):
+        name, _, conditions = item.partition('=')
+        name = name.strip()
+        if not name or not conditions.strip():
+            continue
+        rule = RetentionRule(name)
+        for condition in re.split(r'[,，]', conditions):
+            condition = condition.strip().lower()
+            if match := re.fullmatch(r'(\d+(?:\.\d+)?)d', condition):
+                rule.max_days = float(match.group(1))
+            elif match := re.fullmatch(r'(\d+(?:\.\d+)?)gb?', condition):
+                rule.max_bytes = int(float(match.group(1)) * GB)
+            elif match := re.fullmatch(r'p(-?\d+)', condition):
+                rule.priority = int(match.group(1))
+            elif condition:
+                logger.warning(f"Unknown retention condition: {condition}")
+        rules.append(rule)
+    return rules
+
+
+class DiskQuotaManager:
+    def __init__(self):
+        self.root = ''
+        self.limit_bytes = 0
+        self.horizon = PREDICT_HORIZON
+        self.rules: list[RetentionRule] = []
+        self.state = DISK_OK
+        self.free_bytes: int | None = None
+        self.free_rate = 0.0
+        self.time_to_full: float | None = None
+        self.active: dict[str, tuple[int, float]] = {}
+        self.lock = threading.Lock()
+        self._last_sample: tuple[float, int] | None = None
+        self._last_retention = 0.0
+        self._last_shed = 0.0
+        self._cleanup_thread: threading.Thread | None = None
+
+    def configure(self, root: str, limit_gb: float, rules_text: str = '', horizon: float = PREDICT_HORIZON) -> None:
+        self.root = root
+        self.limit_bytes = int(limit_gb * GB)
+        self.rules = parse_retention_rules(rules_text)
+        self.horizon = horizon
+
+    @property
+    def write_rate(self) -> float:
+        # 录制写入速率来自卡顿看门狗的采样, 另外按剩余空间的变化估计包括后处理在内的总消耗, 取较大值
+        return max(stall_watchdog.total_rate(), self.free_rate)
+
+    def _match_rule(self, path: str) -> RetentionRule | None:
+        parts = os.path.relpath(path, self.root).replace('\\', '/').split('/')
+        filename = parts[-1]
+        # 越靠近文件的目录(主播)优先于上级目录(平台), 最后才使用 *
+        for part in reversed(parts[:-1]):
+            for rule in self.rules:
+                if rule.name == part:
+                    return rule
+        for rule in self.rules:
+            if rule.name != '*' and f'_{rule.name}_' in filename:
+                return rule
+        return next((rule for rule in self.rules if rule.name == '*'), None)
+
+    def get_priority(self, platform: str, anchor_name: str) -> int:
+        for name in (anchor_name, platform, '*'):
+            for rule in self.rules:
+                if rule.name == name:
+                    return rule.priority
+        return 0
+
+    def update(self, free_bytes: int) -> str:
+        now = time.monotonic()
+        if self._last_sample and now > self._last_sample[0]:
+            rate = (self._last_sample[1] - free_bytes) / (now - self._last_sample[0])
+            # 删除文件会让剩余空间突增, 只统计消耗
+            if rate >= 0:
+                self.free_rate += FREE_RATE_ALPHA * (rate - self.free_rate)
+        self._last_sample = (now, free_bytes)
+        self.free_bytes = free_bytes
+
+        headroom = free_bytes - self.limit_bytes
+        rate = self.write_rate
+        self.time_to_full = headroom / rate if rate > 0 else None
+        if headroom <= 0:
+            self.state = DISK_CRITICAL
+        elif self.time_to_full is not None and self.time_to_full < self.horizon / 4:
+            self.state = DISK_REFUSE
+        else:
+            self.state = DISK_OK
+
+        pressure = self.time_to_full is not None and self.time_to_full < self.horizon
+        if self.rules and (pressure or time.time() - self._last_retention >= RETENTION_INTERVAL):
+            self._start_cleanup(need_bytes=int(rate * self.horizon - headroom) if pressure else 0)
+        return self.state
+
+    def allow_new_recording(self, record_url: str, platform: str, anchor_name: str) -> bool:
+        priority = self.get_priority(platform, anchor_name)
+        if self.state == DISK_CRITICAL or (self.state == DISK_REFUSE and priority <= 0):
+            return False
+        with self.lock:
+            self.active[record_url] = (priority, time.time())
+        return True
+
+    def release(self, record_url: str) -> None:
+        with self.lock:
+            self.active.pop(record_url, None)
+
+    def pick_victim(self, active_urls: list[str]) -> str | None:
+        # 每次只停止一个: 优先级最低的录制中最晚开始的那个, 损失最小
+        if not active_urls or time.monotonic() - self._last_shed < SHED_INTERVAL:
+            return None
+        with self.lock:
+            victim = min(active_urls, key=lambda url: (self.active.get(url, (0, 0))[0],
+                                                      -self.active.get(url, (0, 0))[1]))
+            self.active.pop(victim, None)
+        self._last_shed = time.monotonic()
+        return victim
+
+    def _start_cleanup(self, need_bytes: int = 0) -> None:
+        if self._cleanup_thread and self._cleanup_thread.is_alive():
+            return
+        self._last_retention = time.time()
+        self._cleanup_thread = threading.Thread(target=self.cleanup, args=(need_bytes,), daemon=True)
+        self._cleanup_thread.start()
+
+    def _finished_files(self) -> list[tuple[float, int, str, RetentionRule]]:
+        now = time.time()
+        busy_paths = postprocess_queue.busy_paths()
+        # 等待断流续录合并的文件还没有最终结果
+        session_paths = session_stitcher.fragment_paths()
+        files = []
+        for root, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(root, name)
+                if path in busy_paths or os.path.normpath(path) in session_paths or archive_mover.is_held(path):
+                    continue
+                rule = self._match_rule(path)
+                if rule is None:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime >= MIN_FILE_AGE:
+                    files.append((stat.st_mtime, stat.st_size, path, rule))
+        files.sort()
+        return files
+
+    def _remove(self, path: str) -> None:
+        if archive_mover.enabled:
+            archive_mover.queue.submit('archive', path)
+            return
+        try:
+            os.remove(path)
+            logger.info(f"Disk quota removed {path}")
+        except OSError as e:
+            logger.warning(f"Disk quota failed to remove {path}: {e}")
+
+    @staticmethod
+    def _media_units(files: list[tuple[float, int, str, RetentionRule]]
+                     ) -> list[tuple[float, RetentionRule, list[str], int]]:
+        """
+        把媒体文件和它的附属文件合成一组, 返回 [(修改时间, 规则, 文件列表, 总大小)];
+        分段清单由同一次录制的所有分段共用, 放在该次录制最后一个被清理的分段中
+        """
+        sizes = {path: size for _, size, path, _ in files}
+        media = [f for f in files if f[2].lower().endswith(MEDIA_EXTENSIONS)]
+        last_segment: dict[str, str] = {}
+        for _, _, path, _ in media:
+            last_segment[SEGMENT_INDEX.sub('', path.rsplit('.', maxsplit=1)[0])] = path
+        units = []
+        for mtime, size, path, rule in media:
+            stem = path.rsplit('.', maxsplit=1)[0]
+            sidecars = [get_index_path(path), f'{stem}.srt']
+            manifest_base = SEGMENT_INDEX.sub('', stem)
+            if last_segment[manifest_base] == path:
+                sidecars += [manifest_base + MANIFEST_SUFFIX, manifest_base + SEGMENT_LIST_SUFFIX]
+            members = [path] + [sidecar for sidecar in sidecars if sidecar in sizes]
+            units.append((mtime, rule, members, sum(sizes[member] for member in members)))
+        return units
+
+    def cleanup(self, need_bytes: int = 0) -> int:
+        if not self.root or not self.rules:
+            return 0
+        files = self._finished_files()
+        now = time.time()
+        removed = set()
+        freed = 0
+        group_sizes: dict[str, int] = {}
+        for _, size, _, rule in files:
+            group_sizes[rule.name] = group_sizes.get(rule.name, 0) + size
+
+        for mtime, size, path, rule in files:
+            expired = rule.max_days and now - mtime > rule.max_days * 86400
+            oversize = rule.max_bytes and group_sizes[rule.name] > rule.max_bytes
+            if expired or oversize:
+                self._remove(path)
+                removed.add(path)
+                freed += size
+                group_sizes[rule.name] -= size
+
+        # 保留策略清理后预计仍会写满时, 继续按时间从早到晚清理媒体文件, 优先级高的主播最后清理
+        if need_bytes > freed:
+            units = self._media_units([f for f in files if f[2] not in removed])
+            for _, _, members, size in sorted(units, key=lambda unit: (unit[1].priority, unit[0])):
+                for path in members:
+                    self._remove(path)
+                freed += size
+                if freed >= need_bytes:
+                    break
+            logger.warning(f"Disk predicted to be full in {(self.time_to_full or 0) / 60:.0f} minutes, "
+                           f"freed {freed / GB:.2f} GB in advance")
+        return freed
+
+
+disk_quota = DiskQuotaManager()
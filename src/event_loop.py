@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+进程内共享的 asyncio 事件循环
+录制线程通过 run()/submit() 把协程投递到同一个后台循环中执行,
+共用一组按代理区分的 httpx 连接池, 避免每个房间各自创建事件循环和客户端
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine
+import httpx
+from . import utils
+from .logger import logger
+
+MAX_CONNECTIONS = 512
+MAX_KEEPALIVE_CONNECTIONS = 128
+KEEPALIVE_EXPIRY = 30
+
+
+class SharedEventLoop:
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        self.clients: dict[tuple, httpx.AsyncClient] = {}
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None or self.loop.is_closed():
+                started = threading.Event()
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(
+                    target=self._run_forever, args=(self.loop, started), name='shared-event-loop', daemon=True
+                )
+                self.thread.start()
+                started.wait()
+            return self.loop
+
+    @staticmethod
+    def _run_forever(loop: asyncio.AbstractEventLoop, started: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def run(self, coro: Coroutine, timeout: float | None = None) -> Any:
+        if self.thread is threading.current_thread():
+            raise RuntimeError("SharedEventLoop.run() cannot be called from the loop thread")
+        return self.submit(coro).result(timeout)
+
+    def call_soon(self, callback, *args) -> None:
+        self.get_loop().call_soon_threadsafe(callback, *args)
+
+    def get_client(self, proxy_addr: str | None = None, verify: bool = False,
+                   http2: bool = False) -> httpx.AsyncClient:
+        # 只能在共享循环内调用, 客户端与创建它的事件循环绑定
+        proxy_addr = utils.handle_proxy_addr(proxy_addr)
+        key = (proxy_addr, verify, http2)
+        client = self.clients.get(key)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            )
+            try:
+                client = httpx.AsyncClient(proxy=proxy_addr, verify=verify, http2=http2, limits=limits,
+                                           timeout=httpx.Timeout(20, connect=10), follow_redirects=True)
+            except ImportError:
+                logger.warning("HTTP/2 support is not installed, fallback to HTTP/1.1")
+                client = httpx.AsyncClient(proxy=proxy_addr, verify=verify, limits=limits,
+                                           timeout=httpx.Timeout(20, connect=10), follow_redirects=True)
+            self.clients[key] = client
+        return client
+
+    async def aclose_clients(self) -> None:
+        clients, self.clients = list(self.clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    def shutdown(self, timeout: float = 5) -> None:
+        with self.lock:
+            loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.aclose_clients(), loop).result(timeout)
+        except Exception as e:
+            logger.debug(f"Failed to close shared http clients: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+
+shared_loop = SharedEventLoop()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffmpeg 进程监督
+所有录制用的 ffmpeg 进程都在共享事件循环中以 asyncio 子进程方式运行,
+通过 -progress pipe:1 读取码率、速度、丢帧和 out_time 等遥测数据,
+由同一个定时器检查停止信号和卡顿, 不再为每个进程每秒轮询一次
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from .event_loop import shared_loop
+from .logger import logger
+
+CHECK_INTERVAL = 1
+# 启动阶段需要完成探测(analyzeduration 最长 40 秒), 之后 out_time 超过 STALL_TIMEOUT 秒不前进视为卡顿
+STARTUP_TIMEOUT = 60
+STALL_TIMEOUT = 15
+STOP_TIMEOUT = 10
+
+
+@dataclass
+class FfmpegProgress:
+    frame: int = 0
+    fps: float = 0.0
+    bitrate: float = 0.0
+    total_size: int = 0
+    out_time_us: int = 0
+    dup_frames: int = 0
+    drop_frames: int = 0
+    speed: float = 0.0
+    state: str = ''
+    updated: float = 0.0
+
+    @property
+    def out_time(self) -> float:
+        return self.out_time_us / 1000000
+
+
+def _parse_number(value: str, cast=float):
+    value = value.strip().rstrip('x').replace('kbits/s', '')
+    try:
+        return cast(value)
+    except ValueError:
+        return cast(0)
+
+
+class FfmpegProcess:
+    def __init__(self, command: list, stop_event: threading.Event | None = None, stall_timeout: float = STALL_TIMEOUT):
+        self.command = command
+        self.stop_event = stop_event
+        self.stall_timeout = stall_timeout
+        self.progress = FfmpegProgress()
+        self.returncode: int | None = None
+        self.stalled = False
+        self.stopping = False
+        self.started = time.monotonic()
+        self.last_advance = self.started
+        self.exited = threading.Event()
+        # 进程退出、卡顿、收到停止信号时唤醒等待中的录制线程
+        self.wakeup = threading.Event()
+        self._process: asyncio.subprocess.Process | None = None
+
+    @property
+    def running(self) -> bool:
+        return not self.exited.is_set()
+
+    @property
+    def pid(self) -> int | None:
+        return self._process.pid if self._process else None
+
+    def _update(self, fields: dict) -> None:
+        progress = self.progress
+        out_time_us = _parse_number(fields.get('out_time_us', fields.get('out_time_ms', '0')), int)
+        total_size = _parse_number(fields.get('total_size', '0'), int)
+        if out_time_us > progress.out_time_us or total_size > progress.total_size:
+            self.last_advance = time.monotonic()
+        progress.frame = _parse_number(fields.get('frame', '0'), int)
+        progress.fps = _parse_number(fields.get('fps', '0'))
+        progress.bitrate = _parse_number(fields.get('bitrate', '0'))
+        progress.total_size = max(progress.total_size, total_size)
+        progress.out_time_us = max(progress.out_time_us, out_time_us)
+        progress.dup_frames = _parse_number(fields.get('dup_frames', '0'), int)
+        progress.drop_frames = _parse_number(fields.get('drop_frames', '0'), int)
+        progress.speed = _parse_number(fields.get('speed', '0'))
+        progress.state = fields.get('progress', '')
+        progress.updated = time.monotonic()
+
+    async def _read_progress(self) -> None:
+        fields = {}
+        async for line in self._process.stdout:
+            key, _, value = line.decode('utf-8', errors='ignore').strip().partition('=')
+            if not key:
+                continue
+            fields[key] = value
+            if key == 'progress':
+                self._update(fields)
+                fields = {}
+
+    def is_stalled(self, now: float) -> bool:
+        timeout = STARTUP_TIMEOUT if not self.progress.out_time_us else self.stall_timeout
+        return now - self.last_advance > timeout
+
+    async def _stop(self) -> None:
+        process = self._process
+        if process is None or process.returncode is not None:
+            return
+        try:
+            if os.name == 'nt':
+                if process.stdin:
+                    process.stdin.write(b'q')
+                    await process.stdin.drain()
+                    process.stdin.close()
+            else:
+                process.send_signal(signal.SIGINT)
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError, ProcessLookupError):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+    def restart_stalled(self) -> None:
+        # 可在任意线程调用, 结束卡住的进程并唤醒录制线程, 由录制线程决定如何重新开始
+        if self.stopping or not self.running:
+            return
+        self.stalled = True
+        self.stopping = True
+        shared_loop.submit(self._stop())
+
+    def stop(self) -> int | None:
+        self.stopping = True
+        if self.running:
+            shared_loop.run(self._stop())
+            self.exited.wait()
+        return self.returncode
+
+    def wait(self, timeout: float | None = None) -> bool:
+        woken = self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        return woken
+
+
+class FfmpegSupervisor:
+    def __init__(self, check_interval: float = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.processes: set[FfmpegProcess] = set()
+        self._monitor: asyncio.Task | None = None
+
+    @staticmethod
+    def build_command(command: list) -> list:
+        if '-progress' in command:
+            return list(command)
+        return [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+
+    async def _run(self, handle: FfmpegProcess, startupinfo=None) -> None:
+        handle._process = await asyncio.create_subprocess_exec(
+            *self.build_command(handle.command), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            startupinfo=startupinfo
+        )
+        self.processes.add(handle)
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self._monitor_loop())
+        asyncio.create_task(self._wait(handle))
+
+    async def _wait(self, handle: FfmpegProcess) -> None:
+        process = handle._process
+        reader = asyncio.create_task(handle._read_progress())
+        waiter = asyncio.create_task(process.wait())
+        # process.wait() 要等所有管道关闭才返回, 子进程遗留的管道可能一直不关闭, 以退出码为准
+        while not waiter.done() and process.returncode is None:
+            await asyncio.wait({waiter}, timeout=1)
+        handle.returncode = process.returncode
+        try:
+            await asyncio.wait_for(reader, 1)
+        except asyncio.TimeoutError:
+            pass
+        except Exception as e:
+            logger.debug(f"Failed to read ffmpeg progress: {e}")
+        self.processes.discard(handle)
+        handle.exited.set()
+        handle.wakeup.set()
+
+    async def _monitor_loop(self) -> None:
+        while self.processes:
+            now = time.monotonic()
+            for handle in list(self.processes):
+                if handle.stop_event and handle.stop_event.is_set():
+                    handle.wakeup.set()
+                elif not handle.stopping and handle.is_stalled(now):
+                    logger.warning(f"ffmpeg output stalled for {now - handle.last_advance:.0f}s, "
+                                   f"restart pid {handle.pid}")
+                    handle.restart_stalled()
+            await asyncio.sleep(self.check_interval)
+
+    def spawn(self, command: list, stop_event: threading.Event | None = None, startupinfo=None) -> FfmpegProcess:
+        handle = FfmpegProcess(command, stop_event=stop_event)
+        shared_loop.run(self._run(handle, startupinfo))
+        return handle
+
+
+ffmpeg_supervisor = FfmpegSupervisor()
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+"""
+FLV 流式写入器
+按 tag 解析直接下载得到的 FLV 字节流, 记录时间戳和关键帧位置,
+在达到分段时长后的第一个视频关键帧处切分文件, 每个文件重新写入文件头、
+元数据和音视频序列头并从 0 开始计时, 整个过程不需要 ffmpeg
+"""
+
+import os
+import struct
+import time
+from typing import Callable, BinaryIO
+from .subtitle_clock import SubtitleTrack
+
+FLV_HEADER_SIZE = 9
+TAG_HEADER_SIZE = 11
+PREVIOUS_TAG_SIZE = 4
+MAX_TAG_DATA_SIZE = 16 * 1024 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+TAG_AUDIO = 8
+TAG_VIDEO = 9
+TAG_SCRIPT = 18
+
+CODEC_AVC = 7
+CODEC_HEVC = 12
+SOUND_AAC = 10
+# 时间戳回退超过该值(毫秒)视为推流重置, 以上一个时间戳为基准继续累加
+TIMESTAMP_JUMP_TOLERANCE = 1000
+
+
+class FlvParseError(Exception):
+    pass
+
+
+def build_flv_header(has_audio: bool = True, has_video: bool = True) -> bytes:
+    flags = (0x04 if has_audio else 0) | (0x01 if has_video else 0)
+    return b'FLV\x01' + bytes([flags]) + struct.pack('>I', FLV_HEADER_SIZE) + b'\x00\x00\x00\x00'
+
+
+def build_tag_header(tag_type: int, timestamp: int, data_size: int) -> bytes:
+    timestamp &= 0xFFFFFFFF
+    return (bytes([tag_type]) + data_size.to_bytes(3, 'big') + (timestamp & 0xFFFFFF).to_bytes(3, 'big')
+            + bytes([timestamp >> 24]) + b'\x00\x00\x00')
+
+
+def build_tag(tag_type: int, timestamp: int, data: bytes) -> bytes:
+    return build_tag_header(tag_type, timestamp, len(data)) + data + struct.pack('>I', TAG_HEADER_SIZE + len(data))
+
+
+def is_video_keyframe(data: bytes) -> bool:
+    return bool(data) and (data[0] >> 4) & 0x07 == 1
+
+
+def is_video_sequence_header(data: bytes) -> bool:
+    if len(data) < 2:
+        return False
+    if data[0] & 0x80:
+        # Enhanced RTMP: 低 4 位为 PacketType, 0 表示 SequenceStart
+        return data[0] & 0x0F == 0
+    return data[0] & 0x0F in (CODEC_AVC, CODEC_HEVC) and data[1] == 0
+
+
+def is_audio_sequence_header(data: bytes) -> bool:
+    return len(data) >= 2 and data[0] >> 4 == SOUND_AAC and data[1] == 0
+
+
+def parse_metadata_bitrate(data: bytes | None) -> float:
+    """
+    从 onMetaData 中读取 videodatarate + audiodatarate (kbps), 返回比特/秒, 没有时返回 0
+    """
+    if not data:
+        return 0.0
+    total = 0.0
+    for key in (b'videodatarate', b'audiodatarate'):
+        # AMF0 属性名为 2 字节长度 + 名称, 数值类型标记为 0 后跟 8 字节双精度
+        marker = struct.pack('>H', len(key)) + key + b'\x00'
+        index = data.find(marker)
+        if index >= 0 and index + len(marker) + 8 <= len(data):
+            total += struct.unpack('>d', data[index + len(marker):index + len(marker) + 8])[0]
+    return total * 1000 if total > 0 else 0.0
+
+
+class FlvFileStats:
+    def __init__(self, path: str):
+        self.path = path
+        self.bytes = 0
+        self.tags = 0
+        self.keyframes = 0
+        self.duration_ms = 0
+
+    @property
+    def duration(self) -> float:
+        return self.duration_ms / 1000
+
+    @property
+    def bitrate(self) -> float:
+        return self.bytes * 8 / self.duration if self.duration > 0 else 0.0
+
+
+class FlvStreamWriter:
+    def __init__(self, save_path: str, split_time: float = 0, time_subtitles: bool = False,
+                 on_file_closed: Callable[[FlvFileStats], None] | None = None,
+                 buffer_size: int = WRITE_BUFFER_SIZE, flush_interval: float = 0, fsync: bool = False,
+                 index_writer_factory: Callable[[str], object] | None = None,
+                 subtitle_encoding: str = 'utf-8-sig'):
+        self.save_path = save_path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.split_ms = int(split_time * 1000) if split_time and '%03d' in save_path else 0
+        self.time_subtitles = time_subtitles
+        self.subtitle_encoding = subtitle_encoding
+        self.on_file_closed = on_file_closed
+        # 为每个文件创建关键帧索引写入器, 需要 append(offset, pts_ms)、flush()、close() 方法
+        self.index_writer_factory = index_writer_factory
+        self._index_writer = None
+        self.buffer = bytearray()
+        self.header_parsed = False
+        self.has_audio = True
+        self.has_video = True
+        self.metadata: bytes | None = None
+        self.video_sequence_header: bytes | None = None
+        self.audio_sequence_header: bytes | None = None
+        self.files: list[FlvFileStats] = []
+        self.total_bytes = 0
+        self._file: BinaryIO | None = None
+        self._subtitle_track: SubtitleTrack | None = None
+        self._file_index = 0
+        self._base_ts: int | None = None
+        self._last_ts = 0
+        self._ts_offset = 0
+        self._last_raw_ts: int | None = None
+        self._last_flush = time.monotonic()
+
+    @property
+    def current(self) -> FlvFileStats | None:
+        return self.files[-1] if self._file else None
+
+    @property
+    def expected_bitrate(self) -> float:
+        # 元数据没有码率时用已写入数据按媒体时长计算的码率, 与下载速度无关
+        bitrate = parse_metadata_bitrate(self.metadata)
+        if not bitrate and self.current:
+            bitrate = self.current.bitrate
+        return bitrate
+
+    def feed(self, chunk: bytes) -> None:
+        self.buffer += chunk
+        offset = 0
+        if not self.header_parsed:
+            if len(self.buffer) < FLV_HEADER_SIZE + PREVIOUS_TAG_SIZE:
+                return
+            if self.buffer[:3] != b'FLV':
+                raise FlvParseError("Invalid FLV header")
+            flags = self.buffer[4]
+            self.has_audio = bool(flags & 0x04)
+            self.has_video = bool(flags & 0x01)
+            offset = struct.unpack('>I', self.buffer[5:9])[0] + PREVIOUS_TAG_SIZE
+            self.header_parsed = True
+
+        buffer_size = len(self.buffer)
+        # tag 数据以切片视图直接写入文件, 不为每个 tag 复制; 需要保留的元数据和序列头由 _handle_tag 复制
+        view = memoryview(self.buffer)
+        try:
+            while buffer_size - offset >= TAG_HEADER_SIZE:
+                data_size = int.from_bytes(view[offset + 1:offset + 4], 'big')
+                if data_size > MAX_TAG_DATA_SIZE:
+                    raise FlvParseError(f"FLV tag too large: {data_size}")
+                tag_end = offset + TAG_HEADER_SIZE + data_size + PREVIOUS_TAG_SIZE
+                if tag_end > buffer_size:
+                    break
+                tag_type = view[offset] & 0x1F
+                timestamp = int.from_bytes(view[offset + 4:offset + 7], 'big') | (view[offset + 7] << 24)
+                self._handle_tag(tag_type, timestamp, view[offset + TAG_HEADER_SIZE:tag_end - PREVIOUS_TAG_SIZE])
+                offset = tag_end
+        finally:
+            view.release()
+        # 只保留未解析完的半个 tag, 内存占用与单个 tag 大小同级
+        del self.buffer[:offset]
+        if self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._index_writer:
+            self._index_writer.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _continuous_timestamp(self, raw_ts: int) -> int:
+        if self._last_raw_ts is not None and raw_ts + TIMESTAMP_JUMP_TOLERANCE < self._last_raw_ts:
+            self._ts_offset += self._last_raw_ts - raw_ts
+        self._last_raw_ts = raw_ts
+        return raw_ts + self._ts_offset
+
+    def _handle_tag(self, tag_type: int, raw_ts: int, data: memoryview) -> None:
+        if tag_type == TAG_SCRIPT:
+            if self.metadata is None:
+                self.metadata = bytes(data)
+            return
+        if tag_type == TAG_VIDEO and is_video_sequence_header(data):
+            self.video_sequence_header = bytes(data)
+            if self._file:
+                self._write_tag(tag_type, self._last_ts - self._base_ts, data)
+            return
+        if tag_type == TAG_AUDIO and is_audio_sequence_header(data):
+            self.audio_sequence_header = bytes(data)
+            if self._file:
+                self._write_tag(tag_type, self._last_ts - self._base_ts, data)
+            return
+        if tag_type not in (TAG_AUDIO, TAG_VIDEO):
+            return
+
+        timestamp = self._continuous_timestamp(raw_ts)
+        keyframe = tag_type == TAG_VIDEO and is_video_keyframe(data)
+        # 有视频时只在关键帧处开始新文件, 保证每个文件都能独立解码
+        video_stream = self.video_sequence_header is not None
+        if self._file is None:
+            if video_stream and not keyframe:
+                return
+            self._open_next_file(timestamp)
+        elif self.split_ms and timestamp - self._base_ts >= self.split_ms and (keyframe or not video_stream):
+            self._open_next_file(timestamp)
+
+        self._last_ts = max(self._last_ts, timestamp)
+        relative_ts = max(0, timestamp - self._base_ts)
+        if keyframe and self._index_writer:
+            self._index_writer.append(self.current.bytes, relative_ts)
+        self._write_tag(tag_type, relative_ts, data)
+        stats = self.current
+        stats.duration_ms = max(stats.duration_ms, relative_ts)
+        if keyframe:
+            stats.keyframes += 1
+        if self._subtitle_track:
+            # 字幕条目按流时间戳推进, 每条的时间为文件开始时间加条目序号
+            self._subtitle_track.write_until(self._subtitle_track.started + relative_ts / 1000)
+
+    def _write_tag(self, tag_type: int, timestamp: int, data: bytes | memoryview) -> None:
+        # 分三次写入文件缓冲区, 不把 tag 数据拼接成新的 bytes
+        data_size = len(data)
+        self._file.write(build_tag_header(tag_type, timestamp, data_size))
+        self._file.write(data)
+        self._file.write(struct.pack('>I', TAG_HEADER_SIZE + data_size))
+        tag_size = TAG_HEADER_SIZE + data_size + PREVIOUS_TAG_SIZE
+        stats = self.current
+        stats.bytes += tag_size
+        stats.tags += 1
+        self.total_bytes += tag_size
+
+    def _open_next_file(self, timestamp: int) -> None:
+        self.close_file()
+        path = self.save_path % self._file_index if self.split_ms else self.save_path
+        self._file_index += 1
+        self._file = open(path, 'wb', buffering=self.buffer_size)
+        self.files.append(FlvFileStats(path))
+        if self.index_writer_factory:
+            self._index_writer = self.index_writer_factory(path)
+        self._base_ts = timestamp
+        self._last_ts = timestamp
+        self._file.write(build_flv_header(self.has_audio, self.has_video))
+        self.files[-1].bytes += FLV_HEADER_SIZE + PREVIOUS_TAG_SIZE
+        for tag_type, data in ((TAG_SCRIPT, self.metadata), (TAG_VIDEO, self.video_sequence_header),
+                               (TAG_AUDIO, self.audio_sequence_header)):
+            if data:
+                self._write_tag(tag_type, 0, data)
+        if self.time_subtitles:
+            self._subtitle_track = SubtitleTrack(
+                f"{path.rsplit('.', maxsplit=1)[0]}.srt", time.time(), self.subtitle_encoding
+            )
+
+    def close_file(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if self._index_writer:
+            self._index_writer.close()
+            self._index_writer = None
+        if self._subtitle_track:
+            self._subtitle_track.close()
+            self._subtitle_track = None
+        if self.on_file_closed:
+            self.on_file_closed(self.files[-1])
+
+    def close(self) -> None:
+        self.close_file()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+分片 MP4 (fMP4) 工具
+录制时 ffmpeg 以 frag_keyframe+empty_moov 方式写入, 每个关键帧开始一个 moof+mdat 分片, 进程被杀也能播放;
+录制结束后只扫描分片头并在文件末尾追加 mfra 随机访问索引, 不读取也不重写媒体数据
+"""
+
+import os
+import struct
+from typing import BinaryIO, Iterator
+from .logger import logger
+
+FRAGMENTED_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+BOX_HEADER_SIZE = 8
+
+
+class Fmp4Error(Exception):
+    pass
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[tuple[str, int, int, int]]:
+    # 返回 (类型, 盒子起始位置, 数据起始位置, 盒子结束位置), 结束位置可能超过 end 表示盒子不完整
+    offset = start
+    while offset + BOX_HEADER_SIZE <= end:
+        f.seek(offset)
+        header = f.read(BOX_HEADER_SIZE)
+        if len(header) < BOX_HEADER_SIZE:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        data_start = offset + BOX_HEADER_SIZE
+        if size == 1:
+            large_size = f.read(8)
+            if len(large_size) < 8:
+                return
+            size = struct.unpack('>Q', large_size)[0]
+            data_start += 8
+        elif size == 0:
+            size = end - offset
+        if size < data_start - offset:
+            raise Fmp4Error(f"Invalid box size {size} at {offset}")
+        yield box_type.decode('latin-1'), offset, data_start, offset + size
+        offset += size
+
+
+def _read_traf(f: BinaryIO, start: int, end: int) -> tuple[int, int] | None:
+    track_id = base_time = None
+    for box_type, _, data_start, box_end in _iter_boxes(f, start, end):
+        if box_type == 'tfhd':
+            f.seek(data_start + 4)
+            track_id = struct.unpack('>I', f.read(4))[0]
+        elif box_type == 'tfdt':
+            f.seek(data_start)
+            version = f.read(4)[0]
+            base_time = struct.unpack('>Q' if version == 1 else '>I', f.read(8 if version == 1 else 4))[0]
+    if track_id is None:
+        return None
+    return track_id, base_time or 0
+
+
+def scan_fragments(f: BinaryIO, file_size: int) -> tuple[list[tuple[int, list[tuple[int, int, int]]]], int, bool]:
+    """
+    返回 ([(moof 偏移, [(track_id, traf 序号, 起始时间)])], 完整数据的结束位置, 是否已有 mfra)
+    只有后面跟着完整 mdat 的 moof 才算完整分片, 末尾没有完整 mdat 的 moof 不计入结束位置
+    """
+    fragments = []
+    pending = None
+    valid_end = 0
+    has_mfra = False
+    for box_type, offset, data_start, box_end in _iter_boxes(f, 0, file_size):
+        if box_end > file_size:
+            break
+        if box_type == 'moof':
+            trafs = []
+            for child_type, _, child_start, child_end in _iter_boxes(f, data_start, box_end):
+                if child_type == 'traf':
+                    traf = _read_traf(f, child_start, child_end)
+                    if traf:
+                        trafs.append((traf[0], len(trafs) + 1, traf[1]))
+            # 连续出现的 moof 中前一个没有媒体数据, 不建立索引
+            pending = (offset, trafs)
+            continue
+        if box_type == 'mdat' and pending is not None:
+            fragments.append(pending)
+        elif box_type == 'mfra':
+            has_mfra = True
+        pending = None
+        valid_end = box_end
+    return fragments, valid_end, has_mfra
+
+
+def _full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    body = struct.pack('>I', (version << 24) | flags) + payload
+    return struct.pack('>I4s', BOX_HEADER_SIZE + len(body), box_type) + body
+
+
+def build_mfra(fragments: list[tuple[int, list[tuple[int, int, int]]]]) -> bytes:
+    entries: dict[int, list[tuple[int, int, int]]] = {}
+    for moof_offset, trafs in fragments:
+        for track_id, traf_number, base_time in trafs:
+            entries.setdefault(track_id, []).append((base_time, moof_offset, traf_number))
+
+    tfra_boxes = b''
+    for track_id, track_entries in sorted(entries.items()):
+        # 长度字段全为 0, traf/trun/sample 序号各占 1 字节; frag_keyframe 保证每个分片从第 1 个样本开始
+        payload = struct.pack('>III', track_id, 0, len(track_entries))
+        payload += b''.join(struct.pack('>QQBBB', base_time, moof_offset, min(traf_number, 255), 1, 1)
+                            for base_time, moof_offset, traf_number in track_entries)
+        tfra_boxes += _full_box(b'tfra', 1, 0, payload)
+    mfra_size = BOX_HEADER_SIZE + len(tfra_boxes) + 16
+    return (struct.pack('>I4s', mfra_size, b'mfra') + tfra_boxes
+            + _full_box(b'mfro', 0, 0, struct.pack('>I', mfra_size)))
+
+
+def finalize_fragmented_mp4(path: str) -> bool:
+    """
+    截掉进程异常退出时留下的不完整分片, 并在末尾追加 mfra 索引, 已有索引的文件不做处理
+    """
+    try:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+        with open(path, 'r+b') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            fragments, valid_end, has_mfra = scan_fragments(f, file_size)
+            if has_mfra or not fragments:
+                return False
+            if valid_end < file_size:
+                logger.warning(f"Truncate incomplete fragment in {path}: {file_size - valid_end} bytes")
+                f.truncate(valid_end)
+            f.seek(valid_end)
+            f.write(build_mfra(fragments))
+        logger.debug(f"Finalized fragmented MP4 with {len(fragments)} fragments: {path}")
+        return True
+    except (OSError, Fmp4Error, struct.error, IndexError) as e:
+        logger.error(f"Failed to finalize fragmented MP4 {path}: {e}")
+        return False
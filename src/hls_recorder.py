@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+内置 HLS 录制器
+在共享事件循环中轮询媒体播放列表, 通过共享连接池并发预取 TS 分片,
+按媒体序号去重后顺序写入磁盘, 不再为每个直播间常驻一个 ffmpeg 进程
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable
+import httpx
+from .event_loop import shared_loop
+from .keyframe_index import TsKeyframeParser
+from .logger import logger
+from .m3u8_parser import MediaPlaylist, Segment, is_master_playlist, parse_master_playlist, parse_media_playlist
+
+PREFETCH_SEGMENTS = 4
+SEGMENT_RETRIES = 3
+PLAYLIST_RETRIES = 5
+MAX_FAILOVERS = 3
+LIVE_EDGE_SEGMENTS = 3
+MIN_POLL_INTERVAL = 1.0
+# 连续多长时间(目标时长的倍数)播放列表没有新分片视为直播结束
+IDLE_TARGET_DURATIONS = 6
+MIN_IDLE_TIMEOUT = 30
+
+
+class HlsRecordError(Exception):
+    pass
+
+
+class HlsUnsupportedError(HlsRecordError):
+    pass
+
+
+class HlsRecorder:
+    def __init__(self, m3u8_url: str, save_path: str, headers: dict | None = None, proxy_addr: str | None = None,
+                 split_time: float = 0, should_stop: Callable[[], bool] | None = None,
+                 prefetch: int = PREFETCH_SEGMENTS, failover: Callable[[], str | None] | None = None,
+                 index_writer_factory: Callable[[str], object] | None = None):
+        self.m3u8_url = m3u8_url
+        self.media_url = m3u8_url
+        self.save_path = save_path
+        self.headers = headers or {}
+        self.proxy_addr = proxy_addr
+        self.split_time = split_time if '%03d' in save_path else 0
+        self.should_stop = should_stop or (lambda: False)
+        self.prefetch = max(1, prefetch)
+        self.failover = failover
+        self.failovers = 0
+        self.switches = 0
+        self._pending_url: str | None = None
+        self._realign = False
+        self.stopped = False
+        self.files: list[str] = []
+        self.file_durations: list[float] = []
+        self.last_sequence: int | None = None
+        self.segments = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.duration = 0.0
+        self.bandwidth = 0
+        self.error: Exception | None = None
+        self._file = None
+        self._file_duration = 0.0
+        self._file_index = 0
+        # 分片数据已经在内存中, 写入时直接解析关键帧, 不需要再从磁盘读回文件
+        self.index_writer_factory = index_writer_factory
+        self._index_parser: TsKeyframeParser | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return shared_loop.get_client(self.proxy_addr)
+
+    async def _get_text(self, url: str) -> str:
+        response = await self.client.get(url, headers=self.headers)
+        response.raise_for_status()
+        return response.text
+
+    @property
+    def expected_bitrate(self) -> float:
+        # 直接给出媒体播放列表时没有 BANDWIDTH, 用已下载分片按媒体时长计算的码率
+        if self.bandwidth:
+            return self.bandwidth
+        return self.bytes * 8 / self.duration if self.duration > 0 else 0.0
+
+    def switch_source(self, m3u8_url: str) -> None:
+        # 可在任意线程调用, 下一次刷新播放列表时切换到新地址, 已写入的分片按媒体序号去重
+        self._pending_url = m3u8_url
+
+    def _apply_pending_source(self) -> None:
+        if self._pending_url:
+            self.m3u8_url = self.media_url = self._pending_url
+            self._pending_url = None
+            self._realign = True
+            self.switches += 1
+            logger.debug("HLS recorder switched to a new source url")
+
+    async def load_playlist(self) -> MediaPlaylist:
+        text = await self._get_text(self.media_url)
+        if is_master_playlist(text):
+            variants = [v for v in parse_master_playlist(text, base_url=self.media_url) if not v.audio_only]
+            if not variants:
+                raise HlsUnsupportedError("No video variant in master playlist")
+            self.media_url = variants[0].uri
+            self.bandwidth = variants[0].average_bandwidth or variants[0].bandwidth
+            text = await self._get_text(self.media_url)
+        playlist = parse_media_playlist(text, base_url=self.media_url)
+        if playlist.key_method or playlist.map_uri:
+            raise HlsUnsupportedError(f"Unsupported playlist: key={playlist.key_method} map={playlist.map_uri}")
+        return playlist
+
+    async def _fetch_segment(self, segment: Segment, semaphore: asyncio.Semaphore) -> bytes | None:
+        async with semaphore:
+            for attempt in range(1, SEGMENT_RETRIES + 1):
+                try:
+                    response = await self.client.get(segment.uri, headers=self.headers)
+                    response.raise_for_status()
+                    return response.content
+                except (httpx.HTTPError, OSError) as e:
+                    if attempt == SEGMENT_RETRIES:
+                        logger.warning(f"HLS segment {segment.media_sequence} download failed: {e}")
+                    else:
+                        await asyncio.sleep(0.5 * attempt)
+        return None
+
+    def _close_file(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._index_parser:
+            self._index_parser.writer.close()
+            self._index_parser = None
+
+    def _open_next_file(self) -> None:
+        self._close_file()
+        path = self.save_path % self._file_index if self.split_time else self.save_path
+        self._file_index += 1
+        self._file = open(path, 'wb')
+        if self.index_writer_factory:
+            self._index_parser = TsKeyframeParser(self.index_writer_factory(path))
+        self._file_duration = 0.0
+        self.files.append(path)
+        self.file_durations.append(0.0)
+
+    def _write_segment(self, segment: Segment, data: bytes) -> None:
+        if self._file is None or (self.split_time and self._file_duration >= self.split_time):
+            self._open_next_file()
+        self._file.write(data)
+        if self._index_parser:
+            self._index_parser.feed(data)
+            self._index_parser.writer.flush()
+        self._file_duration += segment.duration
+        self.file_durations[-1] = self._file_duration
+
+    async def _writer(self, queue: asyncio.Queue) -> None:
+        # 出错后继续消费队列直到收到结束标记, 避免生产者阻塞在 put 上
+        while (item := await queue.get()) is not None:
+            segment, task = item
+            try:
+                data = await task
+                if data is None:
+                    self.failed += 1
+                elif self.error is None:
+                    await asyncio.to_thread(self._write_segment, segment, data)
+                    self.segments += 1
+                    self.bytes += len(data)
+                    self.duration += segment.duration
+            except Exception as e:
+                self.error = self.error or e
+
+    def _new_segments(self, playlist: MediaPlaylist) -> list[Segment]:
+        if self._realign and self.last_sequence is not None and playlist.segments:
+            # 新地址的媒体序号与旧地址不连续时无法对齐, 从新地址的直播边缘重新开始
+            window = len(playlist.segments) * 2
+            if not (playlist.media_sequence - window <= self.last_sequence <= playlist.last_sequence + window):
+                logger.warning("HLS media sequence changed after switching source, restart from live edge")
+                self.last_sequence = None
+            self._realign = False
+        if self.last_sequence is None:
+            segments = playlist.segments[-LIVE_EDGE_SEGMENTS:]
+        else:
+            segments = [s for s in playlist.segments if s.media_sequence > self.last_sequence]
+            if segments and segments[0].media_sequence > self.last_sequence + 1:
+                gap = segments[0].media_sequence - self.last_sequence - 1
+                self.skipped += gap
+                logger.warning(f"HLS playlist skipped {gap} segments, recording fell behind the live edge")
+        if segments:
+            self.last_sequence = segments[-1].media_sequence
+        return segments
+
+    async def _sleep(self, seconds: float) -> bool:
+        deadline = time.monotonic() + seconds
+        while (remaining := deadline - time.monotonic()) > 0:
+            if self.should_stop():
+                self.stopped = True
+                return False
+            await asyncio.sleep(min(1.0, remaining))
+        return not self.should_stop()
+
+    async def record(self) -> bool:
+        semaphore = asyncio.Semaphore(self.prefetch)
+        # 队列容量限制了已下载未写盘的分片数量, 内存占用保持恒定
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch * 2)
+        writer = asyncio.create_task(self._writer(queue))
+        playlist_errors = 0
+        last_new_time = time.monotonic()
+        try:
+            while not self.should_stop():
+                self._apply_pending_source()
+                try:
+                    playlist = await self.load_playlist()
+                    playlist_errors = 0
+                except HlsUnsupportedError:
+                    raise
+                except (httpx.HTTPError, OSError, ValueError) as e:
+                    playlist_errors += 1
+                    if playlist_errors >= PLAYLIST_RETRIES:
+                        if self.failover and self.failovers < MAX_FAILOVERS and not self._pending_url:
+                            self.failovers += 1
+                            new_url = await asyncio.to_thread(self.failover)
+                            if new_url:
+                                logger.warning(f"HLS playlist unavailable, fail over to a new source url: {e}")
+                                self.switch_source(new_url)
+                                playlist_errors = 0
+                                continue
+                        logger.debug(f"HLS playlist unavailable, stop recording: {e}")
+                        break
+                    if not await self._sleep(playlist_errors):
+                        break
+                    continue
+
+                segments = self._new_segments(playlist)
+                for segment in segments:
+                    task = asyncio.create_task(self._fetch_segment(segment, semaphore))
+                    await queue.put((segment, task))
+                if self.error:
+                    raise HlsRecordError(f"Failed to write HLS segment: {self.error}") from self.error
+
+                target_duration = playlist.target_duration or 2
+                if segments:
+                    last_new_time = time.monotonic()
+                elif time.monotonic() - last_new_time > max(MIN_IDLE_TIMEOUT, target_duration * IDLE_TARGET_DURATIONS):
+                    logger.debug("HLS playlist has no new segments, stream ended")
+                    break
+                if playlist.endlist:
+                    break
+                interval = target_duration if segments else target_duration / 2
+                if not await self._sleep(max(MIN_POLL_INTERVAL, interval)):
+                    break
+            else:
+                self.stopped = True
+        finally:
+            await queue.put(None)
+            try:
+                await writer
+            finally:
+                await asyncio.to_thread(self._close_file)
+        if self.error:
+            raise HlsRecordError(f"Failed to write HLS segment: {self.error}") from self.error
+        if self.skipped or self.failed:
+            logger.warning(f"HLS recording finished with {self.skipped} skipped and {self.failed} failed segments")
+        return self.segments > 0
+
+
+async def check_native_support(m3u8_url: str, headers: dict | None = None, proxy_addr: str | None = None) -> bool:
+    recorder = HlsRecorder(m3u8_url, os.devnull, headers=headers, proxy_addr=proxy_addr)
+    try:
+        playlist = await recorder.load_playlist()
+        return bool(playlist.segments)
+    except HlsUnsupportedError as e:
+        logger.debug(f"Native HLS recording is not supported for this stream: {e}")
+    except (httpx.HTTPError, OSError, ValueError) as e:
+        logger.debug(f"Failed to load HLS playlist: {e}")
+    return False
+
+
+def record_hls_stream(m3u8_url: str, save_path: str, headers: dict | None = None, proxy_addr: str | None = None,
+                      split_time: float = 0, should_stop: Callable[[], bool] | None = None) -> HlsRecorder:
+    recorder = HlsRecorder(m3u8_url, save_path, headers=headers, proxy_addr=proxy_addr, split_time=split_time,
+                           should_stop=should_stop)
+    shared_loop.run(recorder.record())
+    return recorder
@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import time
+from urllib.parse import urlparse
 import httpx
 from typing import Dict, Any
 from .. import utils
@@ -57,3 +60,56 @@ async def get_response_status(url: str, proxy_addr: OptionalStr = None, headers:
     except Exception as e:
         print(e)
     return False
+
+
+# 并发探测多个地址, 在 timeout 秒内返回每个地址的可用性和首字节耗时(秒)
+async def probe_urls(urls: list[str], proxy_addr: OptionalStr = None, headers: OptionalDict = None,
+                     timeout: float = 3, verify: bool = False, http2: bool = False) -> Dict[str, dict]:
+    results = {url: {'ok': False, 'ttfb': None} for url in urls}
+    if not urls:
+        return results
+
+    proxy_addr = utils.handle_proxy_addr(proxy_addr)
+    async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2) as client:
+
+        async def probe(url: str) -> None:
+            start = time.monotonic()
+            try:
+                async with client.stream('GET', url, headers=headers, follow_redirects=True) as response:
+                    results[url] = {
+                        'ok': response.status_code == 200,
+                        'ttfb': time.monotonic() - start,
+                        'status': response.status_code
+                    }
+            except Exception as e:
+                results[url] = {'ok': False, 'ttfb': None, 'error': str(e)}
+
+        tasks = [asyncio.create_task(probe(url)) for url in dict.fromkeys(urls)]
+        _done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+
+# 测量到各地址所在主机的 TCP 建连耗时(秒), 失败或超时为 None
+async def probe_connect_time(urls: list[str], timeout: float = 2) -> Dict[str, float | None]:
+
+    async def connect(url: str) -> float | None:
+        parsed = urlparse(url)
+        if not parsed.hostname:
+            return None
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        start = time.monotonic()
+        try:
+            _reader, writer = await asyncio.wait_for(asyncio.open_connection(parsed.hostname, port), timeout)
+        except Exception:
+            return None
+        elapsed = time.monotonic() - start
+        writer.close()
+        return elapsed
+
+    urls = list(dict.fromkeys(u for u in urls if u))
+    results = await asyncio.gather(*(connect(url) for url in urls))
+    return dict(zip(urls, results))
@@ -0,0 +1,26 @@
+// 常驻 node 进程: 启动时加载一次签名脚本, 之后从标准输入按行读取 {"func": ..., "args": [...]},
+// 调用脚本中的同名函数并把 {"result": ..., "error": ...} 按行写到标准输出
+const fs = require('fs');
+const vm = require('vm');
+const readline = require('readline');
+
+const scriptPath = process.argv[2];
+const write = process.stdout.write.bind(process.stdout);
+// 脚本里的日志输出不能混进应答
+console.log = console.info = console.warn = console.debug = () => {};
+// 与 execjs 的 node 运行时一致, 脚本可以使用 require 和 module.exports
+global.require = require;
+global.module = {exports: {}};
+global.exports = global.module.exports;
+vm.runInThisContext(fs.readFileSync(scriptPath, 'utf-8'), {filename: scriptPath});
+
+readline.createInterface({input: process.stdin}).on('line', (line) => {
+    let response;
+    try {
+        const request = JSON.parse(line);
+        response = {result: global[request.func](...request.args), error: null};
+    } catch (e) {
+        response = {result: null, error: String(e)};
+    }
+    write(JSON.stringify(response) + '\n');
+});
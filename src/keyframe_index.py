@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+"""
+关键帧索引
+录制过程中为 TS/FLV 文件写出 .kfi 索引文件, 记录每个视频关键帧的字节偏移、相对时间戳和写入时的时间,
+剪辑、截图、切片时可以直接定位到关键帧而不需要从头扫描整个文件;
+FLV 直接下载由写入器直接写索引, ffmpeg 和内置 HLS 录制的文件由后台线程增量解析新写入的数据
+"""
+
+import abc
+import bisect
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from .flv_writer import TAG_VIDEO, is_video_keyframe, is_video_sequence_header
+from .logger import logger
+
+INDEX_SUFFIX = '.kfi'
+INDEX_MAGIC = b'KFI1'
+# 偏移(字节), 相对时间戳(毫秒), 写入时间(unix 时间戳)
+ENTRY_FORMAT = '>QQd'
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+POLL_INTERVAL = 2
+READ_SIZE = 4 * 1024 * 1024
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+TS_VIDEO_STREAM_TYPES = (0x01, 0x02, 0x10, 0x1B, 0x24)
+PTS_WRAP = 1 << 33
+
+
+@dataclass
+class KeyframeEntry:
+    offset: int
+    pts_ms: int
+    wall_time: float
+
+    @property
+    def seconds(self) -> float:
+        return self.pts_ms / 1000
+
+
+def get_index_path(media_path: str) -> str:
+    return media_path + INDEX_SUFFIX
+
+
+def read_keyframe_index(media_path: str) -> list[KeyframeEntry]:
+    index_path = get_index_path(media_path)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'rb') as f:
+        data = f.read()
+    if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        raise ValueError(f"Invalid keyframe index: {index_path}")
+    body = data[len(INDEX_MAGIC):]
+    # 录制中断时最后一条记录可能不完整, 忽略
+    body = body[:len(body) - len(body) % ENTRY_SIZE]
+    return [KeyframeEntry(*entry) for entry in struct.iter_unpack(ENTRY_FORMAT, body)]
+
+
+def find_keyframe(entries: list[KeyframeEntry], seconds: float) -> KeyframeEntry | None:
+    """
+    返回时间不晚于 seconds 的最后一个关键帧, 从该偏移开始读取即可解码
+    """
+    if not entries:
+        return None
+    index = bisect.bisect_right([entry.pts_ms for entry in entries], seconds * 1000) - 1
+    return entries[max(0, index)]
+
+
+def remove_keyframe_index(media_path: str) -> None:
+    index_path = get_index_path(media_path)
+    if os.path.exists(index_path):
+        try:
+            os.remove(index_path)
+        except OSError as e:
+            logger.warning(f"Failed to remove keyframe index {index_path}: {e}")
+
+
+class KeyframeIndexWriter:
+    def __init__(self, media_path: str):
+        self.path = get_index_path(media_path)
+        self.count = 0
+        self._file = open(self.path, 'wb')
+        self._file.write(INDEX_MAGIC)
+
+    def append(self, offset: int, pts_ms: int, wall_time: float | None = None) -> None:
+        self._file.write(struct.pack(ENTRY_FORMAT, offset, max(0, pts_ms), wall_time or time.time()))
+        self.count += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class _StreamParser(metaclass=abc.ABCMeta):
+    def __init__(self, writer: KeyframeIndexWriter):
+        self.writer = writer
+        self.buffer = bytearray()
+        self.buffer_offset = 0
+
+    @abc.abstractmethod
+    def feed(self, data: bytes) -> None:
+        """
+        解析新写入文件的数据, 遇到关键帧时写入索引
+        """
+
+
+class TsKeyframeParser(_StreamParser):
+    def __init__(self, writer: KeyframeIndexWriter):
+        super().__init__(writer)
+        self.pmt_pids: set[int] = set()
+        self.video_pid: int | None = None
+        self.first_pts: int | None = None
+
+    @staticmethod
+    def _section(packet: bytes, start: int) -> bytes:
+        pointer = packet[start]
+        return packet[start + 1 + pointer:]
+
+    def _parse_pat(self, section: bytes) -> None:
+        section_length = ((section[1] & 0x0F) << 8) | section[2]
+        end = min(len(section), 3 + section_length - 4)
+        for pos in range(8, end - 3, 4):
+            program_number = (section[pos] << 8) | section[pos + 1]
+            if program_number:
+                self.pmt_pids.add(((section[pos + 2] & 0x1F) << 8) | section[pos + 3])
+
+    def _parse_pmt(self, section: bytes) -> None:
+        section_length = ((section[1] & 0x0F) << 8) | section[2]
+        end = min(len(section), 3 + section_length - 4)
+        pos = 12 + (((section[10] & 0x0F) << 8) | section[11])
+        while pos + 5 <= end:
+            stream_type = section[pos]
+            pid = ((section[pos + 1] & 0x1F) << 8) | section[pos + 2]
+            if stream_type in TS_VIDEO_STREAM_TYPES:
+                self.video_pid = pid
+                return
+            pos += 5 + (((section[pos + 3] & 0x0F) << 8) | section[pos + 4])
+
+    @staticmethod
+    def _parse_pts(payload: bytes) -> int | None:
+        if len(payload) < 14 or payload[:3] != b'\x00\x00\x01' or not payload[7] & 0x80:
+            return None
+        p = payload[9:14]
+        return ((p[0] >> 1) & 0x07) << 30 | p[1] << 22 | (p[2] >> 1) << 15 | p[3] << 7 | p[4] >> 1
+
+    def _handle_packet(self, packet: bytes, offset: int) -> None:
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        unit_start = packet[1] & 0x40
+        adaptation = (packet[3] >> 4) & 0x03
+        payload_start = 4
+        random_access = False
+        if adaptation & 0x02:
+            length = packet[4]
+            random_access = length > 0 and bool(packet[5] & 0x40)
+            payload_start += 1 + length
+        if not adaptation & 0x01 or payload_start >= TS_PACKET_SIZE:
+            return
+        if pid == 0 and unit_start:
+            self._parse_pat(self._section(packet, payload_start))
+        elif pid in self.pmt_pids and unit_start and self.video_pid is None:
+            self._parse_pmt(self._section(packet, payload_start))
+        elif pid == self.video_pid and unit_start and random_access:
+            pts = self._parse_pts(packet[payload_start:])
+            if pts is None:
+                return
+            if self.first_pts is None:
+                self.first_pts = pts
+            self.writer.append(offset, ((pts - self.first_pts) % PTS_WRAP) // 90)
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+        pos = 0
+        while pos + TS_PACKET_SIZE <= len(self.buffer):
+            if self.buffer[pos] != TS_SYNC_BYTE:
+                pos += 1
+                continue
+            # 只有 PAT、PMT 和视频 PES 的起始包需要解析, 其余的包只看包头, 不复制数据
+            if self.buffer[pos + 1] & 0x40:
+                pid = ((self.buffer[pos + 1] & 0x1F) << 8) | self.buffer[pos + 2]
+                if pid == 0 or pid == self.video_pid or (self.video_pid is None and pid in self.pmt_pids):
+                    self._handle_packet(bytes(self.buffer[pos:pos + TS_PACKET_SIZE]), self.buffer_offset + pos)
+            pos += TS_PACKET_SIZE
+        del self.buffer[:pos]
+        self.buffer_offset += pos
+
+
+class FlvKeyframeParser(_StreamParser):
+    def __init__(self, writer: KeyframeIndexWriter):
+        super().__init__(writer)
+        self.header_parsed = False
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+        pos = 0
+        if not self.header_parsed:
+            if len(self.buffer) < 13:
+                return
+            pos = struct.unpack('>I', self.buffer[5:9])[0] + 4
+            self.header_parsed = True
+        while pos + 11 <= len(self.buffer):
+            data_size = int.from_bytes(self.buffer[pos + 1:pos + 4], 'big')
+            tag_end = pos + 11 + data_size + 4
+            if tag_end > len(self.buffer):
+                break
+            if self.buffer[pos] & 0x1F == TAG_VIDEO:
+                timestamp = int.from_bytes(self.buffer[pos + 4:pos + 7], 'big') | (self.buffer[pos + 7] << 24)
+                tag_data = bytes(self.buffer[pos + 11:pos + 13])
+                if is_video_keyframe(tag_data) and not is_video_sequence_header(tag_data):
+                    self.writer.append(self.buffer_offset + pos, timestamp)
+            pos = tag_end
+        del self.buffer[:pos]
+        self.buffer_offset += pos
+
+
+class _IndexedOutput:
+    def __init__(self, path: str):
+        self.pattern = path
+        self.segmented = '%03d' in path
+        self.segment_index = 0
+        self.file_offset = 0
+        self.parser: _StreamParser | None = None
+
+    @property
+    def current_path(self) -> str:
+        return self.pattern % self.segment_index if self.segmented else self.pattern
+
+    def _open_parser(self) -> None:
+        writer = KeyframeIndexWriter(self.current_path)
+        if self.current_path.endswith('.flv'):
+            self.parser = FlvKeyframeParser(writer)
+        else:
+            self.parser = TsKeyframeParser(writer)
+        self.file_offset = 0
+
+    def _close_parser(self) -> None:
+        if self.parser:
+            self.parser.writer.close()
+            self.parser = None
+
+    def _read_current(self) -> None:
+        path = self.current_path
+        if not os.path.exists(path):
+            return
+        if self.parser is None:
+            self._open_parser()
+        with open(path, 'rb') as f:
+            f.seek(self.file_offset)
+            while data := f.read(READ_SIZE):
+                self.file_offset += len(data)
+                self.parser.feed(data)
+        self.parser.writer.flush()
+
+    def poll(self) -> None:
+        self._read_current()
+        # 分段录制出现下一个文件说明当前文件已经写完
+        while self.segmented and os.path.exists(self.pattern % (self.segment_index + 1)):
+            self._read_current()
+            self._close_parser()
+            self.segment_index += 1
+            self._read_current()
+
+    def close(self) -> None:
+        self.poll()
+        self._close_parser()
+
+
+class KeyframeIndexService:
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.outputs: dict[int, _IndexedOutput] = {}
+        self.thread: threading.Thread | None = None
+
+    def register(self, path: str) -> _IndexedOutput | None:
+        if not self.enabled or not path.endswith(('.ts', '.flv')):
+            return None
+        output = _IndexedOutput(path)
+        with self.lock:
+            self.outputs[id(output)] = output
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='keyframe-index', daemon=True)
+                self.thread.start()
+        return output
+
+    def unregister(self, output: _IndexedOutput | None) -> None:
+        if output is None:
+            return
+        with self.lock:
+            self.outputs.pop(id(output), None)
+            # 录制结束时把剩余数据解析完再关闭, 与后台线程互斥
+            try:
+                output.close()
+            except Exception as e:
+                logger.debug(f"Keyframe index close failed for {output.pattern}: {e}")
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                for output in list(self.outputs.values()):
+                    try:
+                        output.poll()
+                    except Exception as e:
+                        logger.debug(f"Keyframe index update failed for {output.pattern}: {e}")
+
+
+keyframe_index = KeyframeIndexService()
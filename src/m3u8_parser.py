@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+import threading
+from dataclasses import dataclass, field
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse
+from .http_clients.async_http import async_req
+from .stream_expiry import EXPIRY_PARAMS, REFRESH_MARGIN, get_url_expire_time
+
+OptionalStr = str | None
+OptionalDict = dict | None
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+VARIANT_CACHE_TTL = 300
+VARIANT_CACHE_SIZE = 256
+# 每次请求都会变化的签名、令牌、随机数和有效期参数, 不参与缓存键; 路径中的参数不做处理
+VOLATILE_PARAMS = frozenset(
+    ('sig', 'token', 'p', 'play_session_id', 'nonce', 'rand', '_', 'sign', 'signature', 'auth_key',
+     'txSecret', 'wsSecret', *(name for name, _ in EXPIRY_PARAMS))
+)
+
+CODEC_NAMES = {
+    'avc1': 'h264', 'avc3': 'h264',
+    'hvc1': 'h265', 'hev1': 'h265',
+    'av01': 'av1', 'vp09': 'vp9',
+    'mp4a': 'aac', 'ac-3': 'ac3', 'ec-3': 'eac3',
+}
+VIDEO_CODECS = ('h264', 'h265', 'av1', 'vp9')
+
+
+@dataclass
+class Variant:
+    uri: str
+    bandwidth: int = 0
+    average_bandwidth: int = 0
+    resolution: tuple[int, int] | None = None
+    frame_rate: float | None = None
+    codecs: list[str] = field(default_factory=list)
+    name: OptionalStr = None
+
+    @property
+    def video_codec(self) -> OptionalStr:
+        return next((c for c in self.codecs if c in VIDEO_CODECS), None)
+
+    @property
+    def audio_only(self) -> bool:
+        return bool(self.codecs) and self.video_codec is None and self.resolution is None
+
+
+@dataclass
+class Segment:
+    uri: str
+    duration: float
+    media_sequence: int
+    discontinuity: bool = False
+    program_date_time: OptionalStr = None
+
+
+@dataclass
+class MediaPlaylist:
+    target_duration: float = 0
+    media_sequence: int = 0
+    discontinuity_sequence: int = 0
+    segments: list[Segment] = field(default_factory=list)
+    endlist: bool = False
+    key_method: OptionalStr = None
+    map_uri: OptionalStr = None
+
+    @property
+    def last_sequence(self) -> int:
+        return self.segments[-1].media_sequence if self.segments else self.media_sequence - 1
+
+
+def parse_attribute_list(text: str) -> dict[str, str]:
+    attributes = {}
+    for match in ATTRIBUTE_PATTERN.finditer(text):
+        value = match.group(2)
+        if value.startswith('"'):
+            value = value[1:-1]
+        attributes[match.group(1)] = value
+    return attributes
+
+
+def normalize_codec(codec: str) -> str:
+    codec = codec.strip().lower()
+    return CODEC_NAMES.get(codec.split('.', maxsplit=1)[0], codec)
+
+
+def is_master_playlist(text: str) -> bool:
+    return '#EXT-X-STREAM-INF' in text
+
+
+def parse_master_playlist(text: str, base_url: str = '') -> list[Variant]:
+    variants = []
+    stream_inf = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            stream_inf = parse_attribute_list(line[18:])
+        elif line.startswith('#'):
+            continue
+        elif stream_inf is not None:
+            resolution = None
+            if 'x' in stream_inf.get('RESOLUTION', ''):
+                width, height = stream_inf['RESOLUTION'].lower().split('x', maxsplit=1)
+                if width.isdigit() and height.isdigit():
+                    resolution = (int(width), int(height))
+            frame_rate = stream_inf.get('FRAME-RATE')
+            variants.append(Variant(
+                uri=urljoin(base_url, line),
+                bandwidth=int(stream_inf.get('BANDWIDTH') or 0),
+                average_bandwidth=int(stream_inf.get('AVERAGE-BANDWIDTH') or 0),
+                resolution=resolution,
+                frame_rate=float(frame_rate) if frame_rate else None,
+                codecs=[normalize_codec(c) for c in stream_inf.get('CODECS', '').split(',') if c.strip()],
+                name=stream_inf.get('NAME') or stream_inf.get('VIDEO'),
+            ))
+            stream_inf = None
+    variants.sort(key=lambda v: (v.bandwidth, v.resolution or (0, 0)), reverse=True)
+    return variants
+
+
+def parse_media_playlist(text: str, base_url: str = '') -> MediaPlaylist:
+    playlist = MediaPlaylist()
+    duration = None
+    discontinuity = False
+    program_date_time = None
+    sequence = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            duration = float(line[8:].split(',', maxsplit=1)[0] or 0)
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist.media_sequence = int(line[22:])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = float(line[22:])
+        elif line.startswith('#EXT-X-DISCONTINUITY-SEQUENCE:'):
+            playlist.discontinuity_sequence = int(line[30:])
+        elif line == '#EXT-X-DISCONTINUITY':
+            discontinuity = True
+        elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+            program_date_time = line[25:]
+        elif line == '#EXT-X-ENDLIST':
+            playlist.endlist = True
+        elif line.startswith('#EXT-X-KEY:'):
+            method = parse_attribute_list(line[11:]).get('METHOD', 'NONE')
+            playlist.key_method = None if method == 'NONE' else method
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = parse_attribute_list(line[11:]).get('URI')
+            playlist.map_uri = urljoin(base_url, uri) if uri else None
+        elif not line.startswith('#') and duration is not None:
+            if sequence is None:
+                sequence = playlist.media_sequence
+            playlist.segments.append(Segment(
+                uri=urljoin(base_url, line),
+                duration=duration,
+                media_sequence=sequence,
+                discontinuity=discontinuity,
+                program_date_time=program_date_time,
+            ))
+            sequence += 1
+            duration = None
+            discontinuity = False
+            program_date_time = None
+    return playlist
+
+
+def get_cache_key(url: str) -> str:
+    parsed_url = urlparse(url)
+    params = sorted((k, v) for k, v in parse_qsl(parsed_url.query, keep_blank_values=True)
+                    if k not in VOLATILE_PARAMS)
+    return parsed_url._replace(query=urlencode(params), fragment='').geturl()
+
+
+class VariantCache:
+    def __init__(self, ttl: float = VARIANT_CACHE_TTL, max_size: int = VARIANT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.items: dict[str, tuple[float, list[Variant]]] = {}
+
+    def get(self, url: str) -> list[Variant] | None:
+        with self.lock:
+            item = self.items.get(url)
+            if item and item[0] > time.time():
+                return item[1]
+            self.items.pop(url, None)
+        return None
+
+    def set(self, url: str, variants: list[Variant], ttl: float | None = None) -> None:
+        now = time.time()
+        with self.lock:
+            if len(self.items) >= self.max_size:
+                self.items = {k: v for k, v in self.items.items() if v[0] > now}
+                while len(self.items) >= self.max_size:
+                    self.items.pop(next(iter(self.items)))
+            self.items[url] = (now + (self.ttl if ttl is None else ttl), variants)
+
+
+variant_cache = VariantCache()
+
+
+async def get_variants(m3u8: str, proxy: OptionalStr = None, header: OptionalDict = None,
+                       abroad: bool = False, ttl: float | None = None) -> list[Variant]:
+    cache_key = get_cache_key(m3u8)
+    variants = variant_cache.get(cache_key)
+    if variants is not None:
+        return variants
+
+    resp = await async_req(url=m3u8, proxy_addr=proxy, headers=header, abroad=abroad)
+    if not is_master_playlist(resp):
+        return []
+    variants = parse_master_playlist(resp, base_url=m3u8)
+    if variants:
+        # 子流地址带有效期时, 缓存不能比地址本身活得更久
+        expire_time = get_url_expire_time(variants[0].uri) or get_url_expire_time(m3u8)
+        if expire_time:
+            ttl = min(variant_cache.ttl if ttl is None else ttl, expire_time - REFRESH_MARGIN - time.time())
+        if ttl is None or ttl > 0:
+            variant_cache.set(cache_key, variants, ttl)
+    return variants
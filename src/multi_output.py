@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+单路拉流多路输出
+同一个 ffmpeg 进程只拉一次直播流, 除主录制文件外按配置同时输出纯音频或低码率预览,
+不再需要把同一个直播间写两行分别拉流; 配置格式: 名称=输出[,输出]; 多条用 ; 分隔,
+名称为主播名、平台名或 * (全部), 输出支持 m4a、mp3、preview(360p 预览)、ts、flv、mkv、mp4
+"""
+
+import re
+import subprocess
+from .fmp4 import FRAGMENTED_MOVFLAGS
+from .logger import logger
+from .segment_manifest import get_manifest_base
+
+PREVIEW_HEIGHT = 360
+PREVIEW_VIDEO_BITRATE = "500k"
+PREVIEW_AUDIO_BITRATE = "64k"
+
+OUTPUT_KINDS = ('m4a', 'mp3', 'preview', 'ts', 'flv', 'mkv', 'mp4')
+COPY_FORMATS = {'ts': 'mpegts', 'flv': 'flv', 'mkv': 'matroska', 'mp4': 'mp4'}
+AUDIO_OUTPUTS = ('m4a', 'mp3')
+PROBE_ANALYZE_DURATION = "5000000"
+PROBE_TIMEOUT = 20
+
+
+def parse_output_rules(text: str) -> dict[str, list[str]]:
+    rules = {}
+    for item in re.split(r'[;；]', text or ''):
+        name, _, outputs = item.partition('=')
+        name = name.strip()
+        if not name:
+            continue
+        kinds = []
+        for kind in re.split(r'[,，+]', outputs):
+            kind = kind.strip().lower()
+            if kind in OUTPUT_KINDS:
+                kinds.append(kind)
+            elif kind:
+                logger.warning(f"Unknown extra output format: {kind}")
+        rules[name] = kinds
+    return rules
+
+
+def get_extra_outputs(rules: dict[str, list[str]], platform: str, anchor_name: str, save_type: str) -> list[str]:
+    for name in (anchor_name, platform, '*'):
+        if name in rules:
+            # 与主录制文件格式相同的输出没有意义
+            return [kind for kind in rules[name] if kind != save_type.lower()]
+    return []
+
+
+def probe_audio_stream(url: str, headers: str | None = None, proxy_addr: str | None = None,
+                       user_agent: str | None = None, startupinfo=None) -> bool | None:
+    """
+    用 ffmpeg 读取输入流信息判断是否有音轨, 探测失败返回 None
+    """
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'info', '-analyzeduration', PROBE_ANALYZE_DURATION]
+    if proxy_addr:
+        command += ['-http_proxy', proxy_addr]
+    if user_agent:
+        command += ['-user_agent', user_agent]
+    if headers:
+        command += ['-headers', headers]
+    command += ['-i', url]
+    try:
+        # 没有指定输出文件, ffmpeg 打印输入流信息后即退出
+        result = subprocess.run(command, capture_output=True, timeout=PROBE_TIMEOUT, startupinfo=startupinfo)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Failed to probe audio stream: {e}")
+        return None
+    output = result.stderr.decode('utf-8', errors='ignore')
+    if not re.search(r'Stream #\d+:\d+', output):
+        return None
+    return re.search(r'Stream #\d+:\d+.*?: Audio:', output) is not None
+
+
+def get_extra_output_path(save_path: str, kind: str) -> str:
+    base = get_manifest_base(save_path)
+    if kind == 'preview':
+        return f'{base}_preview.mp4'
+    return f'{base}.{kind}'
+
+
+def build_extra_outputs(save_path: str, kinds: list[str]) -> list:
+    """
+    返回追加在主输出之后的输出参数, 每个输出的参数只作用于紧随其后的文件
+    """
+    command = []
+    for kind in kinds:
+        path = get_extra_output_path(save_path, kind)
+        # 纯音频输出只在确认有音轨后添加, 可选映射在没有音轨时会让输出没有任何流而导致整个进程退出
+        if kind == 'm4a':
+            command += ["-map", "0:a", "-vn", "-c:a", "copy", "-f", "mp4", "-movflags", FRAGMENTED_MOVFLAGS, path]
+        elif kind == 'mp3':
+            command += ["-map", "0:a", "-vn", "-c:a", "libmp3lame", "-ab", "320k", "-f", "mp3", path]
+        elif kind == 'preview':
+            command += [
+                "-map", "0:v?", "-map", "0:a?",
+                "-c:v", "libx264", "-preset", "veryfast", "-b:v", PREVIEW_VIDEO_BITRATE,
+                "-vf", f"scale=-2:{PREVIEW_HEIGHT}",
+                "-c:a", "aac", "-b:a", PREVIEW_AUDIO_BITRATE,
+                "-f", "mp4", "-movflags", FRAGMENTED_MOVFLAGS, path
+            ]
+        else:
+            movflags = ["-movflags", FRAGMENTED_MOVFLAGS] if kind == 'mp4' else []
+            command += ["-map", "0", "-c", "copy", *movflags, "-f", COPY_FORMATS[kind], path]
+    return command
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+录制后处理任务队列
+转封装、转码、分段等任务统一排队执行并持久化到磁盘, 程序重启后继续未完成的任务,
+工作线程数量按 CPU 核数限制, 转封装优先于重新编码, 子进程以低 CPU/IO 优先级运行, 不与正在进行的录制争抢资源
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from typing import Callable
+from .logger import logger, script_path
+
+POSTPROCESS_JOBS_FILE = f'{script_path}/config/postprocess_jobs.json'
+
+# 数值越小越先执行
+PRIORITY_REMUX = 0
+PRIORITY_SEGMENT = 1
+PRIORITY_TRANSCODE = 2
+
+NICE_LEVEL = 10
+CPU_COUNT = os.cpu_count() or 1
+# 转封装主要受磁盘限制, 并发过多只会互相抢占磁盘; 重新编码占满 CPU, 单独限制数量
+DEFAULT_WORKERS = max(1, min(4, CPU_COUNT // 2))
+MAX_TRANSCODE_JOBS = max(1, CPU_COUNT // 4)
+
+if os.name == 'nt':
+    LOW_PRIORITY_FLAGS = getattr(subprocess, 'BELOW_NORMAL_PRIORITY_CLASS', 0)
+else:
+    LOW_PRIORITY_FLAGS = 0
+
+
+def low_priority_command(command: list) -> list:
+    # Linux 下用 ionice 的 idle 类, 只在磁盘空闲时才进行读写, 录制写盘不受影响
+    if os.name == 'nt':
+        return command
+    prefix = []
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', str(NICE_LEVEL)]
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '3']
+    return prefix + command
+
+
+class PostProcessQueue:
+    def __init__(self, jobs_file: str = POSTPROCESS_JOBS_FILE, workers: int = DEFAULT_WORKERS,
+                 max_transcode_jobs: int = MAX_TRANSCODE_JOBS):
+        self.jobs_file = jobs_file
+        self.workers = workers
+        self.max_transcode_jobs = max_transcode_jobs
+        self.handlers: dict[str, Callable] = {}
+        self.condition = threading.Condition()
+        self.pending: list[dict] = []
+        self.running: dict[str, dict] = {}
+        self.threads: list[threading.Thread] = []
+        self.started = False
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.jobs_file):
+            return
+        try:
+            with open(self.jobs_file, 'r', encoding='utf-8') as f:
+                self.pending = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load post-processing jobs: {e}")
+            self.pending = []
+        if self.pending:
+            logger.info(f"Resume {len(self.pending)} unfinished post-processing jobs")
+
+    def _save(self) -> None:
+        # 调用方持有锁; 正在执行的任务也要保存, 中途退出时重启后重新执行
+        jobs = list(self.running.values()) + self.pending
+        try:
+            os.makedirs(os.path.dirname(self.jobs_file), exist_ok=True)
+            tmp_path = self.jobs_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(jobs, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.jobs_file)
+        except OSError as e:
+            logger.warning(f"Failed to save post-processing jobs: {e}")
+
+    def register(self, kind: str, handler: Callable) -> None:
+        self.handlers[kind] = handler
+
+    def submit(self, kind: str, *args, priority: int = PRIORITY_REMUX) -> None:
+        job = {'id': uuid.uuid4().hex, 'kind': kind, 'args': list(args), 'priority': priority,
+               'created': time.time()}
+        with self.condition:
+            self.pending.append(job)
+            self._save()
+            self.condition.notify()
+        self.start()
+
+    def set_workers(self, workers: int) -> None:
+        with self.condition:
+            self.workers = max(1, workers)
+            self.condition.notify_all()
+        if self.started:
+            self.start()
+
+    def start(self) -> None:
+        with self.condition:
+            self.started = True
+            self.threads = [t for t in self.threads if t.is_alive()]
+            for _ in range(self.workers - len(self.threads)):
+                thread = threading.Thread(target=self._worker, name='postprocess', daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+    def jobs(self) -> list[dict]:
+        with self.condition:
+            return list(self.running.values()) + list(self.pending)
+
+    def busy_paths(self) -> set[str]:
+        # 任务的第一个参数是要处理的文件, 合并任务为文件列表
+        paths = set()
+        for job in self.jobs():
+            if not job['args']:
+                continue
+            first = job['args'][0]
+            if isinstance(first, list):
+                paths.update(first)
+            else:
+                paths.add(first)
+        return paths
+
+    @property
+    def size(self) -> int:
+        return len(self.pending) + len(self.running)
+
+    def _next_job(self) -> dict | None:
+        transcodes = sum(1 for job in self.running.values() if job['priority'] >= PRIORITY_TRANSCODE)
+        candidates = [job for job in self.pending
+                      if job['priority'] < PRIORITY_TRANSCODE or transcodes < self.max_transcode_jobs]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda job: (job['priority'], job['created']))
+
+    def _worker(self) -> None:
+        current = threading.current_thread()
+        while True:
+            with self.condition:
+                while True:
+                    if len([t for t in self.threads if t.is_alive()]) > self.workers:
+                        # 并发数调小后多余的线程退出
+                        self.threads.remove(current)
+                        return
+                    job = self._next_job()
+                    if job:
+                        break
+                    self.condition.wait()
+                self.pending.remove(job)
+                self.running[job['id']] = job
+            self._run(job)
+            with self.condition:
+                self.running.pop(job['id'], None)
+                self._save()
+                self.condition.notify_all()
+
+    def _run(self, job: dict) -> None:
+        handler = self.handlers.get(job['kind'])
+        if handler is None:
+            logger.warning(f"Unknown post-processing job: {job['kind']}")
+            return
+        started = time.time()
+        try:
+            handler(*job['args'])
+            logger.debug(f"Post-processing {job['kind']} finished in {time.time() - started:.0f}s: {job['args'][0]}")
+        except Exception as e:
+            logger.error(f"Post-processing {job['kind']} failed: {e}")
+
+
+postprocess_queue = PostProcessQueue()
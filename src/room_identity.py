@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+直播间身份去重
+同一个主播可能以短链接、网页直播间地址、用户主页地址等多种形式出现在配置中,
+开始录制前把解析结果归一成平台级的直播间标识(房间号、流名称), 同一标识同时只录制一份,
+其余地址作为别名跳过
+"""
+
+import re
+import threading
+import time
+from urllib.parse import urlparse
+from .logger import logger
+
+# 认领后到真正开始录制之间的宽限时间, 避免两个地址同时认领后都开始录制
+CLAIM_GRACE = 60
+INVALID_IDS = ('', 'none', 'unknown', 'null', '0')
+# 去掉流名称中的清晰度后缀, 如 stream-123_or4.flv、stream-123_hd.m3u8
+QUALITY_SUFFIX = re.compile(r'(_(or\d*|origin|uhd|hd|sd|ld|md|\d+p|\d+k))+$', re.IGNORECASE)
+
+
+def get_stream_name(url: str | None) -> str | None:
+    if not url:
+        return None
+    name = urlparse(url).path.rsplit('/', maxsplit=1)[-1].rsplit('.', maxsplit=1)[0]
+    name = QUALITY_SUFFIX.sub('', name)
+    # 过短的文件名(如 index、playlist)不能区分直播间
+    return name if len(name) >= 8 and name.lower() not in ('playlist', 'index') else None
+
+
+def get_room_keys(platform: str, port_info: dict) -> set[str]:
+    keys = set()
+    # 不同字段的编号属于不同的编号空间(如用户号与房间号可能数值相同), 标识中带上字段名;
+    # 不同入口的同一直播间由流名称归并
+    for field in ('real_room_id', 'room_id', 'dy_id', 'user_id'):
+        value = str(port_info.get(field) or '').strip()
+        if value.lower() not in INVALID_IDS:
+            keys.add(f'{platform}:{field}:{value}')
+    for url in (port_info.get('flv_url'), port_info.get('m3u8_url')):
+        stream_name = get_stream_name(url)
+        if stream_name:
+            keys.add(f'{platform}:stream:{stream_name}')
+    return keys
+
+
+class RoomRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners: dict[str, tuple[str, str, float]] = {}
+        self.aliases: dict[str, set[str]] = {}
+
+    def claim(self, record_url: str, record_name: str, keys: set[str], active_names: set) -> str | None:
+        """
+        成功时返回 None, 已被其他正在录制的地址占用时返回该地址并记为别名
+        """
+        with self.lock:
+            for key in keys:
+                owner = self.owners.get(key)
+                if (owner and owner[0] != record_url
+                        and (owner[1] in active_names or time.monotonic() - owner[2] < CLAIM_GRACE)):
+                    aliases = self.aliases.setdefault(owner[0], set())
+                    if record_url not in aliases:
+                        aliases.add(record_url)
+                        logger.info(f"{record_url} 与 {owner[0]} 是同一个直播间, 已作为别名, "
+                                    f"当前别名: {', '.join(sorted(aliases))}")
+                    return owner[0]
+            for key in keys:
+                self.owners[key] = (record_url, record_name, time.monotonic())
+        return None
+
+    def release(self, record_url: str) -> None:
+        with self.lock:
+            for key in [key for key, owner in self.owners.items() if owner[0] == record_url]:
+                del self.owners[key]
+            self.aliases.pop(record_url, None)
+
+    def get_aliases(self, record_url: str) -> set[str]:
+        with self.lock:
+            return set(self.aliases.get(record_url, ()))
+
+    def get_aliases_by_name(self, record_name: str) -> set[str]:
+        with self.lock:
+            for record_url, name, _ in self.owners.values():
+                if name == record_name:
+                    return set(self.aliases.get(record_url, ()))
+        return set()
+
+
+room_registry = RoomRegistry()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+分段录制清单
+ffmpeg 分段录制时通过 -segment_list 实时写出已完成的分段(文件名、起止时间),
+录制结束后整理成 json 清单保存每段的起始时间、时长和大小, 后处理和清理直接使用清单,
+不再遍历整个保存目录按文件名前缀匹配
+"""
+
+import csv
+import json
+import os
+from dataclasses import asdict, dataclass
+from .logger import logger
+
+SEGMENT_LIST_SUFFIX = '.segments.csv'
+MANIFEST_SUFFIX = '.segments.json'
+
+
+@dataclass
+class SegmentInfo:
+    path: str
+    index: int
+    start: float | None = None
+    end: float | None = None
+    bytes: int = 0
+
+    @property
+    def duration(self) -> float | None:
+        if self.start is None or self.end is None:
+            return None
+        return round(self.end - self.start, 3)
+
+
+def get_manifest_base(pattern: str) -> str:
+    base = pattern.rsplit('.', maxsplit=1)[0]
+    return base[:-5] if base.endswith('_%03d') else base
+
+
+def get_segment_list_path(pattern: str) -> str:
+    return get_manifest_base(pattern) + SEGMENT_LIST_SUFFIX
+
+
+def get_manifest_path(pattern: str) -> str:
+    return get_manifest_base(pattern) + MANIFEST_SUFFIX
+
+
+def add_segment_list(command: list) -> list:
+    # 输出路径固定在命令最后一个参数
+    if '-segment_list' in command or 'segment' not in command or '%03d' not in command[-1]:
+        return command
+    return command[:-1] + ['-segment_list', get_segment_list_path(command[-1]),
+                           '-segment_list_type', 'csv', command[-1]]
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _read_segment_list(pattern: str) -> dict[str, tuple[float, float]]:
+    segment_list_path = get_segment_list_path(pattern)
+    times = {}
+    if not os.path.exists(segment_list_path):
+        return times
+    try:
+        with open(segment_list_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) >= 3:
+                    times[os.path.basename(row[0])] = (float(row[1]), float(row[2]))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read segment list {segment_list_path}: {e}")
+    return times
+
+
+def _read_manifest(pattern: str) -> list[SegmentInfo] | None:
+    manifest_path = get_manifest_path(pattern)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        directory = os.path.dirname(pattern)
+        return [SegmentInfo(os.path.join(directory, item['file']), item['index'], item.get('start'),
+                            item.get('end'), item.get('bytes', 0)) for item in data['segments']]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Failed to read segment manifest {manifest_path}: {e}")
+        return None
+
+
+def list_segments(pattern: str) -> list[SegmentInfo]:
+    """
+    按序号依次检查分段文件是否存在, 只访问本次录制的文件; 已有 json 清单时直接使用
+    """
+    if '%03d' not in pattern:
+        return [SegmentInfo(pattern, 0, bytes=_size(pattern))] if os.path.exists(pattern) else []
+    segments = _read_manifest(pattern)
+    if segments is not None:
+        return [segment for segment in segments if os.path.exists(segment.path)]
+
+    times = _read_segment_list(pattern)
+    segments = []
+    index = 0
+    while os.path.exists(path := pattern % index):
+        start, end = times.get(os.path.basename(path), (None, None))
+        segments.append(SegmentInfo(path, index, start, end, _size(path)))
+        index += 1
+    return segments
+
+
+def write_manifest(pattern: str, segments: list[SegmentInfo] | None = None) -> list[SegmentInfo]:
+    if segments is None:
+        segments = list_segments(pattern)
+    if '%03d' not in pattern or not segments:
+        return segments
+    items = []
+    for segment in segments:
+        item = asdict(segment)
+        item['file'] = os.path.basename(item.pop('path'))
+        item['duration'] = segment.duration
+        items.append(item)
+    data = {'pattern': os.path.basename(pattern), 'segments': items}
+    manifest_path = get_manifest_path(pattern)
+    try:
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+        segment_list_path = get_segment_list_path(pattern)
+        if os.path.exists(segment_list_path):
+            os.remove(segment_list_path)
+    except OSError as e:
+        logger.warning(f"Failed to write segment manifest {manifest_path}: {e}")
+    return segments
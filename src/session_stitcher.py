@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+断流续录合并
+直播短暂断流后重新开始录制会生成新的文件, 按直播间把断开间隔不超过设定值的文件归为同一场直播,
+直播结束(超过间隔仍未恢复)后在后处理队列中用 concat demuxer 无损拼接成一个文件, 需要转码的在拼接后再转码;
+热切换产生的 _partN 文件开头与前一个文件重叠, 不参与拼接, 出现热切换的录制结束后会话随之结束;
+拼接后时间字幕按顺序合并, 只描述单个文件的关键帧索引和分段清单被删除;
+未结束的会话持久化到磁盘, 程序重启后在间隔内恢复的录制仍然归入同一场直播
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from .archive_mover import archive_mover
+from .keyframe_index import remove_keyframe_index
+from .logger import logger, script_path
+from .postprocess_queue import LOW_PRIORITY_FLAGS, PRIORITY_REMUX, low_priority_command, postprocess_queue
+from .segment_manifest import get_manifest_base, get_manifest_path, get_segment_list_path
+from .subtitle_clock import merge_subtitles
+
+SESSIONS_FILE = f'{script_path}/config/recording_sessions.json'
+STITCH_GAP = 300
+CHECK_INTERVAL = 10
+
+
+@dataclass
+class RecordingSession:
+    key: str
+    fragments: list[str] = field(default_factory=list)
+    convert: bool = False
+    active: bool = False
+    last_end: float = 0.0
+
+
+def get_stitch_temp_path(path: str) -> str:
+    base, extension = path.rsplit('.', maxsplit=1)
+    return f'{base}.stitching.{extension}'
+
+
+def concat_fragments(paths: list[str], output_path: str, startupinfo=None) -> bool:
+    list_path = f'{output_path}.concat.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        subprocess.check_output(low_priority_command([
+            "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0", "-c", "copy", output_path
+        ]), stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, startupinfo=startupinfo,
+            creationflags=LOW_PRIORITY_FLAGS)
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to stitch {len(paths)} fragments into {output_path}: {e}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    finally:
+        os.remove(list_path)
+
+
+def get_subtitle_path(path: str) -> str:
+    return f"{path.rsplit('.', maxsplit=1)[0]}.srt"
+
+
+def _remove_files(paths: list[str]) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove {path}: {e}")
+
+
+def _merge_fragment_subtitles(paths: list[str], output_path: str) -> bool:
+    # 所有分片都有时间字幕时才合并, 否则合并结果与拼接后的时间轴对不上
+    subtitle_paths = [get_subtitle_path(path) for path in paths]
+    if not all(os.path.exists(path) for path in subtitle_paths):
+        return False
+    try:
+        merge_subtitles(subtitle_paths, output_path)
+        return True
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Failed to merge subtitles into {output_path}: {e}")
+        return False
+
+
+def stitch_fragments(paths: list[str], is_original_delete: bool = True, startupinfo=None) -> list[str]:
+    """
+    拼接成功后输出沿用第一个文件的文件名, 返回拼接后仍然存在的文件
+    """
+    paths = [path for path in paths if os.path.exists(path) and os.path.getsize(path) > 0]
+    if len(paths) < 2:
+        return paths
+    output_path = get_stitch_temp_path(paths[0])
+    if not concat_fragments(paths, output_path, startupinfo):
+        return paths
+    if not is_original_delete:
+        final_path = f"{get_manifest_base(paths[0])}_merged.{paths[0].rsplit('.', maxsplit=1)[1]}"
+        os.replace(output_path, final_path)
+        _merge_fragment_subtitles(paths, get_subtitle_path(final_path))
+        return [final_path]
+    subtitle_temp_path = f'{get_subtitle_path(output_path)}.tmp'
+    has_subtitles = _merge_fragment_subtitles(paths, subtitle_temp_path)
+    for path in paths:
+        os.remove(path)
+        remove_keyframe_index(path)
+        _remove_files([get_subtitle_path(path), get_manifest_path(path), get_segment_list_path(path)])
+    os.replace(output_path, paths[0])
+    if has_subtitles:
+        os.replace(subtitle_temp_path, get_subtitle_path(paths[0]))
+    logger.info(f"Stitched {len(paths)} fragments into {paths[0]}")
+    return [paths[0]]
+
+
+class SessionStitcher:
+    def __init__(self, sessions_file: str = SESSIONS_FILE):
+        self.sessions_file = sessions_file
+        self.gap = 0
+        self.lock = threading.Lock()
+        self.sessions: dict[str, RecordingSession] = {}
+        self.thread: threading.Thread | None = None
+        self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.gap > 0
+
+    def configure(self, gap: float = STITCH_GAP) -> None:
+        self.gap = gap
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name='session-stitcher', daemon=True)
+            self.thread.start()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.sessions_file):
+            return
+        try:
+            with open(self.sessions_file, 'r', encoding='utf-8') as f:
+                sessions = [RecordingSession(**item) for item in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Failed to load recording sessions: {e}")
+            return
+        # 退出时正在进行的录制以退出时间(最后一次保存)作为结束时间
+        for session in sessions:
+            for path in session.fragments:
+                archive_mover.hold(get_manifest_base(path))
+            if session.active:
+                session.active = False
+                session.last_end = os.path.getmtime(self.sessions_file)
+            self.sessions[session.key] = session
+        if sessions:
+            logger.info(f"Resume {len(sessions)} unfinished recording sessions")
+
+    def _save(self) -> None:
+        # 调用方持有锁
+        try:
+            os.makedirs(os.path.dirname(self.sessions_file), exist_ok=True)
+            tmp_path = self.sessions_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([asdict(session) for session in self.sessions.values()], f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.sessions_file)
+        except OSError as e:
+            logger.warning(f"Failed to save recording sessions: {e}")
+
+    def _get_session(self, key: str) -> RecordingSession:
+        # 调用方持有锁; 超过间隔的旧会话可能还没被后台线程结束, 先结束再开始新的会话
+        session = self.sessions.get(key)
+        if session and not session.active and time.time() - session.last_end >= self.gap:
+            self._close(session)
+            session = None
+        if session is None:
+            session = self.sessions[key] = RecordingSession(key)
+        return session
+
+    def fragment_paths(self) -> set[str]:
+        with self.lock:
+            return {os.path.normpath(path) for session in self.sessions.values() for path in session.fragments}
+
+    def begin(self, key: str | None) -> None:
+        if not key or not self.enabled:
+            return
+        with self.lock:
+            self._get_session(key).active = True
+            self._save()
+
+    def add(self, key: str | None, paths: list[str], convert: bool = False, end_session: bool = False) -> bool:
+        """
+        返回 False 时未启用合并, 由调用方直接处理这些文件; end_session 为 True 时加入后立即结束会话
+        """
+        if not key or not self.enabled:
+            return False
+        with self.lock:
+            session = self._get_session(key)
+            for path in paths:
+                if path not in session.fragments:
+                    session.fragments.append(path)
+                    archive_mover.hold(get_manifest_base(path))
+            session.convert = session.convert or convert
+            session.active = False
+            session.last_end = time.time()
+            if end_session:
+                self._close(session)
+            else:
+                self._save()
+        return True
+
+    def end(self, key: str | None) -> None:
+        # 本轮录制没有产生文件(如启动失败)时也要结束活动状态, 否则会话永远不会合并
+        if not key:
+            return
+        with self.lock:
+            session = self.sessions.get(key)
+            if session and session.active:
+                session.active = False
+                session.last_end = time.time()
+
+    def _close(self, session: RecordingSession) -> None:
+        # 调用方持有锁; 任务参数中的文件由后处理队列保护, 不再需要暂缓归档
+        self.sessions.pop(session.key, None)
+        if session.fragments:
+            postprocess_queue.submit('stitch_session', session.fragments, session.convert, priority=PRIORITY_REMUX)
+        for path in session.fragments:
+            archive_mover.release(get_manifest_base(path))
+        self._save()
+
+    def _run(self) -> None:
+        while True:
+            now = time.time()
+            with self.lock:
+                for session in list(self.sessions.values()):
+                    if not session.active and now - session.last_end >= self.gap:
+                        self._close(session)
+            time.sleep(CHECK_INTERVAL)
+
+
+session_stitcher = SessionStitcher()
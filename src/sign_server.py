@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+"""
+本地签名服务
+同一台机器上的多个录制进程通过 Unix socket 共用一份常驻的 JS 签名运行时,
+协议为按行分隔的 JSON: {"id": 1, "script": "x-bogus", "func": "sign", "args": [...]}
+返回 {"id": 1, "result": ..., "error": null}
+
+启动方式: python -m src.sign_server --socket /tmp/dlr_sign.sock
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from . import JS_SCRIPT_PATH
+from .logger import logger
+
+DANMU_JS_PATH = Path(__file__).resolve().parent / 'danmu' / 'douyin' / 'js'
+NODE_WORKER_PATH = JS_SCRIPT_PATH / 'sign_worker.js'
+
+# engine: node 为常驻 node 进程(脚本只加载一次), v8 为进程内 MiniRacer,
+# cli 为 node 命令行脚本(依赖命令行参数, 每次调用仍启动一个 node 进程)
+SIGN_SCRIPTS = {
+    'x-bogus': ('node', JS_SCRIPT_PATH / 'x-bogus.js'),
+    'liveme': ('node', JS_SCRIPT_PATH / 'liveme.js'),
+    'haixiu': ('node', JS_SCRIPT_PATH / 'haixiu.js'),
+    'taobao-sign': ('node', JS_SCRIPT_PATH / 'taobao-sign.js'),
+    'migu': ('cli', JS_SCRIPT_PATH / 'migu.js'),
+    'a_bogus': ('node', DANMU_JS_PATH / 'a_bogus.js'),
+    'sign': ('v8', DANMU_JS_PATH / 'sign.js'),
+}
+
+MAX_BATCH_SIZE = 32
+CONNECT_TIMEOUT = 3
+CALL_TIMEOUT = 30
+START_TIMEOUT = 6
+START_RETRY_INTERVAL = 60
+MAX_START_RETRY_INTERVAL = 1800
+
+_socket_path: str | None = None
+_server_path: str | None = None
+_server_process: subprocess.Popen | None = None
+_start_failures = 0
+_next_start_time = 0.0
+_local_contexts: dict[str, Any] = {}
+_local_lock = threading.Lock()
+
+
+class SignError(Exception):
+    pass
+
+
+def unix_socket_supported() -> bool:
+    return hasattr(socket, 'AF_UNIX') and os.name != 'nt'
+
+
+class NodeWorker:
+    """
+    常驻的 node 进程, 签名脚本只加载一次, 之后每次调用只是一次管道往返
+    """
+
+    def __init__(self, script_path: Path):
+        self.script_path = script_path
+        self.process: subprocess.Popen | None = None
+        self.lock = threading.Lock()
+
+    def _start(self) -> None:
+        self.process = subprocess.Popen(
+            ['node', str(NODE_WORKER_PATH), str(self.script_path)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding='utf-8'
+        )
+
+    def close(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+        self.process = None
+
+    def call(self, func: str, *args) -> Any:
+        request = json.dumps({"func": func, "args": list(args)}, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            try:
+                self.process.stdin.write(request)
+                self.process.stdin.flush()
+                line = self.process.stdout.readline()
+            except OSError as e:
+                self.close()
+                raise SignError(f"Node sign worker failed: {e}") from e
+            if not line:
+                self.close()
+                raise SignError(f"Node sign worker exited: {self.script_path.name}")
+        response = json.loads(line)
+        if response.get('error'):
+            raise SignError(response['error'])
+        return response.get('result')
+
+
+def _compile_context(script: str) -> Any:
+    if script not in SIGN_SCRIPTS:
+        raise SignError(f"Unknown sign script: {script}")
+    engine, script_path = SIGN_SCRIPTS[script]
+    if engine == 'cli':
+        return None
+    if engine == 'node':
+        return NodeWorker(script_path)
+    with open(script_path, 'r', encoding='utf-8') as f:
+        js_code = f.read()
+    from py_mini_racer import MiniRacer
+    ctx = MiniRacer()
+    ctx.eval(js_code)
+    return ctx
+
+
+def _call_context(script: str, ctx: Any, func: str, args: list) -> Any:
+    engine, script_path = SIGN_SCRIPTS[script]
+    if engine == 'cli':
+        result = subprocess.run(
+            ["node", str(script_path), *[str(i) for i in args]], capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+    return ctx.call(func, *args)
+
+
+def local_call(script: str, func: str, *args) -> Any:
+    with _local_lock:
+        ctx = _local_contexts.get(script)
+        if ctx is None:
+            ctx = _compile_context(script)
+            _local_contexts[script] = ctx
+    if SIGN_SCRIPTS[script][0] == 'v8':
+        # MiniRacer 上下文不是线程安全的
+        with _local_lock:
+            return _call_context(script, ctx, func, list(args))
+    return _call_context(script, ctx, func, list(args))
+
+
+def set_socket_path(path: str | None) -> None:
+    global _socket_path
+    if path and not unix_socket_supported():
+        logger.warning("Unix socket is not supported on this platform, sign server disabled")
+        path = None
+    _socket_path = path or None
+
+
+def _remote_call(script: str, func: str, args: tuple) -> Any:
+    request = {"id": 0, "script": script, "func": func, "args": list(args)}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(_socket_path)
+        sock.settimeout(CALL_TIMEOUT)
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("Sign server closed the connection")
+    response = json.loads(line)
+    if response.get('error'):
+        raise SignError(response['error'])
+    return response.get('result')
+
+
+def js_call(script: str, func: str, *args) -> Any:
+    if _socket_path and os.path.exists(_socket_path):
+        try:
+            return _remote_call(script, func, args)
+        except SignError:
+            raise
+        except (OSError, ValueError) as e:
+            logger.warning(f"Sign server unavailable, fallback to local runtime: {e}")
+    return local_call(script, func, *args)
+
+
+def is_server_alive(path: str) -> bool:
+    if not unix_socket_supported() or not os.path.exists(path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def _start_failed(path: str) -> bool:
+    global _server_process, _start_failures, _next_start_time
+    if _server_process and _server_process.poll() is None:
+        _server_process.kill()
+    _server_process = None
+    _start_failures += 1
+    delay = min(START_RETRY_INTERVAL * 2 ** (_start_failures - 1), MAX_START_RETRY_INTERVAL)
+    _next_start_time = time.monotonic() + delay
+    logger.warning(f"Failed to start sign server: {path}, retry in {delay}s")
+    return False
+
+
+def ensure_server(path: str, workers: int = 4) -> bool:
+    """
+    配置循环每轮都会调用: 服务已在运行时只做一次连接检测, 启动失败后按指数退避重试,
+    退避期间直接返回, 不会每轮都阻塞等待或重复启动服务进程
+    """
+    global _server_path, _server_process, _start_failures, _next_start_time
+    if not unix_socket_supported():
+        return False
+    if path != _server_path:
+        _server_path, _server_process, _start_failures, _next_start_time = path, None, 0, 0.0
+    if time.monotonic() < _next_start_time:
+        return False
+    if is_server_alive(path):
+        _start_failures = 0
+        return True
+    project_dir = Path(__file__).resolve().parent.parent
+    _server_process = subprocess.Popen(
+        [sys.executable, '-m', 'src.sign_server', '--socket', path, '--workers', str(workers)],
+        cwd=project_dir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline and _server_process.poll() is None:
+        time.sleep(0.2)
+        if is_server_alive(path):
+            logger.debug(f"Sign server started: {path}")
+            _start_failures = 0
+            return True
+    return _start_failed(path)
+
+
+class SignServer:
+    def __init__(self, socket_path: str, workers: int = 4):
+        self.socket_path = socket_path
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sign')
+        self.queues: dict[str, asyncio.Queue] = {}
+        # 每个脚本一个上下文池, 池内上下文数量不超过 workers
+        self.pools: dict[str, list] = {}
+
+    def _acquire_context(self, script: str) -> Any:
+        pool = self.pools.setdefault(script, [])
+        try:
+            return pool.pop()
+        except IndexError:
+            return _compile_context(script)
+
+    def _run_batch(self, script: str, batch: list) -> list:
+        ctx = self._acquire_context(script)
+        results = []
+        try:
+            for func, args in batch:
+                try:
+                    results.append((_call_context(script, ctx, func, args), None))
+                except Exception as e:
+                    results.append((None, f"{type(e).__name__}: {e}"))
+        finally:
+            self.pools[script].append(ctx)
+        return results
+
+    async def _batch_worker(self, script: str, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await queue.get()]
+            while len(items) < MAX_BATCH_SIZE and not queue.empty():
+                items.append(queue.get_nowait())
+            batch = [(func, args) for func, args, _ in items]
+            try:
+                results = await loop.run_in_executor(self.executor, self._run_batch, script, batch)
+            except Exception as e:
+                results = [(None, f"{type(e).__name__}: {e}")] * len(items)
+            for (_, _, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _get_queue(self, script: str) -> asyncio.Queue:
+        if script not in self.queues:
+            queue = asyncio.Queue()
+            self.queues[script] = queue
+            for _ in range(self.workers):
+                asyncio.create_task(self._batch_worker(script, queue))
+        return self.queues[script]
+
+    async def _handle_request(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            script = request['script']
+            if script not in SIGN_SCRIPTS:
+                raise SignError(f"Unknown sign script: {script}")
+            future = asyncio.get_running_loop().create_future()
+            await self._get_queue(script).put((request.get('func', 'sign'), request.get('args', []), future))
+            result, error = await future
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        response = {"id": request_id, "result": result, "error": error}
+        async with write_lock:
+            writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._handle_request(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            if is_server_alive(self.socket_path):
+                raise SignError(f"Sign server is already running: {self.socket_path}")
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        logger.debug(f"Sign server listening on {self.socket_path}")
+        async with server:
+            await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='DouyinLiveRecorder sign server')
+    parser.add_argument('--socket', required=True, help='unix socket path')
+    parser.add_argument('--workers', type=int, default=4, help='runtime pool size per script')
+    args = parser.parse_args()
+    if not unix_socket_supported():
+        sys.exit("Unix socket is not supported on this platform")
+    try:
+        asyncio.run(SignServer(args.socket, args.workers).serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket) and not is_server_alive(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,7 +11,6 @@ Function: Get live stream data.
 
 import hashlib
 import random
-import subprocess
 import time
 import uuid
 from operator import itemgetter
@@ -30,6 +29,8 @@ from .logger import script_path, logger
 from .room import get_sec_user_id, get_unique_id, UnsupportedUrlError
 from .http_clients.async_http import async_req
 from .ab_sign import ab_sign
+from .sign_server import js_call
+from .m3u8_parser import get_variants
 
 
 ssl_context = ssl.create_default_context()
@@ -49,20 +50,9 @@ def get_params(url: str, params: str) -> OptionalStr:
 
 async def get_play_url_list(m3u8: str, proxy: OptionalStr = None, header: OptionalDict = None,
                             abroad: bool = False) -> List[str]:
-    resp = await async_req(url=m3u8, proxy_addr=proxy, headers=header, abroad=abroad)
-    play_url_list = []
-    for i in resp.split('\n'):
-        if i.startswith('https://'):
-            play_url_list.append(i.strip())
-    if not play_url_list:
-        for i in resp.split('\n'):
-            if i.strip().endswith('m3u8'):
-                play_url_list.append(i.strip())
-    bandwidth_pattern = re.compile(r'BANDWIDTH=(\d+)')
-    bandwidth_list = bandwidth_pattern.findall(resp)
-    url_to_bandwidth = {url: int(bandwidth) for bandwidth, url in zip(bandwidth_list, play_url_list)}
-    play_url_list = sorted(play_url_list, key=lambda url: url_to_bandwidth[url], reverse=True)
-    return play_url_list
+    variants = await get_variants(m3u8, proxy=proxy, header=header, abroad=abroad)
+    video_variants = [variant for variant in variants if not variant.audio_only] or variants
+    return [variant.uri for variant in video_variants]
 
 
 async def get_douyin_web_stream_data(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None):
@@ -1098,17 +1088,7 @@ async def _fetch_web_stream_data_global(url: str, proxy_addr: OptionalStr = None
             }
             if cookies:
                 headers['cookie'] = cookies
-            resp = await async_req(url=m3u8, proxy_addr=proxy_addr, headers=headers)
-            play_url_list = []
-            url_prefix = '/'.join(m3u8.split('/')[0:3])
-            for i in resp.split('\n'):
-                if not i.startswith('#') and i.strip():
-                    play_url_list.append(url_prefix + i.strip())
-            bandwidth_pattern = re.compile(r'BANDWIDTH=(\d+)')
-            bandwidth_list = bandwidth_pattern.findall(resp)
-            url_to_bandwidth = {purl: int(bandwidth) for bandwidth, purl in zip(bandwidth_list, play_url_list)}
-            play_url_list = sorted(play_url_list, key=lambda purl: url_to_bandwidth[purl], reverse=True)
-            return play_url_list
+            return await get_play_url_list(m3u8, proxy=proxy_addr, header=headers)
 
         m3u8_url = 'https://global-media.sooplive.com/live/' + str(bj_id) + '/master.m3u8'
         result |= {
@@ -1164,17 +1144,7 @@ async def get_sooplive_stream_data(
     result = {"anchor_name": anchor_name or '' ,"is_live": False}
 
     async def get_url_list(m3u8: str) -> List[str]:
-        resp = await async_req(url=m3u8, proxy_addr=proxy_addr, headers=headers, abroad=True)
-        play_url_list = []
-        url_prefix = m3u8.rsplit('/', maxsplit=1)[0] + '/'
-        for i in resp.split('\n'):
-            if i.startswith('auth_playlist'):
-                play_url_list.append(url_prefix + i.strip())
-        bandwidth_pattern = re.compile(r'BANDWIDTH=(\d+)')
-        bandwidth_list = bandwidth_pattern.findall(resp)
-        url_to_bandwidth = {purl: int(bandwidth) for bandwidth, purl in zip(bandwidth_list, play_url_list)}
-        play_url_list = sorted(play_url_list, key=lambda purl: url_to_bandwidth[purl], reverse=True)
-        return play_url_list
+        return await get_play_url_list(m3u8, proxy=proxy_addr, header=headers, abroad=True)
 
     if not anchor_name:
         async def handle_login() -> OptionalStr:
@@ -2268,8 +2238,7 @@ async def get_liveme_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
             url = match_url.group(1)
 
     room_id = url.split("/index.html")[0].rsplit('/', maxsplit=1)[-1]
-    sign_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/liveme.js').read()).call('sign', room_id,
-                                                                                f'{JS_SCRIPT_PATH}/crypto-js.min.js')
+    sign_data = js_call('liveme', 'sign', room_id, f'{JS_SCRIPT_PATH}/crypto-js.min.js')
     lm_s_sign = sign_data.pop("lm_s_sign")
     tongdun_black_box = sign_data.pop("tongdun_black_box")
     platform = sign_data.pop("os")
@@ -2510,8 +2479,7 @@ async def get_showroom_stream_data(url: str, proxy_addr: OptionalStr = None, coo
                     if m3u8_url:
                         m3u8_url_list = await get_play_url_list(m3u8_url, proxy=proxy_addr, header=headers, abroad=True)
                         if m3u8_url_list:
-                            result['play_url_list'] = [f"{m3u8_url.rsplit('/', maxsplit=1)[0]}/{i}" for i in
-                                                       m3u8_url_list]
+                            result['play_url_list'] = m3u8_url_list
                         else:
                             result['play_url_list'] = [m3u8_url]
                         result['play_url_list'] = [i.replace('https://', 'http://') for i in result['play_url_list']]
@@ -2763,8 +2731,6 @@ async def get_chzzk_stream_data(url: str, proxy_addr: OptionalStr = None, cookie
         play_data = json.loads(live_data['livePlaybackJson'])
         m3u8_url = play_data['media'][0]['path']
         m3u8_url_list = await get_play_url_list(m3u8_url, proxy=proxy_addr, header=headers, abroad=True)
-        prefix = m3u8_url.split('?')[0].rsplit('/', maxsplit=1)[0]
-        m3u8_url_list = [prefix + '/' + i for i in m3u8_url_list]
         result |= {"is_live": True, "m3u8_url": m3u8_url, "play_url_list": m3u8_url_list}
     return result
 
@@ -2791,8 +2757,7 @@ async def get_haixiu_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         "c": "10138100100000",
         "_st1": int(time.time() * 1000)
     }
-    ajax_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/haixiu.js').read()).call('sign', params,
-                                                                                f'{JS_SCRIPT_PATH}/crypto-js.min.js')
+    ajax_data = js_call('haixiu', 'sign', params, f'{JS_SCRIPT_PATH}/crypto-js.min.js')
 
     params["accessToken"] = urllib.parse.unquote(urllib.parse.unquote(access_token))
     params['_ajaxData1'] = ajax_data
@@ -3112,7 +3077,7 @@ async def get_taobao_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         _m_h5_tk = re.findall('_m_h5_tk=(.*?);', headers['Cookie'])[0]
         t13 = int(time.time() * 1000)
         pre_sign_str = f'{_m_h5_tk.split("_")[0]}&{t13}&{app_key}&' + params['data']
-        sign = execjs.compile(open(f'{JS_SCRIPT_PATH}/taobao-sign.js').read()).call('sign', pre_sign_str)
+        sign = js_call('taobao-sign', 'sign', pre_sign_str)
         params |= {'sign': sign, 't': t13}
         api = f'https://h5api.m.taobao.com/h5/mtop.mediaplatform.live.livedetail/4.0/?{urllib.parse.urlencode(params)}'
         jsonp_str, new_cookie = await async_req(url=api, proxy_addr=proxy_addr, headers=headers, timeout=20,
@@ -3296,13 +3261,7 @@ async def get_migu_stream_url(url: str, proxy_addr: OptionalStr = None, cookies:
 
         async def _get_dd_calcu(url):
             try:
-                result = subprocess.run(
-                    ["node", f"{JS_SCRIPT_PATH}/migu.js", url],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                return result.stdout.strip()
+                return js_call('migu', 'main', url)
             except execjs.ProgramError:
                 raise execjs.ProgramError('Failed to execute JS code. Please check if the Node.js environment')
 
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+录制卡顿看门狗
+用一个定时器统一采样所有正在录制的输出文件大小, 计算最近一段时间的写入速率,
+速率持续低于预期码率(流元数据中的码率, 没有时用该录制自身的历史水平)一定比例时触发重启/切换, 并按房间记录卡顿次数和时长;
+两者都还没有时使用保守的下限, 一开始就很慢的连接不会被当作正常水平
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable
+from .logger import logger, script_path
+
+STALL_STATS_FILE = f'{script_path}/config/stall_stats.json'
+SAMPLE_INTERVAL = 5
+STALL_WINDOW = 30
+# 录制开始后的探测/缓冲阶段不参与判定
+STARTUP_GRACE = 60
+MIN_RATE_RATIO = 0.2
+# 阈值下限(字节/秒), 低于 32kbps 的写入速率无论如何都视为卡顿
+MIN_RATE_FLOOR = 32000 / 8
+BASELINE_ALPHA = 0.1
+SAVE_INTERVAL = 60
+
+
+class OutputSizeProbe:
+    def __init__(self, path: str):
+        self.path = path
+        self.segmented = '%03d' in path
+        self._index = 0
+        self._done_bytes = 0
+
+    @staticmethod
+    def _size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def __call__(self) -> int:
+        if not self.segmented:
+            return self._size(self.path)
+        # 已经写完的分段大小只统计一次, 每次采样只需要检查当前分段和下一个分段
+        while os.path.exists(self.path % (self._index + 1)):
+            self._done_bytes += self._size(self.path % self._index)
+            self._index += 1
+        return self._done_bytes + self._size(self.path % self._index)
+
+
+class RecordingWatch:
+    def __init__(self, name: str, size_source: Callable[[], int], on_stall: Callable[[], None],
+                 window: float = STALL_WINDOW, expected_bitrate: Callable[[], float | None] | None = None):
+        """
+        expected_bitrate 返回流元数据中的码率(比特/秒), 元数据通常在录制开始后才能拿到, 每次采样时重新读取
+        """
+        self.name = name
+        self.size_source = size_source
+        self.on_stall = on_stall
+        self.window = window
+        self.expected_bitrate = expected_bitrate
+        self.started = time.monotonic()
+        self.samples: deque[tuple[float, int]] = deque()
+        self.baseline_rate: float | None = None
+        self.rate = 0.0
+        self.low_since: float | None = None
+        self.triggered = False
+
+    @property
+    def expected_rate(self) -> float | None:
+        bitrate = self.expected_bitrate() if self.expected_bitrate else None
+        return bitrate / 8 if bitrate else None
+
+    @property
+    def threshold(self) -> float:
+        reference = self.expected_rate or self.baseline_rate
+        return max(reference * MIN_RATE_RATIO if reference else 0.0, MIN_RATE_FLOOR)
+
+    def sample(self, now: float) -> str | None:
+        # 返回 'stall' 表示新发生卡顿, 'recovered' 表示卡顿已自行恢复
+        size = self.size_source()
+        self.samples.append((now, size))
+        while len(self.samples) > 1 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+        first_time, first_size = self.samples[0]
+        if now - first_time < self.window or now - self.started < STARTUP_GRACE:
+            return None
+
+        self.rate = max(0, size - first_size) / (now - first_time)
+        if self.rate > self.threshold:
+            self.baseline_rate = (self.rate if self.baseline_rate is None
+                                  else self.baseline_rate + BASELINE_ALPHA * (self.rate - self.baseline_rate))
+            return 'recovered' if self.triggered else None
+        if self.low_since is None:
+            # 速率是按整个窗口计算的, 低速实际开始于窗口起点附近
+            self.low_since = first_time
+        if self.triggered:
+            return None
+        self.triggered = True
+        return 'stall'
+
+
+class StallWatchdog:
+    def __init__(self, interval: float = SAMPLE_INTERVAL, window: float = STALL_WINDOW,
+                 stats_file: str = STALL_STATS_FILE):
+        self.interval = interval
+        self.window = window
+        self.stats_file = stats_file
+        self.lock = threading.Lock()
+        self.watches: dict[int, RecordingWatch] = {}
+        self.stats: dict[str, dict] = {}
+        self.thread: threading.Thread | None = None
+        self.last_save = 0.0
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load stall stats: {e}")
+
+    def save(self, force: bool = False) -> None:
+        with self.lock:
+            if not force and time.time() - self.last_save < SAVE_INTERVAL:
+                return
+            self.last_save = time.time()
+            data = json.dumps(self.stats, ensure_ascii=False, indent=2)
+        try:
+            tmp_path = self.stats_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.stats_file)
+        except OSError as e:
+            logger.warning(f"Failed to save stall stats: {e}")
+
+    def register(self, name: str, size_source: Callable[[], int], on_stall: Callable[[], None],
+                 expected_bitrate: Callable[[], float | None] | None = None) -> RecordingWatch | None:
+        if self.window <= 0:
+            return None
+        watch = RecordingWatch(name, size_source, on_stall, self.window, expected_bitrate)
+        with self.lock:
+            self.watches[id(watch)] = watch
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='stall-watchdog', daemon=True)
+                self.thread.start()
+        return watch
+
+    def unregister(self, watch: RecordingWatch | None) -> None:
+        if watch is None:
+            return
+        with self.lock:
+            self.watches.pop(id(watch), None)
+        self._end_stall(watch, time.monotonic())
+
+    def total_rate(self) -> float:
+        # 所有正在录制的输出最近一个窗口的写入速率之和(字节/秒)
+        with self.lock:
+            return sum(watch.rate for watch in self.watches.values())
+
+    def get_stats(self, name: str) -> dict:
+        return self.stats.get(name, {})
+
+    def _entry(self, name: str) -> dict:
+        return self.stats.setdefault(name, {'stalls': 0, 'stall_seconds': 0.0, 'last_stall': None})
+
+    def _end_stall(self, watch: RecordingWatch, now: float) -> None:
+        if watch.low_since is None or not watch.triggered:
+            watch.low_since = None
+            return
+        with self.lock:
+            entry = self._entry(watch.name)
+            entry['stall_seconds'] = round(entry['stall_seconds'] + now - watch.low_since, 1)
+        watch.low_since = None
+        watch.triggered = False
+        self.save(force=True)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                watches = list(self.watches.values())
+            now = time.monotonic()
+            for watch in watches:
+                try:
+                    state = watch.sample(now)
+                    if state == 'stall':
+                        self._on_stall(watch, now)
+                    elif state == 'recovered':
+                        self._end_stall(watch, now)
+                    elif watch.low_since is not None and not watch.triggered:
+                        watch.low_since = None
+                except Exception as e:
+                    logger.debug(f"Stall watchdog sample failed for {watch.name}: {e}")
+            self.save()
+
+    def _on_stall(self, watch: RecordingWatch, now: float) -> None:
+        with self.lock:
+            entry = self._entry(watch.name)
+            entry['stalls'] += 1
+            entry['last_stall'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        logger.warning(f"[{watch.name}] 录制写入速率 {watch.rate * 8 / 1000:.0f}kbps 持续 "
+                       f"{now - watch.low_since:.0f}s 低于阈值 {watch.threshold * 8 / 1000:.0f}kbps, 触发重连")
+        # 回调可能需要重新解析直播地址, 放到独立线程避免阻塞其他录制的采样
+        threading.Thread(target=watch.on_stall, daemon=True).start()
+
+
+stall_watchdog = StallWatchdog()
@@ -21,9 +21,11 @@ from .utils import trace_error_decorator
 from .spider import (
     get_douyu_stream_data, get_bilibili_stream_data
 )
-from .http_clients.async_http import get_response_status
+from .http_clients.async_http import probe_urls, probe_connect_time
+from .cdn_score import cdn_scores, get_url_host
 
 QUALITY_MAPPING = {"OD": 0, "BD": 0, "UHD": 1, "HD": 2, "SD": 3, "LD": 4}
+PROBE_DEADLINE = 3
 
 
 def get_quality_index(quality) -> tuple:
@@ -37,6 +39,63 @@ def get_quality_index(quality) -> tuple:
     return quality_str, QUALITY_MAPPING.get(quality_str, 0)
 
 
+def get_url_codec(url: str | None) -> str:
+    if not url:
+        return ''
+    codec = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get('codec')
+    if codec:
+        return codec[0].lower()
+    lower_url = url.lower()
+    if 'h265' in lower_url or 'bytevc1' in lower_url or 'hevc' in lower_url:
+        return 'h265'
+    return 'h264'
+
+
+def get_candidate_source_url(candidate: dict, prefer_flv: bool = False) -> str | None:
+    """
+    与录制端选择地址的规则一致: prefer_flv 时 FLV 不是 h265 编码则录制 FLV, 否则录制 m3u8
+    """
+    flv_url = candidate.get('flv_url')
+    if prefer_flv and flv_url:
+        codec = urllib.parse.parse_qs(urllib.parse.urlparse(flv_url).query).get('codec')
+        if not (codec and codec[0] == 'h265'):
+            return flv_url
+    return candidate.get('m3u8_url') or flv_url
+
+
+async def rank_stream_candidates(candidates: list[dict], quality_index: int, proxy_addr: str | None = None,
+                                 avoid_h265: bool = False, prefer_flv: bool = False, http2: bool = False,
+                                 deadline: float = PROBE_DEADLINE) -> list[dict]:
+    """
+    并发探测全部清晰度的 m3u8/flv 地址, 按实际录制地址的可用性、与目标清晰度的距离、编码和首字节耗时排序。
+    candidates 中每项包含 quality_index、m3u8_url、flv_url, 探测结果会写回 ok、ttfb、codec 字段。
+    avoid_h265 为 True 时同等条件下优先选择 h264 (FLV 录制不支持 h265)。
+    """
+    urls = [url for c in candidates for url in (c.get('m3u8_url'), c.get('flv_url')) if url]
+    status = await probe_urls(urls, proxy_addr=proxy_addr, timeout=deadline, http2=http2)
+
+    for url, result in status.items():
+        cdn_scores.record_probe(get_url_host(url), ttfb=result['ttfb'], ok=result['ok'])
+
+    for candidate in candidates:
+        source_url = get_candidate_source_url(candidate, prefer_flv)
+        result = status.get(source_url) if source_url else None
+        candidate['ok'] = bool(result and result['ok'])
+        candidate['ttfb'] = result['ttfb'] if candidate['ok'] else None
+        candidate['codec'] = get_url_codec(source_url)
+
+    def sort_key(c: dict) -> tuple:
+        distance = c['quality_index'] - quality_index
+        # 目标清晰度不可用时优先降级而不是升级, 与原有的回退策略一致
+        distance = distance * 2 if distance >= 0 else -distance * 2 + 1
+        codec_penalty = 1 if avoid_h265 and c['codec'] == 'h265' else 0
+        ttfb = c['ttfb'] if c['ttfb'] is not None else float('inf')
+        cdn_score = cdn_scores.score(get_url_host(get_candidate_source_url(c, prefer_flv)))
+        return not c['ok'], distance, codec_penalty, round(ttfb + cdn_score, 2)
+
+    return sorted(candidates, key=sort_key)
+
+
 @trace_error_decorator
 async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr: str) -> dict:
     anchor_name = json_data.get('anchor_name')
@@ -55,18 +114,20 @@ async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr:
         m3u8_url_dict = stream_url['hls_pull_url_map']
         m3u8_url_list: list = list(m3u8_url_dict.values())
 
-        while len(flv_url_list) < 5:
-            flv_url_list.append(flv_url_list[-1])
-            m3u8_url_list.append(m3u8_url_list[-1])
-
+        candidates = []
+        for i in range(min(max(len(flv_url_list), len(m3u8_url_list)), 5)):
+            candidates.append({
+                'quality_index': i,
+                'm3u8_url': m3u8_url_list[min(i, len(m3u8_url_list) - 1)] if m3u8_url_list else None,
+                'flv_url': flv_url_list[min(i, len(flv_url_list) - 1)] if flv_url_list else None
+            })
         video_quality, quality_index = get_quality_index(video_quality)
-        m3u8_url = m3u8_url_list[quality_index]
-        flv_url = flv_url_list[quality_index]
-        ok = await get_response_status(url=m3u8_url, proxy_addr=proxy_addr)
-        if not ok:
-            index = quality_index + 1 if quality_index < 4 else quality_index - 1
-            m3u8_url = m3u8_url_list[index]
-            flv_url = flv_url_list[index]
+        quality_index = min(quality_index, len(candidates) - 1)
+        candidates = await rank_stream_candidates(candidates, quality_index, proxy_addr, avoid_h265=True,
+                                                   prefer_flv=True, http2=True)
+        best = candidates[0]
+        m3u8_url = best['m3u8_url']
+        flv_url = best['flv_url']
         result |= {
             'is_live': True,
             'title': json_data['title'],
@@ -74,6 +135,8 @@ async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr:
             'm3u8_url': m3u8_url,
             'flv_url': flv_url,
             'record_url': m3u8_url or flv_url,
+            # 按可用性排序的全部候选地址, 录制中途断流时直接换用下一个, 不需要再请求一次接口
+            'candidates': candidates,
         }
     return result
 
@@ -124,24 +187,19 @@ async def get_tiktok_stream_url(json_data: dict, video_quality: str, proxy_addr:
         flv_url_list = get_video_quality_url(stream_data, 'flv')
         m3u8_url_list = get_video_quality_url(stream_data, 'hls')
 
-        while len(flv_url_list) < 5:
-            flv_url_list.append(flv_url_list[-1])
-        while len(m3u8_url_list) < 5:
-            m3u8_url_list.append(m3u8_url_list[-1])
-        video_quality, quality_index = get_quality_index(video_quality)
-        flv_dict: dict = flv_url_list[quality_index]
-        m3u8_dict: dict = m3u8_url_list[quality_index]
+        candidates = []
+        for i in range(min(max(len(flv_url_list), len(m3u8_url_list)), 5)):
+            flv_dict: dict = flv_url_list[min(i, len(flv_url_list) - 1)] if flv_url_list else {}
+            m3u8_dict: dict = m3u8_url_list[min(i, len(m3u8_url_list) - 1)] if m3u8_url_list else {}
+            candidates.append({'quality_index': i, 'm3u8_url': m3u8_dict.get('url'), 'flv_url': flv_dict.get('url')})
 
-        check_url = m3u8_dict.get('url') or flv_dict.get('url')
-        ok = await get_response_status(url=check_url, proxy_addr=proxy_addr, http2=False)
-
-        if not ok:
-            index = quality_index + 1 if quality_index < 4 else quality_index - 1
-            flv_dict: dict = flv_url_list[index]
-            m3u8_dict: dict = m3u8_url_list[index]
-
-        flv_url = flv_dict['url']
-        m3u8_url = m3u8_dict['url']
+        video_quality, quality_index = get_quality_index(video_quality)
+        quality_index = min(quality_index, len(candidates) - 1)
+        candidates = await rank_stream_candidates(candidates, quality_index, proxy_addr, avoid_h265=True,
+                                                   prefer_flv=True, http2=False)
+        best = candidates[0]
+        flv_url = best['flv_url']
+        m3u8_url = best['m3u8_url']
         result |= {
             'is_live': True,
             'title': live_room['liveRoom']['title'],
@@ -149,6 +207,7 @@ async def get_tiktok_stream_url(json_data: dict, video_quality: str, proxy_addr:
             'm3u8_url': m3u8_url,
             'flv_url': flv_url,
             'record_url': m3u8_url or flv_url,
+            'candidates': candidates,
         }
     return result
 
@@ -225,7 +284,14 @@ async def get_huya_stream_url(json_data: dict, video_quality: str) -> dict:
     }
 
     if stream_info_list:
-        select_cdn = stream_info_list[0]
+        # 按历史建连/首字节耗时和录制失败率选择最优的CDN节点
+        cdn_list = [i for i in stream_info_list if i.get('sFlvUrl')] or stream_info_list
+        connect_times = await probe_connect_time([i.get('sFlvUrl') for i in cdn_list])
+        for cdn_info in cdn_list:
+            cdn_url = cdn_info.get('sFlvUrl')
+            connect_time = connect_times.get(cdn_url)
+            cdn_scores.record_probe(get_url_host(cdn_url), connect_time=connect_time, ok=connect_time is not None)
+        select_cdn = cdn_scores.rank(cdn_list, key=lambda x: get_url_host(x.get('sFlvUrl')))[0]
         flv_url = select_cdn.get('sFlvUrl')
         stream_name = select_cdn.get('sStreamName')
         flv_url_suffix = select_cdn.get('sFlvUrlSuffix')
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import threading
+import time
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+from .logger import logger
+
+REFRESH_MARGIN = 60
+RETRY_INTERVAL = 10
+# 有效期过短的时间戳通常只是签名时间(如虎牙 wsTime 仅比当前时间晚约 110 秒), 已建立的连接不会因此中断
+MIN_TRACKED_LIFETIME = 300
+
+# (参数名, 编码方式) 按顺序匹配, auto 表示自动识别十进制/毫秒/十六进制
+EXPIRY_PARAMS = (
+    ('expire', 'auto'),        # 抖音/TikTok
+    ('expires', 'auto'),       # B站及通用CDN
+    ('Expires', 'auto'),
+    ('x-expires', 'auto'),
+    ('deadline', 'auto'),
+    ('txTime', 'hex'),         # 腾讯云(斗鱼等)
+    ('wsABSTime', 'hex'),      # 网宿
+    ('wsTime', 'hex'),         # 虎牙
+)
+# 写在路径中的有效期, 如 YouTube 的 /expire/1700000000/
+EXPIRY_PATH_PATTERN = re.compile(r'/(?:expire|expires)/(\d{10})(?=/|$)')
+
+
+def _parse_timestamp(value: str, mode: str) -> float | None:
+    try:
+        if mode == 'hex':
+            timestamp = int(value, 16)
+        elif value.isdigit():
+            timestamp = int(value)
+            if timestamp > 10 ** 12:
+                timestamp = timestamp / 1000
+        else:
+            timestamp = int(value, 16)
+    except ValueError:
+        return None
+    if 10 ** 9 < timestamp < 4 * 10 ** 9:
+        return float(timestamp)
+    return None
+
+
+def get_url_expire_time(url: str | None) -> float | None:
+    if not url:
+        return None
+    parsed_url = urlparse(url)
+    query_params = parse_qs(parsed_url.query)
+    for name, mode in EXPIRY_PARAMS:
+        values = query_params.get(name)
+        if values:
+            expire_time = _parse_timestamp(values[0], mode)
+            if expire_time:
+                return expire_time
+    match = EXPIRY_PATH_PATTERN.search(parsed_url.path)
+    if match:
+        return _parse_timestamp(match.group(1), 'auto')
+    return None
+
+
+class StreamUrlRefresher:
+    def __init__(self, url: str, resolver: Callable[[], dict | None],
+                 source_selector: Callable[[dict], str | None] | None = None, margin: float = REFRESH_MARGIN,
+                 stream_info: dict | None = None):
+        self.url = url
+        self.resolver = resolver
+        self.source_selector = source_selector
+        # 最近一次取流的结果, 其中的 candidates 是取流时已探测排序的候选地址
+        self.stream_info = stream_info
+        self.on_ready: Callable[[dict], None] | None = None
+        self.segment_pattern = None
+        self.margin = margin
+        self.expire_time = get_url_expire_time(url)
+        self.port_info: dict | None = None
+        self.switched = False
+        self.ready = threading.Event()
+        self._cancelled = threading.Event()
+        self._segment_index = 0
+        self._boundary_synced = False
+
+    @property
+    def tracked(self) -> bool:
+        return self.expire_time is not None and self.expire_time - time.time() >= MIN_TRACKED_LIFETIME
+
+    def start(self, segment_pattern: str | None = None) -> bool:
+        if not self.tracked:
+            return False
+        if segment_pattern and '%03d' in segment_pattern:
+            try:
+                segment_pattern % 0
+                self.segment_pattern = segment_pattern
+            except (TypeError, ValueError):
+                pass
+        delay = max(0.0, self.expire_time - self.margin - time.time())
+        threading.Thread(target=self._refresh_loop, args=(delay,), daemon=True).start()
+        logger.debug(f"Stream url expires at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.expire_time))}, "
+                     f"refresh in {int(delay)}s")
+        return True
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def rearm(self, url: str) -> bool:
+        # 切换到新地址后按新地址的有效期重新计时
+        self.url = url
+        self.expire_time = get_url_expire_time(url)
+        self.port_info = None
+        self.ready.clear()
+        self._segment_index = 0
+        self._boundary_synced = False
+        return self.start(segment_pattern=self.segment_pattern)
+
+    def _select(self, port_info: dict) -> str | None:
+        if self.source_selector:
+            return self.source_selector(port_info)
+        return port_info.get('record_url')
+
+    def get_source_url(self) -> str | None:
+        if not self.port_info:
+            return None
+        return self._select(self.port_info)
+
+    def _set_ready(self, port_info: dict) -> None:
+        self.port_info = port_info
+        self.stream_info = port_info
+        self.ready.set()
+        if self.on_ready:
+            self.on_ready(port_info)
+
+    def _next_candidate(self) -> dict | None:
+        candidates = self.stream_info.get('candidates') if self.stream_info else None
+        while candidates:
+            # 候选列表在派生出的 port_info 之间共享, 已尝试过的不会再次使用
+            candidate = candidates.pop(0)
+            m3u8_url, flv_url = candidate.get('m3u8_url'), candidate.get('flv_url')
+            port_info = dict(self.stream_info, m3u8_url=m3u8_url, flv_url=flv_url, record_url=m3u8_url or flv_url,
+                             candidates=candidates)
+            url = self._select(port_info)
+            if not candidate.get('ok') or not url or url == self.url:
+                continue
+            expire_time = get_url_expire_time(url)
+            if expire_time and expire_time - time.time() < self.margin:
+                continue
+            return port_info
+        return None
+
+    def refresh_now(self) -> bool:
+        try:
+            port_info = self.resolver()
+        except Exception as e:
+            logger.warning(f"Failed to refresh stream url: {e}")
+            return False
+        if not port_info or not port_info.get('is_live'):
+            return False
+        self._set_ready(port_info)
+        return True
+
+    def failover_now(self) -> bool:
+        # 当前地址断流时先换用取流时已探测可用的下一个候选地址, 没有可用的候选才重新请求接口
+        port_info = self._next_candidate()
+        if not port_info:
+            return self.refresh_now()
+        logger.debug("Fail over to the next probed stream candidate")
+        self._set_ready(port_info)
+        return True
+
+    def _refresh_loop(self, delay: float) -> None:
+        if self._cancelled.wait(delay):
+            return
+        while not self._cancelled.is_set() and time.time() < self.expire_time:
+            if self.refresh_now():
+                return
+            if self._cancelled.wait(RETRY_INTERVAL):
+                return
+
+    def _segment_boundary_reached(self) -> bool:
+        reached = False
+        while os.path.exists(self.segment_pattern % (self._segment_index + 1)):
+            self._segment_index += 1
+            reached = True
+        return reached
+
+    def should_switch(self) -> bool:
+        if not self.ready.is_set():
+            return False
+        if not self.segment_pattern:
+            return True
+        if not self._boundary_synced:
+            # 新地址就绪时先记下当前分段序号, 在下一个分段开始时再切换
+            self._segment_boundary_reached()
+            self._boundary_synced = True
+            return False
+        return self._segment_boundary_reached() or time.time() >= self.expire_time - self.margin / 2
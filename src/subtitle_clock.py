@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+录制时间字幕
+所有录制共用一个每秒触发的定时器, 字幕文件在录制期间保持打开并缓冲写入, 每条字幕的时间由录制开始时间计算,
+定时器延迟时会补齐漏掉的条目; 分段录制在结束后按分段清单中每段的起止时间直接生成对应的字幕文件
+"""
+
+import datetime
+import threading
+import time
+from .logger import logger
+
+TICK_INTERVAL = 1
+FLUSH_INTERVAL = 10
+
+
+def format_srt_time(seconds: int) -> str:
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d},000"
+
+
+def format_text_cue(index: int, text: str) -> str:
+    return f"{index + 1}\n{format_srt_time(index)} --> {format_srt_time(index + 1)}\n{text}\n\n"
+
+
+def format_cue(index: int, wall_time: float) -> str:
+    return format_text_cue(index, datetime.datetime.fromtimestamp(wall_time).strftime('%Y-%m-%d %H:%M:%S'))
+
+
+class SubtitleTrack:
+    def __init__(self, path: str, started: float, encoding: str):
+        self.path = path
+        self.started = started
+        self.index = 0
+        self._file = open(path, 'a', encoding=encoding)
+
+    def write_until(self, now: float) -> None:
+        while self.started + self.index <= now:
+            self._file.write(format_cue(self.index, self.started + self.index))
+            self.index += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SubtitleClock:
+    def __init__(self, interval: float = TICK_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.tracks: dict[int, SubtitleTrack] = {}
+        self.thread: threading.Thread | None = None
+
+    def start(self, path: str, started: float | None = None, encoding: str = 'utf-8-sig') -> SubtitleTrack | None:
+        try:
+            track = SubtitleTrack(path, started or time.time(), encoding)
+        except OSError as e:
+            logger.warning(f"Failed to open subtitle file {path}: {e}")
+            return None
+        with self.lock:
+            self.tracks[id(track)] = track
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='subtitle-clock', daemon=True)
+                self.thread.start()
+        return track
+
+    def stop(self, track: SubtitleTrack | None) -> None:
+        if track is None:
+            return
+        with self.lock:
+            self.tracks.pop(id(track), None)
+            try:
+                track.write_until(time.time())
+                track.close()
+            except OSError as e:
+                logger.warning(f"Failed to write subtitle file {track.path}: {e}")
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            flush = time.monotonic() - last_flush >= FLUSH_INTERVAL
+            with self.lock:
+                for track in list(self.tracks.values()):
+                    try:
+                        track.write_until(now)
+                        if flush:
+                            track.flush()
+                    except OSError as e:
+                        logger.warning(f"Failed to write subtitle file {track.path}: {e}")
+                        self.tracks.pop(id(track), None)
+            if flush:
+                last_flush = time.monotonic()
+
+
+def write_segment_subtitles(segments: list, started: float, encoding: str = 'utf-8-sig') -> None:
+    """
+    segments 为分段清单(需要 path/start/end), started 为录制开始时的时间戳
+    """
+    timed = [segment for segment in segments if segment.start is not None and segment.end is not None]
+    if not timed:
+        return
+    # 分段清单中的时间是流时间戳, 以第一段的起点作为录制开始
+    base = timed[0].start
+    for segment in timed:
+        path = f"{segment.path.rsplit('.', maxsplit=1)[0]}.srt"
+        cues = int(segment.end - segment.start + 0.999)
+        offset = started + segment.start - base
+        try:
+            with open(path, 'w', encoding=encoding) as f:
+                f.write(''.join(format_cue(index, offset + index) for index in range(cues)))
+        except OSError as e:
+            logger.warning(f"Failed to write subtitle file {path}: {e}")
+
+
+def merge_subtitles(paths: list[str], output_path: str, encoding: str = 'utf-8-sig') -> None:
+    """
+    按顺序合并多个文件的时间字幕, 每条字幕占 1 秒, 重新编号后与拼接后的时间轴对齐
+    """
+    texts = []
+    for path in paths:
+        with open(path, 'r', encoding=encoding) as f:
+            for block in f.read().split('\n\n'):
+                lines = block.strip().splitlines()
+                if len(lines) >= 3:
+                    texts.append(lines[2])
+    with open(output_path, 'w', encoding=encoding) as f:
+        f.write(''.join(format_text_cue(index, text) for index, text in enumerate(texts)))
+
+
+subtitle_clock = SubtitleClock()